@@ -1,30 +1,201 @@
 from fastapi import FastAPI
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
 import torch
 
 ai = FastAPI()
 
 pipe = None
 
+# Micro-batching / cache / quantisation knobs
+BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "25"))
+MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", "8"))
+CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "512"))
+QUANTIZE = os.getenv("AI_QUANTIZE", "").strip().lower()  # "int8" enables dynamic quantisation
+
+DEFAULT_GEN_PARAMS = {
+    "max_new_tokens": 120,
+    "do_sample": True,
+    "temperature": 0.7,
+    "top_p": 0.9,
+}
+
+request_queue = queue.Queue()
+
+# ---------------- Response cache ----------------
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+cache = LRUCache(CACHE_SIZE)
+
+# ---------------- Metrics ----------------
+
+class Metrics:
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.batch_sizes = deque(maxlen=window)
+        self.batches = 0
+        self.requests = 0
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.recent = deque(maxlen=window)  # (tokens, seconds) per batch
+
+    def record_batch(self, size, tokens, seconds):
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.batch_sizes.append(size)
+            self.generated_tokens += tokens
+            self.generation_seconds += seconds
+            self.recent.append((tokens, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            sizes = list(self.batch_sizes)
+            recent_tokens = sum(t for t, _ in self.recent)
+            recent_seconds = sum(s for _, s in self.recent)
+            return {
+                "queue_depth": request_queue.qsize(),
+                "batches": self.batches,
+                "requests_generated": self.requests,
+                "batch_size_last": sizes[-1] if sizes else 0,
+                "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+                "batch_size_max": max(sizes) if sizes else 0,
+                "generated_tokens": self.generated_tokens,
+                "tokens_per_sec": round(self.generated_tokens / self.generation_seconds, 2) if self.generation_seconds else 0.0,
+                "tokens_per_sec_recent": round(recent_tokens / recent_seconds, 2) if recent_seconds else 0.0,
+                "cache_size": len(cache),
+                "cache_hits": cache.hits,
+                "cache_misses": cache.misses,
+                "quantized": QUANTIZE == "int8",
+            }
+
+metrics = Metrics()
+
+# ---------------- Batch worker ----------------
+
+def _collect_batch():
+    """Block for the first request, then gather more until the window closes or the batch is full."""
+    first = request_queue.get()
+    batch = [first]
+    deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+    while len(batch) < MAX_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(request_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def _run_generation(prompts, params):
+    start = time.perf_counter()
+    outs = pipe(prompts, batch_size=len(prompts), **params)
+    elapsed = time.perf_counter() - start
+
+    texts = []
+    tokens = 0
+    for prompt, out in zip(prompts, outs):
+        generated = out[0]["generated_text"] if isinstance(out, list) else out["generated_text"]
+        completion = generated[len(prompt):] if generated.startswith(prompt) else generated
+        tokens += len(pipe.tokenizer.encode(completion, add_special_tokens=False))
+        texts.append(generated.split("<|assistant|>")[-1].strip())
+
+    metrics.record_batch(len(prompts), tokens, elapsed)
+    return texts
+
+def batch_worker():
+    while True:
+        batch = _collect_batch()
+
+        # Requests with different generation params cannot share a generate call
+        groups = {}
+        for prompt, params_key, fut in batch:
+            groups.setdefault(params_key, []).append((prompt, fut))
+
+        for params_key, items in groups.items():
+            # Identical prompts in the same window are generated once
+            unique_prompts = list(dict.fromkeys(p for p, _ in items))
+            try:
+                texts = _run_generation(unique_prompts, dict(params_key))
+                by_prompt = dict(zip(unique_prompts, texts))
+                for prompt, fut in items:
+                    cache.put((prompt, params_key), by_prompt[prompt])
+                    fut.set_result(by_prompt[prompt])
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+# ---------------- App ----------------
+
 @ai.on_event("startup")
 def load_model():
     global pipe
 
     model_id = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # Left padding so batched prompts end where generation starts
+    tokenizer = AutoTokenizer.from_pretrained(model_id, padding_side="left")
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
     model = AutoModelForCausalLM.from_pretrained(
         model_id,
         torch_dtype=torch.float32,
         low_cpu_mem_usage=True
     )
 
+    if QUANTIZE == "int8":
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        print("⚙️ Using int8 dynamic-quantised model")
+
+    model.eval()
+
     pipe = pipeline(
         "text-generation",
         model=model,
         tokenizer=tokenizer
     )
 
+    threading.Thread(target=batch_worker, daemon=True).start()
+
 @ai.get("/")
 def health():
     return {"status": "tinyllama-ready"}
@@ -33,15 +204,18 @@ def health():
 def chat(q: str):
 
     prompt = f"<|user|>\n{q}\n<|assistant|>\n"
+    params_key = tuple(sorted(DEFAULT_GEN_PARAMS.items()))
 
-    out = pipe(
-        prompt,
-        max_new_tokens=120,
-        do_sample=True,
-        temperature=0.7,
-        top_p=0.9
-    )
+    cached = cache.get((prompt, params_key))
+    if cached is not None:
+        return {"response": cached, "cached": True}
+
+    fut = Future()
+    request_queue.put((prompt, params_key, fut))
+    text = fut.result()
 
-    text = out[0]["generated_text"].split("<|assistant|>")[-1]
+    return {"response": text, "cached": False}
 
-    return {"response": text.strip()}
\ No newline at end of file
+@ai.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
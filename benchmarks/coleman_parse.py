@@ -0,0 +1,227 @@
+"""
+Benchmark ProductFetcher product-page parsing on saved pages.
+
+Save some product pages first (plain GETs, nothing is parsed):
+
+    python benchmarks/coleman_parse.py --pages fixtures/coleman --save https://www.colemanfurniture.com/... ...
+
+record the items the old parser produces for them, running this script from a checkout of
+the old code (it only needs fetcher.product_fetcher there):
+
+    git worktree add /tmp/old <old-rev> && mkdir -p /tmp/old/benchmarks
+    cp benchmarks/coleman_parse.py /tmp/old/benchmarks/
+    python /tmp/old/benchmarks/coleman_parse.py --pages fixtures/coleman --record-expected
+
+then replay them offline:
+
+    python benchmarks/coleman_parse.py --pages fixtures/coleman --rounds 50
+
+Each page is parsed with parse_product_page in three ways:
+
+shared   - the embedded JSON is decoded once per response and shared by all extractors (what the spider does).
+uncached - every extractor decodes the page again, which is roughly the old
+           one-json.loads-per-field cost.
+stdlib   - like shared, but decoding with json even when orjson is installed.
+
+Every item is compared with the recorded one for its page (expected.json) and the three
+modes with each other; any difference is listed and makes the script exit non-zero.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "colemanfurniture_scraper"))
+
+from scrapy.http import HtmlResponse  # noqa: E402
+
+from fetcher import product_fetcher  # noqa: E402
+
+try:
+    from utils import page_data  # noqa: E402
+except ImportError:
+    # Trees from before the shared page data; enough for --record-expected
+    page_data = None
+
+INDEX_FILE = "index.json"
+EXPECTED_FILE = "expected.json"
+VOLATILE_FIELDS = ('Date Scrapped',)
+
+
+def load_index(pages_dir):
+    path = os.path.join(pages_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_pages(pages_dir, urls):
+    import requests
+
+    os.makedirs(pages_dir, exist_ok=True)
+    index = load_index(pages_dir)
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+    for url in urls:
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ".html"
+        resp = requests.get(url, headers=headers, timeout=30)
+        if resp.status_code != 200:
+            print(f"✗ {url}: HTTP {resp.status_code}")
+            continue
+        with open(os.path.join(pages_dir, name), 'wb') as f:
+            f.write(resp.content)
+        index[name] = resp.url
+        print(f"✓ {url} -> {name} ({len(resp.content) / 1024:.0f} KB)")
+    with open(os.path.join(pages_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+
+
+def load_expected(pages_dir):
+    path = os.path.join(pages_dir, EXPECTED_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def record_expected(pages_dir, pages):
+    spider = make_spider()
+    expected = load_expected(pages_dir)
+    for name, url, body in pages:
+        expected[name] = normalize(parse_item(spider, HtmlResponse(url=url, body=body, encoding='utf-8')))
+    with open(os.path.join(pages_dir, EXPECTED_FILE), 'w', encoding='utf-8') as f:
+        json.dump(expected, f, indent=2, sort_keys=True)
+    print(f"✓ Recorded expected items for {len(pages)} pages in {os.path.join(pages_dir, EXPECTED_FILE)}")
+
+
+def load_pages(pages_dir, limit=None):
+    pages = []
+    for name, url in sorted(load_index(pages_dir).items()):
+        path = os.path.join(pages_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            pages.append((name, url, f.read()))
+    return pages[:limit] if limit else pages
+
+
+def make_spider():
+    # Skip __init__: it discovers sitemaps and opens the output stores
+    spider = product_fetcher.ProductFetcher.__new__(product_fetcher.ProductFetcher)
+    spider.verbose = False
+    return spider
+
+
+def parse_item(spider, response):
+    item = next(spider.parse_product_page(response))
+    for field in VOLATILE_FIELDS:
+        item.pop(field, None)
+    return item
+
+
+def normalize(item):
+    # Same shape as an item read back from expected.json
+    return json.loads(json.dumps(item, default=str))
+
+
+def diff_fields(item, expected):
+    return sorted(k for k in set(item) | set(expected) if item.get(k) != expected.get(k))
+
+
+def summarize(label, timings):
+    if not timings:
+        print(f"{label:>8}: no samples")
+        return
+    timings = sorted(timings)
+    total = sum(timings)
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:>8}: {len(timings) / total:,.1f} pages/sec | p50 {p50 * 1000:.2f} ms | p95 {p95 * 1000:.2f} ms")
+
+
+def run(pages, rounds, expected):
+    spider = make_spider()
+    orjson = page_data.orjson
+    # (label, page lookup used by the extractors, json backend)
+    modes = [
+        ("shared", page_data.get_page_data, orjson),
+        ("uncached", page_data.ProductPageData, orjson),
+        ("stdlib", page_data.get_page_data, None),
+    ]
+    timings = {label: [] for label, _, _ in modes}
+    items = {}
+    mismatches = {}
+    try:
+        for _ in range(rounds):
+            for name, url, body in pages:
+                for label, lookup, json_backend in modes:
+                    product_fetcher.get_page_data = lookup
+                    page_data.orjson = json_backend
+                    # New response every time so lxml parsing is timed too, as in a crawl
+                    started = time.perf_counter()
+                    response = HtmlResponse(url=url, body=body, encoding='utf-8')
+                    item = parse_item(spider, response)
+                    timings[label].append(time.perf_counter() - started)
+                    item = normalize(item)
+                    if name in expected and item != expected[name]:
+                        changed = diff_fields(item, expected[name])
+                        mismatches.setdefault(name, set()).add(f"{label} vs expected: {', '.join(changed)}")
+                    first = items.setdefault(name, item)
+                    if item != first:
+                        mismatches.setdefault(name, set()).add(f"{label}: {', '.join(diff_fields(item, first))}")
+    finally:
+        product_fetcher.get_page_data = page_data.get_page_data
+        page_data.orjson = orjson
+    for label, samples in timings.items():
+        summarize(label, samples)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for ProductFetcher product-page parsing")
+    parser.add_argument("--pages", type=str, default="fixtures/coleman", help="Directory of saved pages + index.json")
+    parser.add_argument("--save", nargs="+", metavar="URL", help="Download these product pages into --pages and exit")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=None, help="Only replay the first N pages")
+    parser.add_argument("--record-expected", action="store_true",
+                        help="Parse every page once with the checked-out code, save the items as expected.json and exit")
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.pages, args.save)
+        return
+
+    pages = load_pages(args.pages, args.limit)
+    if not pages:
+        print(f"No saved pages in {args.pages}; save some with --save URL ...")
+        sys.exit(1)
+    if args.record_expected:
+        record_expected(args.pages, pages)
+        return
+    if page_data is None:
+        print("utils.page_data not found; this tree can only --record-expected")
+        sys.exit(1)
+
+    expected = load_expected(args.pages)
+    unchecked = [name for name, _, _ in pages if name not in expected]
+    if unchecked:
+        print(f"No expected item for {len(unchecked)} pages; record them with --record-expected on the old code")
+        sys.exit(1)
+    print(f"Replaying {len(pages)} pages x {args.rounds} rounds (orjson {'on' if page_data.orjson else 'not installed'})")
+
+    mismatches = run(pages, args.rounds, expected)
+
+    print("=" * 60)
+    if mismatches:
+        print(f"{len(mismatches)} pages parse differently from the expected items or between modes:")
+        for name, problems in sorted(mismatches.items()):
+            for problem in sorted(problems):
+                print(f"  {name}: {problem}")
+        sys.exit(1)
+    print("All modes produce the expected items.")
+
+
+if __name__ == "__main__":
+    main()
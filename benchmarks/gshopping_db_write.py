@@ -0,0 +1,218 @@
+"""
+Benchmark insert_to_postgres write paths: execute_values vs COPY + upsert/diff.
+
+Nothing in the real tables is touched. The benchmark creates a scratch schema
+(--schema, default gs_bench) with empty copies of osb_products, competitors,
+google_shopping_results, google_shopping_sellers and, if present,
+google_shopping_product_summary (same columns, defaults and indexes; own sequences),
+copies the first --products active osb_products rows into it, points the pool's
+search_path at it and drops it again at the end (--keep-schema keeps it):
+
+    python benchmarks/gshopping_db_write.py --products 500 --sellers-per-product 12 --rounds 3
+
+Each round rewrites the same products; rounds after the first show the cost of
+re-scraping unchanged offers (the common case between cycles). The unchanged
+count per round is read back from the scratch tables: offers whose scraped_at was
+not moved by the round's writes.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gshopping"))
+
+import psycopg2  # noqa: E402
+from psycopg2 import sql  # noqa: E402
+
+import gscraper_pg  # noqa: E402
+
+SCRATCH_TABLES = ("osb_products", "competitors", "google_shopping_results", "google_shopping_sellers")
+OPTIONAL_SCRATCH_TABLES = ("google_shopping_product_summary",)
+
+
+def _direct_conn():
+    # Outside the pool: the pool's connections only see the scratch schema
+    return psycopg2.connect(
+        host=os.environ.get("PG_HOST"),
+        port=os.environ.get("PG_PORT", "5432"),
+        user=os.environ.get("PG_USER"),
+        password=os.environ.get("PG_PASS"),
+        dbname=os.environ.get("PG_DB"),
+    )
+
+
+def create_scratch_schema(schema, source_schema, limit):
+    """Empty copies of the tables insert_to_postgres writes, seeded with `limit` products; returns their ids."""
+    conn = _direct_conn()
+    try:
+        cursor = conn.cursor()
+        tables = list(SCRATCH_TABLES)
+        for table in OPTIONAL_SCRATCH_TABLES:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{source_schema}.{table}",))
+            if cursor.fetchone()[0]:
+                tables.append(table)
+        cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        cursor.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+        for table in tables:
+            cursor.execute(sql.SQL("CREATE TABLE {}.{} (LIKE {}.{} INCLUDING ALL)").format(
+                sql.Identifier(schema), sql.Identifier(table), sql.Identifier(source_schema), sql.Identifier(table)
+            ))
+        # LIKE ... INCLUDING DEFAULTS keeps nextval() on the source sequences; give each serial column its own
+        cursor.execute(
+            """
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = %s AND column_default LIKE 'nextval(%%'
+            """,
+            (schema,),
+        )
+        for table, column in cursor.fetchall():
+            seq = sql.Identifier(schema, f"{table}_{column}_seq")
+            cursor.execute(sql.SQL("CREATE SEQUENCE {} OWNED BY {}.{}.{}").format(
+                seq, sql.Identifier(schema), sql.Identifier(table), sql.Identifier(column)
+            ))
+            cursor.execute(sql.SQL("ALTER TABLE {}.{} ALTER COLUMN {} SET DEFAULT nextval({})").format(
+                sql.Identifier(schema), sql.Identifier(table), sql.Identifier(column),
+                sql.Literal(f"{schema}.{table}_{column}_seq"),
+            ))
+        cursor.execute(
+            sql.SQL("INSERT INTO {}.osb_products SELECT * FROM {}.osb_products WHERE status = 1 ORDER BY product_id LIMIT %s").format(
+                sql.Identifier(schema), sql.Identifier(source_schema)
+            ),
+            (int(limit),),
+        )
+        cursor.execute(sql.SQL("SELECT product_id FROM {}.osb_products ORDER BY product_id").format(sql.Identifier(schema)))
+        product_ids = [str(r[0]) for r in cursor.fetchall()]
+        conn.commit()
+        return product_ids
+    finally:
+        conn.close()
+
+
+def drop_scratch_schema(schema):
+    conn = _direct_conn()
+    try:
+        conn.cursor().execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def db_now():
+    conn = gscraper_pg._get_pg_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT LOCALTIMESTAMP")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def count_untouched_sellers(since):
+    """Offers the last round did not rewrite: scraped_at older than the round's start."""
+    conn = gscraper_pg._get_pg_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT count(*) FROM google_shopping_sellers WHERE scraped_at < %s", (since,))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def build_batch(product_ids, sellers_per_product, change_ratio, seed):
+    rng = random.Random(seed)
+    products = []
+    sellers = []
+    for pid in product_ids:
+        products.append({
+            "product_id": pid,
+            "google_title": f"Benchmark product {pid}",
+            "google_description": "Synthetic row written by benchmarks/gshopping_db_write.py",
+            "gs_images": ["https://example.com/a.jpg", "https://example.com/b.jpg"],
+            "attributes": {"Color": "Brown", "Material": "Wood"},
+            "rating_star": 4.5,
+            "rating_count": 120,
+            "product_url": f"https://www.google.com/search?ibp=oshop&q=bench{pid}",
+            "seller_count": sellers_per_product,
+            "status": "completed",
+        })
+        for pos in range(1, sellers_per_product + 1):
+            price = 100.0 + pos
+            if rng.random() < change_ratio:
+                price += rng.choice([-5.0, 5.0])
+            sellers.append({
+                "product_id": pid,
+                "seller": f"Bench Seller {pos}",
+                "seller_url": f"https://seller{pos}.example.com/p/{pid}",
+                "seller_price": f"${price:.2f}",
+                "google_position": pos,
+            })
+    return products, sellers
+
+
+def run_mode(mode, product_ids, args):
+    os.environ["DB_WRITE_MODE"] = mode
+    timings = []
+    for round_no in range(args.rounds):
+        products, sellers = build_batch(product_ids, args.sellers_per_product, args.change_ratio, seed=round_no)
+        round_started_at = db_now()
+        started = time.perf_counter()
+        for i in range(0, len(products), args.batch_size):
+            batch_products = products[i:i + args.batch_size]
+            batch_ids = {p["product_id"] for p in batch_products}
+            batch_sellers = [s for s in sellers if s["product_id"] in batch_ids]
+            gscraper_pg.insert_to_postgres(batch_products, batch_sellers)
+        elapsed = time.perf_counter() - started
+        rows = len(products) + len(sellers)
+        timings.append(elapsed)
+        unchanged = count_untouched_sellers(round_started_at)
+        print(
+            f"[{mode}] round {round_no + 1}: {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/sec, "
+            f"{unchanged}/{len(sellers)} offers left untouched"
+        )
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark google_shopping_* write paths")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sellers-per-product", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=gscraper_pg.DEFAULT_DB_BATCH_SIZE)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--change-ratio", type=float, default=0.1, help="Share of offers whose price changes between rounds")
+    parser.add_argument("--schema", default="gs_bench", help="Scratch schema to create, write to and drop")
+    parser.add_argument("--source-schema", default="public", help="Schema holding the real tables to copy the layout from")
+    parser.add_argument("--keep-schema", action="store_true", help="Leave the scratch schema in place for inspection")
+    args = parser.parse_args()
+
+    if args.schema == args.source_schema:
+        print("--schema must differ from --source-schema; the benchmark drops it when done.")
+        sys.exit(1)
+
+    product_ids = create_scratch_schema(args.schema, args.source_schema, args.products)
+    if not product_ids:
+        print("No products found in osb_products.")
+        drop_scratch_schema(args.schema)
+        sys.exit(1)
+    # Every pooled connection resolves unqualified table names to the scratch copies only
+    os.environ["PGOPTIONS"] = f"-c search_path={args.schema}"
+    print(f"Benchmarking {len(product_ids)} products x {args.sellers_per_product} sellers, batch size {args.batch_size}, schema {args.schema}")
+
+    results = {}
+    try:
+        for mode in ("values", "copy"):
+            results[mode] = run_mode(mode, product_ids, args)
+    finally:
+        if not args.keep_schema:
+            drop_scratch_schema(args.schema)
+
+    total_rows = len(product_ids) * (1 + args.sellers_per_product) * args.rounds
+    print("=" * 60)
+    for mode, timings in results.items():
+        print(f"{mode:>6}: {total_rows / sum(timings):,.0f} rows/sec overall")
+    gscraper_pg.log_pg_metrics()
+
+
+if __name__ == "__main__":
+    main()
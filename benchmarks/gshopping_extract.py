@@ -0,0 +1,189 @@
+"""
+Replay captured Google Shopping panels offline and benchmark extraction.
+
+Capture fixtures first with a normal scrape run:
+
+    python gshopping/gscraper_pg.py --capture-fixtures fixtures/gshopping ...
+
+then replay them without touching Google:
+
+    python benchmarks/gshopping_extract.py --fixtures fixtures/gshopping --mode parse --rounds 50
+    python benchmarks/gshopping_extract.py --fixtures fixtures/gshopping --mode browser --rounds 3
+
+parse   - runs panel_extract.build_panel on the saved payloads (pure Python, no browser).
+browser - loads each saved page from disk (file:// only) in a bare headless Chrome
+          and runs both the single-script extractor and the legacy element-by-element
+          path against it. The driver is plain Selenium, not gscraper_pg.setup_driver,
+          so no Google session is opened; other hosts are unresolvable.
+
+Every replay is compared with the panel parsed at capture time; mismatches are
+listed and make the script exit non-zero, so it doubles as a regression check.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gshopping"))
+
+import panel_extract  # noqa: E402
+
+
+def diff_panels(expected, actual):
+    """Short descriptions of where two comparable panels differ."""
+    problems = []
+    if expected.get('options') != actual.get('options'):
+        problems.append("options differ")
+    if expected.get('about') != actual.get('about'):
+        keys = set(expected.get('about', {})) | set(actual.get('about', {}))
+        changed = sorted(k for k in keys if expected.get('about', {}).get(k) != actual.get('about', {}).get(k))
+        problems.append(f"about differs: {', '.join(changed)}")
+    exp_offers = expected.get('offers', [])
+    act_offers = actual.get('offers', [])
+    if len(exp_offers) != len(act_offers):
+        problems.append(f"offer count {len(act_offers)} != {len(exp_offers)}")
+    else:
+        for idx, (e, a) in enumerate(zip(exp_offers, act_offers), start=1):
+            changed = sorted(k for k in set(e) | set(a) if e.get(k) != a.get(k))
+            if changed:
+                problems.append(f"offer {idx} differs: {', '.join(changed)}")
+    return problems
+
+
+def summarize(label, timings, products):
+    if not timings:
+        print(f"{label:>8}: no samples")
+        return
+    timings = sorted(timings)
+    total = sum(timings)
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:>8}: {products / total:,.1f} panels/sec | p50 {p50 * 1000:.1f} ms | p95 {p95 * 1000:.1f} ms")
+
+
+def run_parse(fixtures, args):
+    timings = []
+    mismatches = {}
+    for _ in range(args.rounds):
+        for name, meta in fixtures:
+            payload = panel_extract.load_fixture_json(args.fixtures, name, panel_extract.FIXTURE_PAYLOAD)
+            if payload is None:
+                continue
+            started = time.perf_counter()
+            panel = panel_extract.build_panel(payload, meta['product_id'])
+            timings.append(time.perf_counter() - started)
+            expected = panel_extract.load_fixture_json(args.fixtures, name, panel_extract.FIXTURE_EXPECTED)
+            if expected is not None:
+                problems = diff_panels(panel_extract.comparable_panel(expected), panel_extract.comparable_panel(panel))
+                if problems:
+                    mismatches[name] = problems
+    summarize("parse", timings, len(timings))
+    return mismatches
+
+
+def legacy_panel(driver, product_id):
+    """Panel built from the element-by-element functions in gscraper_pg."""
+    import gscraper_pg
+    from selenium.webdriver.common.by import By
+
+    has_options = len(driver.find_elements(By.XPATH, "//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']")) > 0
+    offers_grid = driver.find_elements(By.XPATH, "//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']")
+    return {
+        'has_options': has_options,
+        'options': json.loads(gscraper_pg.get_product_options(driver) or '{}') if has_options else {},
+        'about': json.loads(gscraper_pg.get_product_about_info(driver)),
+        'offers_grid': bool(offers_grid),
+        'offers': gscraper_pg.extract_offers_from_grid(offers_grid[0], product_id) if offers_grid else [],
+    }
+
+
+def offline_driver():
+    """Bare headless Chrome for replaying saved pages; any host lookup fails, so nothing leaves the machine."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1366,768")
+    options.add_argument("--host-resolver-rules=MAP * ~NOTFOUND")
+    chrome_bin = os.environ.get("CHROME_BIN")
+    if chrome_bin:
+        options.binary_location = chrome_bin
+    chromedriver_bin = os.environ.get("CHROMEDRIVER_BIN")
+    service = Service(executable_path=chromedriver_bin) if chromedriver_bin else Service()
+    return webdriver.Chrome(service=service, options=options)
+
+
+def run_browser(fixtures, args):
+    timings = {"script": [], "legacy": []}
+    mismatches = {}
+    driver = offline_driver()
+    try:
+        for _ in range(args.rounds):
+            for name, meta in fixtures:
+                expected = panel_extract.load_fixture_json(args.fixtures, name, panel_extract.FIXTURE_EXPECTED)
+                for label, extract in (("script", panel_extract.extract_panel), ("legacy", legacy_panel)):
+                    if label == "legacy" and args.skip_legacy:
+                        continue
+                    driver.get(panel_extract.fixture_url(args.fixtures, name))
+                    started = time.perf_counter()
+                    try:
+                        panel = extract(driver, meta['product_id'])
+                    except Exception as e:
+                        mismatches.setdefault(name, []).append(f"{label} failed: {e}")
+                        continue
+                    timings[label].append(time.perf_counter() - started)
+                    if expected is not None:
+                        problems = diff_panels(panel_extract.comparable_panel(expected), panel_extract.comparable_panel(panel))
+                        if problems:
+                            mismatches.setdefault(name, []).extend(f"{label}: {p}" for p in problems)
+    finally:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    for label, samples in timings.items():
+        summarize(label, samples, len(samples))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for Google Shopping panel extraction")
+    parser.add_argument("--fixtures", type=str, default=os.environ.get("GS_CAPTURE_FIXTURES", "fixtures/gshopping"))
+    parser.add_argument("--mode", choices=("parse", "browser", "both"), default="parse")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=None, help="Only replay the first N fixtures")
+    parser.add_argument("--skip-legacy", action="store_true", help="Browser mode: only time the single-script extractor")
+    args = parser.parse_args()
+
+    fixtures = list(panel_extract.iter_fixtures(args.fixtures))
+    if args.limit:
+        fixtures = fixtures[:args.limit]
+    if not fixtures:
+        print(f"No fixtures found in {args.fixtures}; capture some with gscraper_pg.py --capture-fixtures.")
+        sys.exit(1)
+    print(f"Replaying {len(fixtures)} fixtures x {args.rounds} rounds ({args.mode})")
+
+    mismatches = {}
+    if args.mode in ("parse", "both"):
+        mismatches.update(run_parse(fixtures, args))
+    if args.mode in ("browser", "both"):
+        for name, problems in run_browser(fixtures, args).items():
+            mismatches.setdefault(name, []).extend(problems)
+
+    print("=" * 60)
+    if mismatches:
+        print(f"{len(mismatches)} fixtures differ from the captured result:")
+        for name, problems in sorted(mismatches.items()):
+            for problem in sorted(set(problems)):
+                print(f"  {name}: {problem}")
+        sys.exit(1)
+    print("All replays match the captured results.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,54 @@
-import gzip
-import xml.etree.ElementTree as ET
 import json
 import re
 import csv
-import sqlite3
-from datetime import datetime
-from urllib.parse import urlparse, urljoin
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
 from scrapy import Spider, Request
 import sys
 from pathlib import Path
 import time
 import os
 import logging
+import hashlib
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 try:
-    from utils.sitemap_processor import SitemapProcessor
+    from utils.sitemap_processor import SitemapProcessor, iter_sitemap_entries, iter_bytes
+    from utils.success_store import SuccessUrlStore
+    from utils.http_cache import ConditionalCacheStore
+    from utils.page_data import get_page_data
+    from utils.crawl_frontier import CrawlFrontier
 except ImportError:
-    import os
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.sitemap_processor import SitemapProcessor, iter_sitemap_entries, iter_bytes
+    from utils.success_store import SuccessUrlStore
+    from utils.http_cache import ConditionalCacheStore
+    from utils.page_data import get_page_data
+    from utils.crawl_frontier import CrawlFrontier
+
+URL_LIST_SOURCE = 'url_list'  # frontier source name for the ashley_urls / url_chunks input
+
 
 class ProductFetcher(Spider):
     name = 'product'
+    custom_settings = {
+        'DOWNLOADER_MIDDLEWARES': {
+            'utils.http_cache.ConditionalCacheMiddleware': 580,
+        },
+        'EXTENSIONS': {
+            'utils.adaptive_concurrency.AdaptiveConcurrency': 500,
+        },
+        'SPIDER_MIDDLEWARES': {
+            'utils.chunk_routing.ChunkRoutingMiddleware': 550,
+        },
+        # Typed Parquet copy of each CSV feed (PARQUET_EXPORT=0 turns it off; needs pyarrow)
+        'ITEM_PIPELINES': {
+            'utils.parquet_pipeline.ParquetExportPipeline': 800,
+        },
+        # Slot delays are driven by AdaptiveConcurrency (ADAPTIVE_CONCURRENCY=0 turns it off)
+        'AUTOTHROTTLE_ENABLED': os.getenv('ADAPTIVE_CONCURRENCY', '1').strip().lower() in ('0', 'false', 'no'),
+    }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -41,6 +67,9 @@ class ProductFetcher(Spider):
         # Ashley mode flags
         self.is_ashley = kwargs.get('is_ashley', False)
         self.ashley_urls = kwargs.get('ashley_urls', [])
+        # Several URL chunks in one crawler: one shared scheduler, items routed back to
+        # their chunk's feed by utils.chunk_routing
+        self.url_chunks = kwargs.get('url_chunks') or []
         
         # CHUNK MODE parameters
         self.chunk_mode = kwargs.get('chunk_mode', False)
@@ -64,11 +93,30 @@ class ProductFetcher(Spider):
         
         # URL state tracking:
         # - queued_or_processing_urls: already scheduled and not yet finished
-        # - processed_successfully_urls: completed without request failure
+        # - processed_successfully_urls: completed without request failure in this job
+        # - success_store: URLs that succeeded in earlier jobs (Bloom filter + SQLite lookups)
         self.queued_or_processing_urls = set()
         self.processed_successfully_urls = set()
-        self.success_db_conn = None
-        self.success_db_write_counter = 0
+        self.success_store = None
+
+        # Recrawl policy for URLs already in the success store:
+        # - a sitemap <lastmod> newer than the one stored (or than the last success) reschedules the URL
+        # - recrawl_ttl_hours > 0 also reschedules URLs whose last success is older than the TTL
+        self.recrawl_ttl_hours = float(kwargs.get('recrawl_ttl_hours', os.getenv('RECRAWL_TTL_HOURS', '0')) or 0)
+        self.recrawl_on_lastmod = str(kwargs.get('recrawl_on_lastmod', os.getenv('RECRAWL_ON_LASTMOD', '1'))).strip().lower() not in ('0', 'false', 'no')
+        self.recrawl_count = 0
+
+        # Conditional GET cache: validators + last parsed item per product URL (see utils/http_cache.py)
+        self.http_cache = None
+        self.cache_hits = 0
+
+        # Resumable crawl state (see utils/crawl_frontier.py): a job stopped before finishing
+        # leaves its pending requests and sitemap list for the next job with the same key
+        self.resume = str(kwargs.get('resume', os.getenv('CRAWL_RESUME', '1'))).strip().lower() not in ('0', 'false', 'no')
+        self.fresh_crawl = str(kwargs.get('fresh_crawl', False)).strip().lower() in ('1', 'true', 'yes')
+        self.crawl_state_key = kwargs.get('crawl_state_key') or os.getenv('CRAWL_STATE_KEY', '').strip() or None
+        self.frontier = None
+        self.resumed_count = 0
         
         # PROGRESS TRACKING
         self.start_time = time.time()
@@ -87,9 +135,15 @@ class ProductFetcher(Spider):
         # Persistent cross-job dedup store:
         # once URL is scraped successfully, skip it in future jobs.
         self._init_success_store()
+        self._init_http_cache()
+        self._init_frontier()
         
         # Only process sitemaps if not in Ashley mode
-        if not self.is_ashley:
+        saved_sitemaps = self.frontier.saved_sitemaps() if self.frontier and self.frontier.resumed else None
+        if not self.is_ashley and saved_sitemaps is not None:
+            self.sitemap_chunk = saved_sitemaps
+            self.logger.info(f"♻️ Resuming with the {len(self.sitemap_chunk)} sitemaps of the interrupted job; skipping discovery")
+        elif not self.is_ashley:
             try:
                 sitemap_processor = SitemapProcessor()
                 
@@ -110,6 +164,8 @@ class ProductFetcher(Spider):
             except Exception as e:
                 self.logger.error(f"❌ Failed to discover sitemap: {e}")
                 raise
+        if self.frontier:
+            self.frontier.start(self.job_id, None if self.is_ashley else self.sitemap_chunk)
     
     def get_headers(self):
         """Get headers for Ashley requests"""
@@ -140,18 +196,70 @@ class ProductFetcher(Spider):
             normalized = f"{normalized}?{query}"
         return normalized
 
-    def _should_schedule_url(self, url: str) -> bool:
+    @staticmethod
+    def _parse_lastmod(value):
+        """Parse a sitemap <lastmod> (W3C datetime or plain date) into a naive local datetime."""
+        if not value:
+            return None
+        value = str(value).strip()
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                parsed = datetime.strptime(value[:10], '%Y-%m-%d')
+            except ValueError:
+                return None
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+
+    def _needs_recrawl(self, record, lastmod=None):
+        last_success_at = self._parse_lastmod(record[0])
+        stored_lastmod = self._parse_lastmod(record[1])
+        if self.recrawl_on_lastmod and lastmod is not None:
+            if stored_lastmod is not None:
+                if lastmod > stored_lastmod:
+                    return True
+            elif last_success_at is not None and lastmod > last_success_at:
+                return True
+        if self.recrawl_ttl_hours > 0:
+            if last_success_at is None or datetime.now() - last_success_at > timedelta(hours=self.recrawl_ttl_hours):
+                return True
+        return False
+
+    def _should_schedule_url(self, url: str, lastmod=None) -> bool:
         normalized_url = self.normalize_url(url)
         if not normalized_url:
             return False
 
-        # Skip if already completed successfully
+        # Skip if already completed successfully in this job
         if normalized_url in self.processed_successfully_urls:
             self.skipped_count += 1
             if self.verbose:
                 self.logger.info(f"⏭️ URL already scraped successfully: {normalized_url}")
             return False
 
+        # Skip if this crawl already has it, possibly from a job that was stopped before finishing
+        if self.frontier is not None and normalized_url in self.frontier:
+            self.skipped_count += 1
+            if self.verbose:
+                self.logger.info(f"⏭️ URL already in crawl frontier: {normalized_url}")
+            return False
+
+        # Skip if completed in an earlier job, unless the recrawl policy says it is stale
+        record = self.success_store.get_record(normalized_url) if self.success_store else None
+        if record is not None:
+            if not self._needs_recrawl(record, lastmod):
+                self.skipped_count += 1
+                if self.verbose:
+                    self.logger.info(f"⏭️ URL already scraped successfully: {normalized_url}")
+                return False
+            self.recrawl_count += 1
+            if self.verbose:
+                self.logger.info(f"🔄 Recrawling stale URL: {normalized_url}")
+
         # Skip if already queued/in-progress
         if normalized_url in self.queued_or_processing_urls:
             self.skipped_count += 1
@@ -172,63 +280,123 @@ class ProductFetcher(Spider):
     def _init_success_store(self):
         try:
             success_store_path = self._get_success_store_path()
-            self.success_db_conn = sqlite3.connect(success_store_path, timeout=30)
-            cursor = self.success_db_conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS successful_urls (
-                    domain TEXT NOT NULL,
-                    normalized_url TEXT NOT NULL,
-                    first_success_at TEXT NOT NULL,
-                    job_id TEXT,
-                    PRIMARY KEY (domain, normalized_url)
-                )
-            """)
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_successful_urls_domain
-                ON successful_urls(domain)
-            """)
-            self.success_db_conn.commit()
-
-            cursor.execute(
-                "SELECT normalized_url FROM successful_urls WHERE domain = ?",
-                (self.domain.lower(),)
+            self.success_store = SuccessUrlStore(
+                success_store_path,
+                self.domain,
+                capacity=int(os.getenv('SUCCESS_BLOOM_CAPACITY', '2000000')),
+                batch_size=int(os.getenv('SUCCESS_DB_BATCH_SIZE', '200')),
             )
-            rows = cursor.fetchall()
-            if rows:
-                self.processed_successfully_urls.update(row[0] for row in rows if row and row[0])
             self.logger.info(
-                f"🗂️ Loaded {len(rows)} previously successful URLs for {self.domain} from {success_store_path}"
+                f"🗂️ Success filter covers {self.success_store.bloom.count} previously successful URLs for {self.domain} from {success_store_path}"
             )
         except Exception as e:
             self.logger.error(f"❌ Failed to initialize persistent dedup store: {e}")
-            self.success_db_conn = None
+            self.success_store = None
 
-    def _persist_success_url(self, normalized_url: str):
-        if not self.success_db_conn or not normalized_url:
+    def _persist_success_url(self, normalized_url: str, lastmod=None, changefreq=None):
+        if not self.success_store or not normalized_url:
             return
         try:
-            self.success_db_conn.execute(
-                """
-                INSERT OR IGNORE INTO successful_urls (domain, normalized_url, first_success_at, job_id)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    self.domain.lower(),
-                    normalized_url,
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    self.job_id
-                )
+            lastmod_dt = self._parse_lastmod(lastmod)
+            self.success_store.add(
+                normalized_url,
+                self.job_id,
+                lastmod=lastmod_dt.strftime('%Y-%m-%d %H:%M:%S') if lastmod_dt else None,
+                changefreq=changefreq or None,
             )
-            self.success_db_write_counter += 1
-            if self.success_db_write_counter >= 50:
-                self.success_db_conn.commit()
-                self.success_db_write_counter = 0
         except Exception as e:
             self.logger.error(f"❌ Failed to persist successful URL {normalized_url}: {e}")
           
+    def _init_http_cache(self):
+        if os.getenv('CONDITIONAL_CACHE', '1').strip().lower() in ('0', 'false', 'no'):
+            return
+        try:
+            cache_path = os.getenv('CONDITIONAL_CACHE_DB_PATH', '').strip()
+            if not cache_path:
+                os.makedirs(self.output_dir, exist_ok=True)
+                cache_path = os.path.join(self.output_dir, f"http_cache_{self.base_domain}.sqlite3")
+            self.http_cache = ConditionalCacheStore(cache_path)
+            self.logger.info(f"🗂️ Conditional request cache: {cache_path}")
+        except Exception as e:
+            self.logger.error(f"❌ Failed to initialize conditional request cache: {e}")
+            self.http_cache = None
+
+    def _default_crawl_state_key(self):
+        if self.is_ashley:
+            urls = self.url_chunks or [self.ashley_urls]
+            digest = hashlib.sha1(json.dumps(urls).encode('utf-8')).hexdigest()[:16]
+            return f"{self.domain}:urls:{digest}:chunk{self.chunk_id}of{self.total_chunks}"
+        return f"{self.domain}:sitemaps:{self.sitemap_offset}:{self.max_sitemaps}:{self.max_urls_per_sitemap}"
+
+    def _init_frontier(self):
+        if not self.resume:
+            return
+        try:
+            db_path = os.getenv('CRAWL_STATE_DB_PATH', '').strip()
+            if not db_path:
+                os.makedirs(self.output_dir, exist_ok=True)
+                db_path = os.path.join(self.output_dir, f"crawl_state_{self.base_domain}.sqlite3")
+            key = self.crawl_state_key or self._default_crawl_state_key()
+            self.frontier = CrawlFrontier(db_path, key)
+            if self.fresh_crawl and self.frontier.resumed:
+                self.logger.info(f"🗑️ Discarding saved crawl state for {key}")
+                self.frontier.reset()
+            if self.frontier.resumed:
+                counts = self.frontier.counts()
+                self.logger.info(
+                    f"♻️ Resuming crawl {key}: {counts.get('pending', 0)} pending requests, "
+                    f"{counts.get('done', 0)} done, {len(self.frontier.read_sources())} sources fully read"
+                )
+            else:
+                self.logger.info(f"🗂️ Crawl state: {db_path} ({key})")
+        except Exception as e:
+            self.logger.error(f"❌ Failed to initialize crawl state: {e}")
+            self.frontier = None
+
+    def _track_request(self, request):
+        """Record a product request in the frontier so a later job can resume it."""
+        if self.frontier is not None:
+            url = request.meta.get('url', request.url)
+            self.frontier.add(url, self.normalize_url(url), request.meta)
+        return request
+
+    def _source_already_read(self, source):
+        if self.frontier is not None and source in self.frontier.read_sources():
+            self.logger.info(f"♻️ {source}: all URLs were scheduled by the interrupted job")
+            return True
+        return False
+
+    def _resume_pending_requests(self):
+        """Requests that were queued or in flight when the previous job of this crawl stopped."""
+        if self.frontier is None or not self.frontier.resumed:
+            return
+        for url, meta in self.frontier.iter_pending():
+            normalized_url = self.normalize_url(url)
+            if normalized_url in self.queued_or_processing_urls:
+                continue
+            self.queued_or_processing_urls.add(normalized_url)
+            self.resumed_count += 1
+            yield Request(
+                url,
+                callback=self.parse_product_page_with_check,
+                meta=meta,
+                errback=self.handle_product_error,
+                priority=10,
+                dont_filter=True,
+                headers=self.get_headers() if meta.get('is_ashley') else None
+            )
+        if self.resumed_count:
+            self.logger.info(f"♻️ Re-queued {self.resumed_count} requests from the interrupted job")
+
     def start_requests(self):
+        yield from self._resume_pending_requests()
+
         if self.is_ashley:
             # Filter URLs for this chunk if in chunk mode
+            if self.url_chunks:
+                yield from self._start_chunked_requests()
+                return
+
             urls_to_process = self.ashley_urls
             self.total_urls_found = len(urls_to_process)
             
@@ -251,6 +419,8 @@ class ProductFetcher(Spider):
                 self.logger.info(f"📊 Ashley mode: Processing {len(self.ashley_urls)} direct product URLs")
             
             self.logger.info(f"🎯 Total URLs to process in this job: {self.total_urls_found}")
+            if self._source_already_read(URL_LIST_SOURCE):
+                return
             
             # Create requests for each URL with Scrapy's built-in dupefilter
             for i, url in enumerate(urls_to_process):
@@ -262,20 +432,23 @@ class ProductFetcher(Spider):
                 if i > 0:
                     headers['Referer'] = urls_to_process[0]
                 
-                yield Request(
+                yield self._track_request(Request(
                     url,
                     callback=self.parse_product_page_with_check,
                     meta={
                         'url': url,
                         'is_ashley': True,
                         'chunk_id': self.chunk_id,
-                        'chunk_mode': self.chunk_mode
+                        'chunk_mode': self.chunk_mode,
+                        'conditional_cache': True
                     },
                     errback=self.handle_product_error,
                     priority=10,
                     dont_filter=True,  # Bypass Scrapy's dupefilter since we handle it
                     headers=headers
-                )
+                ))
+            if self.frontier is not None:
+                self.frontier.mark_source_read(URL_LIST_SOURCE, len(urls_to_process))
             return
         
         # SITEMAP MODE for non-Ashley websites
@@ -285,7 +458,12 @@ class ProductFetcher(Spider):
         
         self.logger.info(f"🚀 Starting to process {len(self.sitemap_chunk)} sitemaps")
 
+        read_sources = self.frontier.read_sources() if self.frontier is not None else set()
+        if read_sources:
+            self.logger.info(f"♻️ {len(read_sources & set(self.sitemap_chunk))} sitemaps were fully read by the interrupted job; skipping them")
         for sitemap_url in self.sitemap_chunk:
+            if sitemap_url in read_sources:
+                continue
             yield Request(
                 sitemap_url,
                 callback=self.parse_product_sitemap,
@@ -294,44 +472,42 @@ class ProductFetcher(Spider):
             )
     
     def parse_product_sitemap(self, response):
-        if response.url.endswith('.gz'):
-            content = gzip.decompress(response.body)
-            root = ET.fromstring(content)
-        else:
-            root = ET.fromstring(response.body)
-        
-        ns = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-        all_urls = [url.text for url in root.findall('ns:url/ns:loc', ns) if url.text]
-        
-        if self.max_urls_per_sitemap > 0:
-            all_urls = all_urls[:self.max_urls_per_sitemap]
-        
         sitemap_url = response.meta.get('sitemap_url', response.url)
-        self.sitemap_urls_count[sitemap_url] = len(all_urls)
-        self.total_urls_found += len(all_urls)
-        
-        self.logger.info(f"📄 Sitemap {sitemap_url}: Found {len(all_urls)} URLs")
-        self.logger.info(f"📊 Cumulative URLs found so far: {self.total_urls_found}")
+        self.logger.info(f"📄 Sitemap {sitemap_url}: streaming URL entries")
         
+        found = 0
         plp_count = 0
         pdp_count = 0
 
-        for url in all_urls:
+        # Entries are decoded chunk by chunk, so product requests start before the sitemap is fully parsed
+        for kind, url, lastmod, changefreq in iter_sitemap_entries(iter_bytes(response.body)):
+            if kind != 'url':
+                continue
+            if self.max_urls_per_sitemap > 0 and found >= self.max_urls_per_sitemap:
+                break
+            found += 1
+            self.total_urls_found += 1
+
             if self._is_plp_url(url):
                 plp_count += 1
                 continue
             pdp_count += 1
 
-            if not self._should_schedule_url(url):
+            if not self._should_schedule_url(url, self._parse_lastmod(lastmod)):
                 continue
             
-            yield Request(
+            yield self._track_request(Request(
                 url,
                 callback=self.parse_product_page_with_check,
-                meta={'url': url, 'sitemap': sitemap_url},
+                meta={'url': url, 'sitemap': sitemap_url, 'lastmod': lastmod, 'changefreq': changefreq, 'conditional_cache': True},
                 errback=self.handle_product_error
-            )
+            ))
         
+        if self.frontier is not None:
+            self.frontier.mark_source_read(sitemap_url, found)
+        self.sitemap_urls_count[sitemap_url] = found
+        self.logger.info(f"📄 Sitemap {sitemap_url}: Found {found} URLs")
+        self.logger.info(f"📊 Cumulative URLs found so far: {self.total_urls_found}")
         self.logger.info(f"📊 Sitemap summary: {plp_count} PLP pages filtered out, {pdp_count} PDP pages to scrape")
     
     def _is_plp_url(self, url: str) -> bool:
@@ -349,6 +525,8 @@ class ProductFetcher(Spider):
         requested_url = response.meta.get('url', response.url)
         requested_normalized = self.normalize_url(requested_url)
         response_normalized = self.normalize_url(response.url)
+        if self.frontier is not None:
+            self.frontier.mark_done(requested_normalized)
         
         # Log progress periodically
         current_time = time.time()
@@ -361,56 +539,38 @@ class ProductFetcher(Spider):
             success_rate = ((self.processed_count - self.failed_count) / self.processed_count * 100) if self.processed_count > 0 else 0
             self.logger.info(f"📊 Progress: {self.processed_count}/{self.total_urls_found} URLs processed | ✅ Success: {self.processed_count - self.failed_count} | ⏭️ Skipped: {self.skipped_count} | ❌ Failed: {self.failed_count} | 📈 Rate: {success_rate:.1f}%")
         
-        json_scripts = response.xpath('//script[@type="application/ld+json"]/text()').getall()
-        has_product_json = False
-        for script in json_scripts:
-            try:
-                data = json.loads(script.strip())
-                if isinstance(data, dict):
-                    data_type = data.get('@type')
-                    if data_type:
-                        if isinstance(data_type, str):
-                            if 'Product' in data_type:
-                                has_product_json = True
-                                break
-                        elif isinstance(data_type, list):
-                            if any('Product' in str(t) for t in data_type):
-                                has_product_json = True
-                                break
-                    elif data.get('name') and (data.get('offers') or data.get('sku')):
-                        has_product_json = True
-                        break
-                elif isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            item_type = item.get('@type')
-                            if item_type:
-                                if isinstance(item_type, str) and 'Product' in item_type:
-                                    has_product_json = True
-                                    break
-                                elif isinstance(item_type, list) and any('Product' in str(t) for t in item_type):
-                                    has_product_json = True
-                                    break
-                    if has_product_json:
-                        break
-            except Exception as e:
-                self.logger.debug(f"Error parsing JSON-LD: {e}")
-                continue
+        # 304 or byte-identical page: replay the item parsed last time instead of parsing again
+        cached_item = response.meta.get('cached_item')
+        if cached_item is not None:
+            self.cache_hits += 1
+            if self.verbose:
+                self.logger.info(f"♻️ {response.meta.get('http_cache')}: re-emitting cached item for {response.url}")
+            self._mark_success(requested_normalized, response_normalized, response.meta)
+            bundle_links = response.meta.get('cached_bundle_urls') or []
+            validators = response.meta.get('http_cache_validators')
+            if validators and self.http_cache is not None and requested_normalized:
+                self.http_cache.put(requested_normalized, validators, cached_item, bundle_links)
+            item = dict(cached_item)
+            item['Date Scrapped'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            yield item
+            yield from self._schedule_bundle_products(bundle_links, response.url, response.meta)
+            return
+        
+        # ld+json and the hypernova payload are decoded once here and shared by every extract_* call
+        has_product_json = get_page_data(response).has_product_json
         
         if has_product_json:
             if self.verbose:
                 self.logger.info(f"✅ Found Product JSON-LD for {response.url}")
             # Mark URL as successfully scraped only when Product JSON-LD is present.
-            if requested_normalized in self.queued_or_processing_urls:
-                self.queued_or_processing_urls.discard(requested_normalized)
-            if requested_normalized:
-                self.processed_successfully_urls.add(requested_normalized)
-                self._persist_success_url(requested_normalized)
-            if response_normalized:
-                self.processed_successfully_urls.add(response_normalized)
-                self._persist_success_url(response_normalized)
-            yield from self.parse_product_page(response)
-            yield from self.extract_bundle_products(response)
+            self._mark_success(requested_normalized, response_normalized, response.meta)
+            items = list(self.parse_product_page(response))
+            bundle_links = self._extract_bundle_links(response)
+            validators = response.meta.get('http_cache_validators')
+            if validators and self.http_cache is not None and items and requested_normalized:
+                self.http_cache.put(requested_normalized, validators, items[0], bundle_links)
+            yield from items
+            yield from self._schedule_bundle_products(bundle_links, response.url, response.meta)
         else:
             if requested_normalized in self.queued_or_processing_urls:
                 self.queued_or_processing_urls.discard(requested_normalized)
@@ -421,53 +581,97 @@ class ProductFetcher(Spider):
                 self.logger.warning(f"⚠️ No Product JSON-LD found for {response.url}")
             return
     
-    def extract_bundle_products(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if not json_script:
+    def _start_chunked_requests(self):
+        """Requests for every chunk in url_chunks, interleaved so all chunk outputs fill at the same pace."""
+        self.total_urls_found = sum(len(chunk) for chunk in self.url_chunks)
+        self.logger.info(f"📊 Ashley mode: {self.total_urls_found} URLs in {len(self.url_chunks)} chunks, one crawler")
+        if self._source_already_read(URL_LIST_SOURCE):
             return
-        try:
-            json_script = json_script.strip()
-            if json_script.startswith('<!--'):
-                json_script = json_script[4:]
-            if json_script.endswith('-->'):
-                json_script = json_script[:-3]
-            json_script = json_script.strip()
-            data = json.loads(json_script)
-            content = data.get('data', {}).get('content', {})
-            product_layouts = content.get('productLayouts', {})
-            simple_items = product_layouts.get('simpleItems', [])
-            bundle_count = 0
-            for item in simple_items:
-                if isinstance(item, dict):
-                    sub_product_url = item.get('url')
-                    item_short_name = item.get('itemShortName', '')
-                    if not sub_product_url or sub_product_url == response.url:
-                        if self.verbose:
-                            self.logger.info(f"⏭️ Skipping self-reference or empty URL: {sub_product_url}")
-                        continue
-                    
-                    normalized_url = self.normalize_url(sub_product_url)
-                    if not self._should_schedule_url(sub_product_url):
-                        if self.verbose:
-                            self.logger.info(f"⏭️ Bundle product already tracked: {item_short_name} - {normalized_url}")
-                        continue
-                    bundle_count += 1
-                    
-                    if self.verbose:
-                        self.logger.info(f"📦 Found bundle product #{bundle_count}: {item_short_name}")
-                    
-                    yield Request(
-                        sub_product_url,
-                        callback=self.parse_product_page_with_check,
-                        meta={'url': sub_product_url, 'is_bundle': True},
-                        errback=self.handle_product_error
-                    )
+        referer = next((chunk[0] for chunk in self.url_chunks if chunk), None)
+        longest = max(len(chunk) for chunk in self.url_chunks)
+        for i in range(longest):
+            for chunk_id, chunk in enumerate(self.url_chunks):
+                if i >= len(chunk):
+                    continue
+                url = chunk[i]
+                if not self._should_schedule_url(url):
+                    continue
+                headers = self.get_headers()
+                if url != referer:
+                    headers['Referer'] = referer
+                yield self._track_request(Request(
+                    url,
+                    callback=self.parse_product_page_with_check,
+                    meta={
+                        'url': url,
+                        'is_ashley': True,
+                        'chunk_id': chunk_id,
+                        'chunk_route': True,
+                        'conditional_cache': True
+                    },
+                    errback=self.handle_product_error,
+                    priority=10,
+                    dont_filter=True,
+                    headers=headers
+                ))
+        if self.frontier is not None:
+            self.frontier.mark_source_read(URL_LIST_SOURCE, self.total_urls_found)
+
+    def _mark_success(self, requested_normalized, response_normalized, meta):
+        if requested_normalized in self.queued_or_processing_urls:
+            self.queued_or_processing_urls.discard(requested_normalized)
+        lastmod = meta.get('lastmod')
+        changefreq = meta.get('changefreq')
+        if requested_normalized:
+            self.processed_successfully_urls.add(requested_normalized)
+            self._persist_success_url(requested_normalized, lastmod, changefreq)
+        if response_normalized and response_normalized != requested_normalized:
+            self.processed_successfully_urls.add(response_normalized)
+            self._persist_success_url(response_normalized, lastmod, changefreq)
+
+    def _extract_bundle_links(self, response):
+        """[url, itemShortName] pairs for the sub-products listed in the hypernova App payload."""
+        links = []
+        for item in get_page_data(response).simple_items:
+            sub_product_url = item.get('url')
+            item_short_name = item.get('itemShortName', '')
+            if not sub_product_url or sub_product_url == response.url:
+                if self.verbose:
+                    self.logger.info(f"⏭️ Skipping self-reference or empty URL: {sub_product_url}")
+                continue
+            links.append([sub_product_url, item_short_name])
+        return links
+
+    def _schedule_bundle_products(self, bundle_links, source_url, parent_meta=None):
+        bundle_count = 0
+        for sub_product_url, item_short_name in bundle_links:
+            normalized_url = self.normalize_url(sub_product_url)
+            if not self._should_schedule_url(sub_product_url):
+                if self.verbose:
+                    self.logger.info(f"⏭️ Bundle product already tracked: {item_short_name} - {normalized_url}")
+                continue
+            bundle_count += 1
             
-            if bundle_count > 0:
-                self.logger.info(f"📦 Added {bundle_count} bundle products from {response.url}")
-                
-        except Exception as e:
-            self.logger.error(f"Error extracting bundle products: {e}")
+            if self.verbose:
+                self.logger.info(f"📦 Found bundle product #{bundle_count}: {item_short_name}")
+            
+            meta = {'url': sub_product_url, 'is_bundle': True, 'conditional_cache': True}
+            # Carry chunk routing here rather than leaving it to ChunkRoutingMiddleware, so a resumed request keeps it
+            for key in ('chunk_id', 'chunk_route'):
+                if parent_meta and key in parent_meta:
+                    meta[key] = parent_meta[key]
+            yield self._track_request(Request(
+                sub_product_url,
+                callback=self.parse_product_page_with_check,
+                meta=meta,
+                errback=self.handle_product_error
+            ))
+        
+        if bundle_count > 0:
+            self.logger.info(f"📦 Added {bundle_count} bundle products from {source_url}")
+
+    def extract_bundle_products(self, response):
+        yield from self._schedule_bundle_products(self._extract_bundle_links(response), response.url, response.meta)
 
     def parse_product_page(self, response):
         item = {}
@@ -539,32 +743,9 @@ class ProductFetcher(Spider):
             return f"{secs}s"
        
     def extract_product_name(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
-            try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            name = item.get('name', '')
-                            if name:
-                                return name
-            except Exception as e:
-                self.logger.debug(f"Error extracting name from simpleItems: {e}")
+        name = get_page_data(response).current_item_value('name')
+        if name:
+            return name
 
         selectors = [
             '//*[@id="contentId"]/div/div[1]/div[2]/div[2]/h1/text()'
@@ -572,181 +753,83 @@ class ProductFetcher(Spider):
         return self.extract_using_selectors(response, selectors)
     
     def extract_price(self, response):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    offers = data.get('offers', {})
-                    if isinstance(offers, dict) and 'price' in offers:
-                        return str(offers['price'])
-            except:
-                continue
+        for data in get_page_data(response).ld_products:
+            offers = data.get('offers', {})
+            if isinstance(offers, dict) and 'price' in offers:
+                return str(offers['price'])
         return ''
     
     def extract_sku(self, response):
         # Try to get SKU from simpleItems by matching URL
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
-            try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            sku = item.get('sku', '')
-                            if sku:
-                                return sku
-            except Exception as e:
-                self.logger.debug(f"Error extracting SKU from simpleItems: {e}")
-        
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    return data.get('sku', '')
-            except:
-                continue
-        
+        page = get_page_data(response)
+        sku = page.current_item_value('sku')
+        if sku:
+            return sku
+        for data in page.ld_products:
+            return data.get('sku', '')
         return ''
     
     def extract_mpn(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
-            try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            sku = item.get('sku', '')
-                            if sku:
-                                return sku
-            except Exception as e:
-                self.logger.debug(f"Error extracting SKU from simpleItems: {e}")
-
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    return data.get('mpn', '')
-            except:
-                continue
+        page = get_page_data(response)
+        sku = page.current_item_value('sku')
+        if sku:
+            return sku
+        for data in page.ld_products:
+            return data.get('mpn', '')
         return ''
 
     def extract_gtin(self, response):
         return ''
     
     def extract_brand(self, response):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    brand = data.get('brand', {})
-                    if isinstance(brand, dict):
-                        return brand.get('name', '')
-                    else:
-                        return str(brand)
-            except:
-                continue
+        for data in get_page_data(response).ld_products:
+            brand = data.get('brand', {})
+            if isinstance(brand, dict):
+                return brand.get('name', '')
+            else:
+                return str(brand)
         return ''
     
     def extract_main_image(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
-            try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            gallery = item.get('gallery', [])
-                            if isinstance(gallery, list) and gallery:
-                                for img in gallery:
-                                    if isinstance(img, dict):
-                                        original_url = img.get('original', '')
-                                        return original_url
-            except Exception as e:
-                self.logger.debug(f"Error extracting main image from simpleItems gallery: {e}")
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    return data.get('image', '')
-            except:
-                continue
+        page = get_page_data(response)
+        for item in page.current_items:
+            gallery = item.get('gallery', [])
+            if isinstance(gallery, list) and gallery:
+                for img in gallery:
+                    if isinstance(img, dict):
+                        return img.get('original', '')
+        for data in page.ld_products:
+            return data.get('image', '')
         return ''
     
     def extract_category(self, response):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
+        for data in get_page_data(response).ld_breadcrumbs:
             try:
-                data = json.loads(script)
-                if data.get('@type') == 'BreadcrumbList':
-                    categories = []
-                    for item in data.get('itemListElement', []):
-                        item_data = item.get('item', {})
-                        name = item_data.get('name', '')
-                        if name and name.lower() not in ['home', 'shop', 'all']:
-                            categories.append(name)
-                    if len(categories) > 1:
-                        categories = categories[:-1]
-                    if categories:
-                        return ' > '.join(categories)
+                categories = []
+                for item in data.get('itemListElement', []):
+                    item_data = item.get('item', {})
+                    name = item_data.get('name', '')
+                    if name and name.lower() not in ['home', 'shop', 'all']:
+                        categories.append(name)
+                if len(categories) > 1:
+                    categories = categories[:-1]
+                if categories:
+                    return ' > '.join(categories)
             except:
                 continue
         return ''
 
     def extract_category_url(self, response):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
+        for data in get_page_data(response).ld_breadcrumbs:
             try:
-                data = json.loads(script)
-                if data.get('@type') == 'BreadcrumbList':
-                    urls = []
-                    for item in data.get('itemListElement', []):
-                        item_data = item.get('item', {})
-                        url = item_data.get('@id', '')
-                        if url:
-                            urls.append(url)
-                    if len(urls) >= 2:
-                        return urls[-2]
+                urls = []
+                for item in data.get('itemListElement', []):
+                    item_data = item.get('item', {})
+                    url = item_data.get('@id', '')
+                    if url:
+                        urls.append(url)
+                if len(urls) >= 2:
+                    return urls[-2]
             except:
                 continue
         return ''
@@ -755,50 +838,22 @@ class ProductFetcher(Spider):
         return ''
 
     def extract_status(self, response):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    offers = data.get('offers', {})
-                    if isinstance(offers, dict):
-                        availability = str(offers.get('availability', '')).lower()
-                        if 'instock' in availability:
-                            return 'Active'
-                        elif 'outofstock' in availability or 'soldout' in availability:
-                            return 'Out of Stock'
-                        elif 'preorder' in availability:
-                            return 'Active'
-            except:
-                continue
+        for data in get_page_data(response).ld_products:
+            offers = data.get('offers', {})
+            if isinstance(offers, dict):
+                availability = str(offers.get('availability', '')).lower()
+                if 'instock' in availability:
+                    return 'Active'
+                elif 'outofstock' in availability or 'soldout' in availability:
+                    return 'Out of Stock'
+                elif 'preorder' in availability:
+                    return 'Active'
         return ''
     
     def extract_product_id(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
-            try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            productId = item.get('productId', '')
-                            if productId:
-                                return productId
-            except Exception as e:
-                self.logger.debug(f"Error extracting productId from simpleItems: {e}")
+        product_id = get_page_data(response).current_item_value('productId')
+        if product_id:
+            return product_id
 
         product_id = response.xpath('//div[@data-id]/@data-id').get()        
         if product_id:
@@ -809,13 +864,8 @@ class ProductFetcher(Spider):
         return ''
     
     def extract_group_attr1(self, response, attr_num):
-        for script in response.xpath('//script[@type="application/ld+json"]/text()').getall():
-            try:
-                data = json.loads(script)
-                if data.get('@type') == 'Product' or data.get('@type') == 'ProductGroup':
-                    return data.get('color', '')
-            except:
-                continue
+        for data in get_page_data(response).ld_products:
+            return data.get('color', '')
         return ''
 
     def extract_group_attr2(self, response, attr_num):
@@ -850,30 +900,10 @@ class ProductFetcher(Spider):
     
     def extract_main_images(self, response):
         image_urls = []
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if json_script:
+        page = get_page_data(response)
+        if page.app is not None:
             try:
-                json_script = json_script.strip()
-                if json_script.startswith('<!--'):
-                    json_script = json_script[4:]
-                if json_script.endswith('-->'):
-                    json_script = json_script[:-3]
-                json_script = json_script.strip()
-                
-                data = json.loads(json_script)
-                content = data.get('data', {}).get('content', {})
-                product_layouts = content.get('productLayouts', {})
-                simple_items = product_layouts.get('simpleItems', [])
-                
-                current_url = response.url.rstrip('/')
-                
-                matching_item = None
-                for item in simple_items:
-                    if isinstance(item, dict):
-                        item_url = item.get('url', '').rstrip('/')
-                        if item_url and item_url == current_url:
-                            matching_item = item
-                            break
+                matching_item = page.current_items[0] if page.current_items else None
                 
                 if matching_item:
                     gallery = matching_item.get('gallery', [])
@@ -888,9 +918,7 @@ class ProductFetcher(Spider):
                             return '\n'.join(image_urls)
                 
                 if not image_urls:
-                    main_data = data.get('data', {})
-                    content = main_data.get('content', {})
-                    gallery = content.get('gallery', [])
+                    gallery = page.content.get('gallery', [])
                     if isinstance(gallery, list):
                         for img in gallery:
                             if isinstance(img, dict):
@@ -907,20 +935,12 @@ class ProductFetcher(Spider):
         return '\n'.join(image_urls) if image_urls else ''
 
     def extract_dimensions(self, response):
-        json_script = response.xpath('//script[@data-hypernova-key="App"]/text()').get()
-        if not json_script:
+        page = get_page_data(response)
+        if page.app is None:
             return ''
         
-        json_script = json_script.strip()
-        if json_script.startswith('<!--'):
-            json_script = json_script[4:]
-        if json_script.endswith('-->'):
-            json_script = json_script[:-3]
-        json_script = json_script.strip()
-        
         try:
-            data = json.loads(json_script)
-            content = data.get('data', {}).get('content', {})
+            content = page.content
             setIncludes = content.get('setIncludes', {})
             
             result = {}
@@ -1180,6 +1200,8 @@ class ProductFetcher(Spider):
             request_normalized = self.normalize_url(request_url)
             if failed_normalized:
                 self.queued_or_processing_urls.discard(failed_normalized)
+                if self.frontier is not None:
+                    self.frontier.discard(failed_normalized)
             if request_normalized:
                 self.queued_or_processing_urls.discard(request_normalized)
         
@@ -1319,6 +1341,10 @@ class ProductFetcher(Spider):
         self.logger.info(f"      - URLs processed: {self.processed_count}")
         self.logger.info(f"      - ✅ Successful: {self.processed_count - self.failed_count}")
         self.logger.info(f"      - ⏭️ Skipped (duplicates): {self.skipped_count}")
+        self.logger.info(f"      - 🔄 Recrawled (stale): {self.recrawl_count}")
+        self.logger.info(f"      - ♻️ Served from conditional cache: {self.cache_hits}")
+        if self.resumed_count:
+            self.logger.info(f"      - ⏯️ Resumed from interrupted job: {self.resumed_count}")
         self.logger.info(f"      - ❌ Failed: {self.failed_count}")
         if remaining_file:
             self.logger.info(f"      - 🔁 Remaining file: {remaining_file}")
@@ -1330,15 +1356,33 @@ class ProductFetcher(Spider):
         self.logger.info(f"      - Success rate: {success_rate:.1f}%")
         self.logger.info(f"      - Total time: {self.format_time(elapsed)}")
         self.logger.info(f"      - Average speed: {rate:.2f} URLs/sec")
-        
+        stats = self.crawler.stats.get_stats() if getattr(self, 'crawler', None) else {}
+        for key, value in stats.items():
+            if key.startswith('adaptive_concurrency/') and key.endswith('/max_concurrency'):
+                slot = key[len('adaptive_concurrency/'):-len('/max_concurrency')]
+                self.logger.info(f"      - 🎚️ {slot}: peak concurrency {value}, last delay {stats.get(f'adaptive_concurrency/{slot}/delay', 0)}s")
+
         if self.sitemap_urls_count:
             self.logger.info(f"   📚 Sitemaps processed: {len(self.sitemap_urls_count)}")
         
         self.logger.info("=" * 70)
 
-        if self.success_db_conn:
+        if self.success_store:
             try:
-                self.success_db_conn.commit()
-                self.success_db_conn.close()
+                self.success_store.close()
             except Exception as e:
                 self.logger.error(f"❌ Error closing persistent dedup store: {e}")
+
+        if self.http_cache:
+            try:
+                self.http_cache.close()
+            except Exception as e:
+                self.logger.error(f"❌ Error closing conditional request cache: {e}")
+
+        if self.frontier:
+            try:
+                self.frontier.close(finished=(reason == 'finished'))
+                if reason != 'finished':
+                    self.logger.info(f"⏸️ Crawl state kept for resume ({reason}): {self.frontier.key}")
+            except Exception as e:
+                self.logger.error(f"❌ Error closing crawl state: {e}")
@@ -92,6 +92,12 @@ def main():
                        help='Enable verbose logging with progress updates')
     parser.add_argument('--urls-file', default='',
                        help='Optional file (csv/json/txt) with URLs for direct retry mode')
+    parser.add_argument('--recrawl-ttl-hours', type=float, default=float(os.getenv('RECRAWL_TTL_HOURS', '0') or 0),
+                       help='Re-scrape already successful URLs older than this many hours (0 = only when sitemap lastmod advances)')
+    parser.add_argument('--no-resume', action='store_true', default=False,
+                       help='Do not record or resume crawl state (CRAWL_RESUME=0)')
+    parser.add_argument('--fresh-crawl', action='store_true', default=False,
+                       help='Discard the saved state of an interrupted crawl and start it over')
     
     args = parser.parse_args()
     
@@ -148,6 +154,8 @@ def main():
     
     logger.info(f"🚀 Starting scraper for: {args.website_url}")
     logger.info(f"📁 Output will be saved to: {output_file}")
+    if os.getenv('PARQUET_EXPORT', '1').strip().lower() not in ('0', 'false', 'no'):
+        logger.info(f"🧱 Typed copy (needs pyarrow): {os.path.splitext(output_file)[0]}.parquet")
     logger.info(f"⚙️ Job parameters: offset={args.sitemap_offset}, max_sitemaps={args.max_sitemaps}, max_urls_per_sitemap={args.max_urls_per_sitemap}")
     logger.info(f"🔧 Concurrency: {max_workers} workers, delay={download_delay}s")
 
@@ -170,7 +178,10 @@ def main():
             max_urls_per_sitemap=args.max_urls_per_sitemap,
             job_id=args.job_id,
             output_dir=args.output_dir,
-            verbose=args.verbose
+            verbose=args.verbose,
+            recrawl_ttl_hours=args.recrawl_ttl_hours,
+            resume=not args.no_resume and os.getenv('CRAWL_RESUME', '1') != '0',
+            fresh_crawl=args.fresh_crawl
         )
     else:
         process.crawl(ProductFetcher,
@@ -180,7 +191,10 @@ def main():
                       max_urls_per_sitemap=args.max_urls_per_sitemap,
                       job_id=args.job_id,
                       output_dir=args.output_dir,
-                      verbose=args.verbose)
+                      verbose=args.verbose,
+                      recrawl_ttl_hours=args.recrawl_ttl_hours,
+                      resume=not args.no_resume and os.getenv('CRAWL_RESUME', '1') != '0',
+                      fresh_crawl=args.fresh_crawl)
     process.start()
     logger.info(f"✅ Scraping completed. Output saved to: {output_file}")
     return output_file
@@ -33,6 +33,7 @@ import scrapy
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 from fetcher.product_fetcher import ProductFetcher
+from utils.parquet_pipeline import merge_parquet_files, parquet_path_for
 
 class AshleyURLSpider(scrapy.Spider):
     """Fast parallel URL fetcher from manufacturer API"""
@@ -235,6 +236,14 @@ def validate_urls_file(file_path):
         traceback.print_exc()
         return []
 
+PRODUCT_FEED_FIELDS = [
+    'Ref Product URL', 'Ref Product ID', 'Ref Variant ID', 'Ref Category',
+    'Ref Category URL', 'Ref Brand Name', 'Ref Product Name', 'Ref SKU',
+    'Ref MPN', 'Ref GTIN', 'Ref Price', 'Ref Main Image', 'Ref Quantity',
+    'Ref Group Attr 1', 'Ref Group Attr 2', 'Ref Images', 'Ref Dimensions',
+    'Ref Status', 'Ref Highlights', 'Date Scrapped'
+]
+
 def run_scraper_chunk(chunk_id, total_chunks, chunk_urls, output_dir, job_id, manufacturer_id, 
                      product_concurrency, sitemap_offset, max_sitemaps, max_urls_per_sitemap):
     chunk_output = f'{output_dir}/output_ashley_{manufacturer_id}_{job_id}_chunk_{chunk_id}.csv'
@@ -254,28 +263,7 @@ def run_scraper_chunk(chunk_id, total_chunks, chunk_urls, output_dir, job_id, ma
     settings.set('ROBOTSTXT_OBEY', False)
     settings.set('LOG_LEVEL', 'INFO')
     settings.set('LOG_STDOUT', True)
-    settings.set('FEED_EXPORT_FIELDS', [
-        'Ref Product URL',
-        'Ref Product ID', 
-        'Ref Variant ID',
-        'Ref Category',
-        'Ref Category URL',
-        'Ref Brand Name',
-        'Ref Product Name',
-        'Ref SKU',
-        'Ref MPN',
-        'Ref GTIN',
-        'Ref Price',
-        'Ref Main Image',
-        'Ref Quantity',
-        'Ref Group Attr 1',
-        'Ref Group Attr 2',
-        'Ref Images',
-        'Ref Dimensions',
-        'Ref Status',
-        'Ref Highlights',
-        'Date Scrapped'
-    ])
+    settings.set('FEED_EXPORT_FIELDS', PRODUCT_FEED_FIELDS)
     settings.set('DUPEFILTER_CLASS', 'scrapy.dupefilters.RFPDupeFilter')
     
     process = CrawlerProcess(settings)
@@ -299,6 +287,97 @@ def run_scraper_chunk(chunk_id, total_chunks, chunk_urls, output_dir, job_id, ma
         logger.error(f"Chunk {chunk_id + 1}/{total_chunks}: Failed - {e}")
         return None
 
+def run_scraper_single_reactor(chunks, output_dir, job_id, manufacturer_id, product_concurrency,
+                               sitemap_offset, max_sitemaps, max_urls_per_sitemap):
+    """
+    Scrape all chunks with one crawler in this process.
+
+    Requests from every chunk share one scheduler (and one success store, HTTP cache and
+    concurrency controller); ChunkRoutingMiddleware tags each item with its chunk and one
+    FEEDS entry per chunk keeps the per-chunk CSV layout of the multi-process mode.
+    Returns the chunk output paths.
+    """
+    chunk_outputs = [f'{output_dir}/output_ashley_{manufacturer_id}_{job_id}_chunk_{i}.csv' for i in range(len(chunks))]
+    total_concurrency = product_concurrency * len(chunks)
+    logger.info(f"Single reactor: {len(chunks)} chunks, {sum(len(c) for c in chunks)} URLs, up to {total_concurrency} concurrent requests")
+
+    settings = get_project_settings()
+    settings.set('FEEDS', {
+        chunk_output: {
+            'format': 'csv',
+            'fields': PRODUCT_FEED_FIELDS,
+            'item_filter': 'utils.chunk_routing.ChunkItemFilter',
+            'chunk_id': i,
+        }
+        for i, chunk_output in enumerate(chunk_outputs)
+    })
+    settings.set('CONCURRENT_REQUESTS', total_concurrency)
+    # Starting point per host; AdaptiveConcurrency raises it up to CONCURRENT_REQUESTS while the site keeps up
+    settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', min(product_concurrency, 12))
+    settings.set('ADAPTIVE_CONCURRENCY_MAX', total_concurrency)
+    settings.set('REACTOR_THREADPOOL_MAXSIZE', max(10, len(chunks) * 2))
+    settings.set('DOWNLOAD_DELAY', 0.2)
+    settings.set('RANDOMIZE_DOWNLOAD_DELAY', True)
+    settings.set('DOWNLOAD_TIMEOUT', 30)
+    settings.set('RETRY_ENABLED', True)
+    settings.set('RETRY_TIMES', 1)
+    settings.set('RETRY_HTTP_CODES', [405, 429, 500, 502, 503, 504, 400, 403, 404, 408])
+    settings.set('COOKIES_ENABLED', True)
+    settings.set('ROBOTSTXT_OBEY', False)
+    settings.set('LOG_LEVEL', 'INFO')
+    settings.set('LOG_STDOUT', True)
+    settings.set('DUPEFILTER_CLASS', 'scrapy.dupefilters.RFPDupeFilter')
+
+    process = CrawlerProcess(settings)
+    process.crawl(ProductFetcher,
+                 website_url="https://colemanfurniture.com",
+                 url_chunks=chunks,
+                 is_ashley=True,
+                 chunk_mode=False,
+                 total_chunks=len(chunks),
+                 sitemap_offset=sitemap_offset,
+                 max_sitemaps=max_sitemaps,
+                 max_urls_per_sitemap=max_urls_per_sitemap,
+                 job_id=job_id)
+    process.start()
+    return chunk_outputs
+
+def merge_chunk_outputs(chunk_files, combined_output):
+    """Concatenate chunk CSVs (same header) into one file row by row; returns the row count, or None if no chunk had output."""
+    import csv
+
+    total_products = 0
+    header = None
+    with open(combined_output, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        for i, chunk_file in enumerate(chunk_files):
+            if not os.path.exists(chunk_file):
+                continue
+            try:
+                with open(chunk_file, newline='', encoding='utf-8') as f:
+                    reader = csv.reader(f)
+                    chunk_header = next(reader, None)
+                    if chunk_header is None:
+                        continue
+                    if header is None:
+                        header = chunk_header
+                        writer.writerow(header)
+                    elif chunk_header != header:
+                        logger.error(f"  - Chunk {i + 1} has different columns, skipped: {chunk_file}")
+                        continue
+                    products_in_chunk = 0
+                    for row in reader:
+                        writer.writerow(row)
+                        products_in_chunk += 1
+                total_products += products_in_chunk
+                logger.info(f"  + Chunk {i + 1}: {products_in_chunk} products")
+            except Exception as e:
+                logger.error(f"  - Failed to read chunk {i + 1}: {e}")
+    if header is None:
+        os.remove(combined_output)
+        return None
+    return total_products
+
 def split_into_chunks(url_list, chunk_size):
     chunks = []
     for i in range(0, len(url_list), chunk_size):
@@ -319,6 +398,8 @@ def main():
     
     parser.add_argument('--product-chunks', type=int, default=1, help='Number of parallel chunks for product scraping')
     parser.add_argument('--chunk-size', type=int, default=0, help='Number of URLs per chunk (0 = auto-calculate)')
+    parser.add_argument('--single-reactor', action='store_true',
+                        help='Scrape all product chunks with one crawler in this process instead of one process per chunk')
     
     parser.add_argument('--job-id', default='ashley', help='Job identifier')
     parser.add_argument('--output-dir', default='output', help='Output directory')
@@ -394,6 +475,7 @@ def main():
         logger.info(f"Parallel chunks: {args.product_chunks}")
         logger.info(f"URLs per chunk: {args.chunk_size if args.chunk_size > 0 else 'auto'}")
         logger.info(f"Concurrency per chunk: {args.product_concurrency}")
+        logger.info(f"Runner: {'single reactor' if args.single_reactor else 'one process per chunk'}")
         logger.info("="*60)
         
         if not os.path.exists(args.urls_file):
@@ -429,13 +511,7 @@ def main():
             settings.set('RETRY_TIMES', 1)
             settings.set('COOKIES_ENABLED', True)
             settings.set('ROBOTSTXT_OBEY', False)
-            settings.set('FEED_EXPORT_FIELDS', [
-                'Ref Product URL', 'Ref Product ID', 'Ref Variant ID', 'Ref Category',
-                'Ref Category URL', 'Ref Brand Name', 'Ref Product Name', 'Ref SKU',
-                'Ref MPN', 'Ref GTIN', 'Ref Price', 'Ref Main Image', 'Ref Quantity',
-                'Ref Group Attr 1', 'Ref Group Attr 2', 'Ref Images', 'Ref Dimensions',
-                'Ref Status', 'Ref Highlights', 'Date Scrapped'
-            ])
+            settings.set('FEED_EXPORT_FIELDS', PRODUCT_FEED_FIELDS)
             settings.set('DUPEFILTER_CLASS', 'scrapy.dupefilters.RFPDupeFilter')
             
             process = CrawlerProcess(settings)
@@ -470,26 +546,36 @@ def main():
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             job_timestamp = f"{args.job_id}_{timestamp}"
             
-            processes = []
-            chunk_outputs = []
+            chunk_outputs = [
+                f'{args.output_dir}/output_ashley_{args.manufacturer_id}_{job_timestamp}_chunk_{i}.csv'
+                for i in range(len(chunks))
+            ]
             
             start_time = time.time()
             
-            for i, chunk_urls in enumerate(chunks):
-                p = Process(target=run_scraper_chunk, args=(
-                    i, len(chunks), chunk_urls, args.output_dir, job_timestamp, 
-                    args.manufacturer_id, args.product_concurrency,
-                    args.sitemap_offset, args.max_sitemaps, args.max_urls_per_sitemap
-                ))
-                processes.append(p)
-                p.start()
-                logger.info(f"Started process for chunk {i + 1}/{len(chunks)} ({len(chunk_urls)} URLs)")
+            if args.single_reactor:
+                run_scraper_single_reactor(
+                    chunks, args.output_dir, job_timestamp, args.manufacturer_id,
+                    args.product_concurrency, args.sitemap_offset, args.max_sitemaps,
+                    args.max_urls_per_sitemap
+                )
+            else:
+                processes = []
+                for i, chunk_urls in enumerate(chunks):
+                    p = Process(target=run_scraper_chunk, args=(
+                        i, len(chunks), chunk_urls, args.output_dir, job_timestamp, 
+                        args.manufacturer_id, args.product_concurrency,
+                        args.sitemap_offset, args.max_sitemaps, args.max_urls_per_sitemap
+                    ))
+                    processes.append(p)
+                    p.start()
+                    logger.info(f"Started process for chunk {i + 1}/{len(chunks)} ({len(chunk_urls)} URLs)")
+                    
+                    time.sleep(0.5)
                 
-                time.sleep(0.5)
-            
-            for i, p in enumerate(processes):
-                p.join()
-                logger.info(f"Completed process for chunk {i + 1}/{len(chunks)}")
+                for i, p in enumerate(processes):
+                    p.join()
+                    logger.info(f"Completed process for chunk {i + 1}/{len(chunks)}")
             
             end_time = time.time()
             elapsed = end_time - start_time
@@ -499,48 +585,26 @@ def main():
             logger.info("="*60)
             logger.info(f"Merging chunk outputs...")
             
-            all_dfs = []
-            total_products = 0
-            
-            try:
-                import pandas as pd
-                has_pandas = True
-            except ImportError:
-                has_pandas = False
-                logger.warning("pandas not installed, skipping merge. Chunk files are available separately.")
-            
-            if has_pandas:
-                for i in range(len(chunks)):
-                    chunk_file = f'{args.output_dir}/output_ashley_{args.manufacturer_id}_{job_timestamp}_chunk_{i}.csv'
-                    if os.path.exists(chunk_file):
-                        try:
-                            df = pd.read_csv(chunk_file)
-                            all_dfs.append(df)
-                            products_in_chunk = len(df)
-                            total_products += products_in_chunk
-                            logger.info(f"  + Chunk {i + 1}: {products_in_chunk} products")
-                        except Exception as e:
-                            logger.error(f"  - Failed to read chunk {i + 1}: {e}")
-                
-                if all_dfs:
-                    combined_df = pd.concat(all_dfs, ignore_index=True)
-                    combined_df.to_csv(combined_output, index=False)
-                    logger.info(f"Combined {total_products} products into {combined_output}")
-                else:
-                    logger.error("No chunk outputs found!")
-                    combined_output = None
+            total_products = merge_chunk_outputs(chunk_outputs, combined_output)
+            if total_products is not None:
+                logger.info(f"Combined {total_products} products into {combined_output}")
             else:
+                logger.error("No chunk outputs found!")
                 combined_output = None
-                logger.info("Chunk files are available in the output directory:")
-                for i in range(len(chunks)):
-                    chunk_file = f'{args.output_dir}/output_ashley_{args.manufacturer_id}_{job_timestamp}_chunk_{i}.csv'
-                    if os.path.exists(chunk_file):
-                        logger.info(f"  - {chunk_file}")
+
+            combined_parquet = None
+            if combined_output:
+                combined_parquet = parquet_path_for(combined_output)
+                parquet_rows = merge_parquet_files([parquet_path_for(f) for f in chunk_outputs], combined_parquet)
+                if parquet_rows is not None:
+                    logger.info(f"Combined {parquet_rows} products into {combined_parquet}")
+                else:
+                    combined_parquet = None
             
             logger.info("="*60)
             logger.info(f"SCRAPE COMPLETED")
             logger.info(f"   Total URLs: {total_urls}")
-            logger.info(f"   Parallel chunks: {len(chunks)}")
+            logger.info(f"   Parallel chunks: {len(chunks)} ({'single reactor' if args.single_reactor else 'one process each'})")
             logger.info(f"   Time elapsed: {elapsed:.2f} seconds ({elapsed/60:.2f} minutes)")
             if combined_output:
                 logger.info(f"   Combined output: {combined_output}")
@@ -548,6 +612,8 @@ def main():
             
             if combined_output:
                 print(f"OUTPUT_FILE={combined_output}")
+            if combined_parquet:
+                print(f"PARQUET_FILE={combined_parquet}")
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()
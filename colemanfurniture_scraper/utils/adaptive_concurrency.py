@@ -0,0 +1,242 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+from protego import Protego
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no")
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class SlotWindow:
+    """What one download slot did since the last control tick."""
+
+    def __init__(self):
+        self.latencies = []
+        self.responses = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.left = 0
+        self.retry_after = 0.0
+
+    @property
+    def failures(self) -> int:
+        # Requests that left the downloader without a response: timeouts, connection errors
+        return max(0, self.left - self.responses)
+
+
+class AdaptiveConcurrency:
+    """
+    Feedback controller for per-domain (download slot) concurrency.
+
+    Every ADAPTIVE_CONCURRENCY_INTERVAL seconds each active slot is adjusted from what
+    it saw in that window:
+
+    - any 429/503, or more than ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE 5xx/failed
+      requests: concurrency is halved and the delay raised to the largest
+      Retry-After seen (a 429/503 with Retry-After also backs off immediately);
+    - p95 latency above ADAPTIVE_CONCURRENCY_TARGET_LATENCY: concurrency - 1;
+    - otherwise, if the slot had enough traffic to judge: concurrency + 1 and the
+      delay halves back down to its floor.
+
+    The delay never goes below the robots.txt Crawl-delay of the host (when
+    ADAPTIVE_CONCURRENCY_ROBOTS is on) or ADAPTIVE_CONCURRENCY_MIN_DELAY, and
+    concurrency stays within ADAPTIVE_CONCURRENCY_MIN..ADAPTIVE_CONCURRENCY_MAX.
+    It replaces AutoThrottle, which would fight it over slot.delay.
+
+    Current concurrency, delay, p95 latency and throughput per slot are kept in the
+    crawler stats under adaptive_concurrency/<slot>/...
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.interval = settings.getfloat('ADAPTIVE_CONCURRENCY_INTERVAL', float(os.getenv('ADAPTIVE_CONCURRENCY_INTERVAL', '10')))
+        self.min_concurrency = max(1, settings.getint('ADAPTIVE_CONCURRENCY_MIN', int(os.getenv('ADAPTIVE_CONCURRENCY_MIN', '1'))))
+        self.max_concurrency = max(self.min_concurrency, settings.getint(
+            'ADAPTIVE_CONCURRENCY_MAX', int(os.getenv('ADAPTIVE_CONCURRENCY_MAX', '0')) or settings.getint('CONCURRENT_REQUESTS', 16)
+        ))
+        self.target_latency = settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', float(os.getenv('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', '2.0')))
+        self.max_error_rate = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE', float(os.getenv('ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE', '0.05')))
+        self.min_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MIN_DELAY', float(os.getenv('ADAPTIVE_CONCURRENCY_MIN_DELAY', '0')))
+        self.max_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_DELAY', float(os.getenv('ADAPTIVE_CONCURRENCY_MAX_DELAY', '60')))
+        self.obey_robots = settings.getbool('ADAPTIVE_CONCURRENCY_ROBOTS', _env_flag('ADAPTIVE_CONCURRENCY_ROBOTS'))
+        self.user_agent = settings.get('USER_AGENT') or '*'
+
+        self.windows = defaultdict(SlotWindow)
+        self.crawl_delays = {}  # netloc -> robots.txt Crawl-delay (0 when none); present once fetched or requested
+        self.slot_hosts = {}    # slot key -> netloc
+        self.cooldown_until = {}
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED', _env_flag('ADAPTIVE_CONCURRENCY')):
+            raise NotConfigured
+        if crawler.settings.getbool('AUTOTHROTTLE_ENABLED'):
+            logger.warning("AutoThrottle and adaptive concurrency are both enabled; AutoThrottle will also set slot delays")
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(ext.request_left_downloader, signal=signals.request_left_downloader)
+        return ext
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.adjust)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.adjust()
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        if key is None:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def request_left_downloader(self, request, spider):
+        key = request.meta.get('download_slot')
+        if key is not None and not request.meta.get('adaptive_concurrency_robots'):
+            self.windows[key].left += 1
+
+    def response_downloaded(self, response, request, spider):
+        key, slot = self._slot(request)
+        if key is None or request.meta.get('adaptive_concurrency_robots'):
+            return
+        window = self.windows[key]
+        window.responses += 1
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            window.latencies.append(latency)
+
+        netloc = urlparse(response.url).netloc
+        self.slot_hosts.setdefault(key, netloc)
+        if self.obey_robots and netloc and netloc not in self.crawl_delays:
+            self._fetch_crawl_delay(response.url, netloc)
+
+        if response.status in THROTTLE_STATUSES:
+            window.throttled += 1
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after:
+                window.retry_after = max(window.retry_after, retry_after)
+                # Back off now rather than at the next tick; the server said how long to wait
+                if slot is not None and time.time() >= self.cooldown_until.get(key, 0):
+                    self.cooldown_until[key] = time.time() + retry_after
+                    slot.concurrency = max(self.min_concurrency, slot.concurrency // 2)
+                    slot.delay = min(self.max_delay, max(slot.delay, retry_after))
+                    logger.info(f"⏸️ {key}: HTTP {response.status} Retry-After {retry_after:.0f}s -> concurrency {slot.concurrency}, delay {slot.delay:.2f}s")
+        elif response.status >= 500:
+            window.server_errors += 1
+
+    def _fetch_crawl_delay(self, url, netloc):
+        self.crawl_delays[netloc] = 0.0
+        parsed = urlparse(url)
+        robots_request = Request(
+            f"{parsed.scheme}://{netloc}/robots.txt",
+            priority=1000,
+            dont_filter=True,
+            meta={'dont_obey_robotstxt': True, 'adaptive_concurrency_robots': True, 'handle_httpstatus_all': True},
+        )
+        dfd = self.crawler.engine.download(robots_request)
+        dfd.addCallback(self._parse_robots, netloc)
+        dfd.addErrback(lambda failure: logger.debug(f"robots.txt for {netloc} unavailable: {failure.value}"))
+
+    def _parse_robots(self, response, netloc):
+        if response.status != 200:
+            return
+        # Protego (Scrapy's robots.txt parser) takes fractional Crawl-delay values, unlike urllib.robotparser
+        parser = Protego.parse(response.text)
+        delay = parser.crawl_delay(self.user_agent)
+        rate = parser.request_rate(self.user_agent)
+        if rate and rate.requests:
+            delay = max(delay or 0, rate.seconds / rate.requests)
+        if delay:
+            self.crawl_delays[netloc] = float(delay)
+            logger.info(f"🤖 {netloc}: robots.txt crawl-delay {float(delay):.2f}s")
+
+    def _delay_floor(self, key) -> float:
+        return max(self.min_delay, self.crawl_delays.get(self.slot_hosts.get(key), 0.0))
+
+    def adjust(self):
+        stats = self.crawler.stats
+        engine = self.crawler.engine
+        if engine is None or engine.downloader is None:
+            return
+        windows, self.windows = self.windows, defaultdict(SlotWindow)
+        total = 0
+        for key, window in windows.items():
+            slot = engine.downloader.slots.get(key)
+            if slot is None:
+                continue
+            total += window.responses
+            before = (slot.concurrency, slot.delay)
+            floor = self._delay_floor(key)
+            latencies = sorted(window.latencies)
+            p95 = percentile(latencies, 0.95)
+            attempts = max(window.left, window.responses)
+            error_rate = (window.server_errors + window.failures) / attempts if attempts else 0.0
+
+            if window.throttled or error_rate > self.max_error_rate:
+                if time.time() >= self.cooldown_until.get(key, 0):
+                    slot.concurrency = max(self.min_concurrency, slot.concurrency // 2)
+                slot.delay = max(slot.delay, floor, window.retry_after or slot.delay * 2 or 0.25)
+                stats.inc_value('adaptive_concurrency/decreases')
+            elif latencies and p95 > self.target_latency:
+                slot.concurrency = max(self.min_concurrency, slot.concurrency - 1)
+                stats.inc_value('adaptive_concurrency/decreases')
+            elif window.responses >= min(slot.concurrency, 5) and time.time() >= self.cooldown_until.get(key, 0):
+                slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+                slot.delay = floor if slot.delay / 2 < floor + 0.01 else slot.delay / 2
+                stats.inc_value('adaptive_concurrency/increases')
+            slot.delay = min(self.max_delay, max(floor, slot.delay))
+
+            throughput = window.responses / self.interval if self.interval else 0.0
+            stats.set_value(f'adaptive_concurrency/{key}/concurrency', slot.concurrency)
+            stats.set_value(f'adaptive_concurrency/{key}/delay', round(slot.delay, 3))
+            stats.set_value(f'adaptive_concurrency/{key}/p95_latency_ms', int(p95 * 1000))
+            stats.set_value(f'adaptive_concurrency/{key}/throughput', round(throughput, 2))
+            stats.max_value(f'adaptive_concurrency/{key}/max_concurrency', slot.concurrency)
+            if (slot.concurrency, slot.delay) != before:
+                logger.info(
+                    f"🎚️ {key}: concurrency {before[0]} -> {slot.concurrency}, delay {before[1]:.2f}s -> {slot.delay:.2f}s "
+                    f"({window.responses} responses, p95 {p95 * 1000:.0f} ms, {window.throttled} throttled, error rate {error_rate:.1%})"
+                )
+        stats.set_value('adaptive_concurrency/throughput', round(total / self.interval, 2) if self.interval else 0.0)
@@ -0,0 +1,38 @@
+from scrapy import Request
+
+CHUNK_FIELD = '_chunk'
+
+
+class ChunkRoutingMiddleware:
+    """
+    Spider middleware that tags items with the chunk of the request they came from.
+
+    Used when several URL chunks share one crawler: start requests carry
+    meta['chunk_id'] and meta['chunk_route'], requests scheduled from a response
+    (bundle products) inherit both, and every dict item gets CHUNK_FIELD so
+    ChunkItemFilter can send it to that chunk's feed. CHUNK_FIELD is not in
+    FEED_EXPORT_FIELDS, so it never reaches the output files.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        if not response.meta.get('chunk_route'):
+            yield from result
+            return
+        chunk_id = response.meta.get('chunk_id')
+        for entry in result:
+            if isinstance(entry, Request):
+                entry.meta.setdefault('chunk_route', True)
+                entry.meta.setdefault('chunk_id', chunk_id)
+            elif isinstance(entry, dict):
+                entry[CHUNK_FIELD] = chunk_id
+            yield entry
+
+
+class ChunkItemFilter:
+    """FEEDS item_filter that only accepts items tagged with the feed's `chunk_id` option."""
+
+    def __init__(self, feed_options):
+        self.chunk_id = (feed_options or {}).get('chunk_id')
+
+    def accepts(self, item):
+        return isinstance(item, dict) and item.get(CHUNK_FIELD) == self.chunk_id
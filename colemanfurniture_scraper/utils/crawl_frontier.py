@@ -0,0 +1,214 @@
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+FINISHED = 'finished'
+PENDING = 'pending'
+DONE = 'done'
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CrawlFrontier:
+    """
+    Disk-backed request frontier for one crawl, identified by `key`.
+
+    Every product request the spider schedules is recorded as pending, marked done
+    once its response reaches the spider and dropped if it fails for good (it is in
+    the remaining file then). Every source, i.e. a sitemap or the input URL list, is
+    marked read once all of its URLs are recorded. When a crawl stops before
+    finishing (time limit, SIGTERM), the next crawl with the same key reloads the
+    pending requests and the sitemap list instead of rediscovering them, and only
+    re-reads sources that were not finished. A crawl that finishes clears its rows,
+    so the next run with that key starts fresh. On ephemeral CI runners the database
+    only carries over through the workflow's cache step (colemanfurniture.yml saves
+    output/crawl_state_*.sqlite3 per crawl key).
+
+    Writes are buffered and committed in batches or every `flush_interval` seconds.
+    """
+
+    def __init__(self, db_path: str, key: str, batch_size: int = 200, flush_interval: float = 5.0):
+        self.db_path = db_path
+        self.key = key
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self._adds = []
+        self._done = []
+        self._discards = []
+        self._last_flush = time.time()
+        self._known = set()
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._ensure_schema()
+
+        row = self.conn.execute("SELECT state FROM crawl_jobs WHERE key = ?", (key,)).fetchone()
+        self.resumed = row is not None and row[0] != FINISHED
+        if self.resumed:
+            self._known = {r[0] for r in self.conn.execute("SELECT normalized_url FROM frontier WHERE key = ?", (key,))}
+        else:
+            self.reset()
+        self._seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier WHERE key = ?", (key,)).fetchone()[0]
+
+    def _ensure_schema(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_jobs (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                job_id TEXT,
+                sitemaps_json TEXT,
+                started_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                key TEXT NOT NULL,
+                normalized_url TEXT NOT NULL,
+                url TEXT NOT NULL,
+                meta_json TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (key, normalized_url)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frontier_key_state_seq ON frontier (key, state, seq)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS frontier_sources (
+                key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                urls INTEGER NOT NULL,
+                read_at TEXT NOT NULL,
+                PRIMARY KEY (key, source)
+            )
+        """)
+        self.conn.commit()
+
+    def reset(self):
+        """Forget everything recorded under this key."""
+        with self.conn:
+            self.conn.execute("DELETE FROM frontier WHERE key = ?", (self.key,))
+            self.conn.execute("DELETE FROM frontier_sources WHERE key = ?", (self.key,))
+            self.conn.execute("DELETE FROM crawl_jobs WHERE key = ?", (self.key,))
+        self._known.clear()
+        self._adds.clear()
+        self._done.clear()
+        self._discards.clear()
+        self.resumed = False
+
+    def start(self, job_id: str, sitemaps: Optional[List[str]] = None):
+        """Record the crawl as running; the sitemap list is only stored by the first job of a crawl."""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO crawl_jobs (key, state, job_id, sitemaps_json, started_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET state = excluded.state, job_id = excluded.job_id, updated_at = excluded.updated_at
+                """,
+                (self.key, RUNNING, job_id, json.dumps(sitemaps) if sitemaps is not None else None, _now(), _now())
+            )
+
+    def saved_sitemaps(self) -> Optional[List[str]]:
+        row = self.conn.execute("SELECT sitemaps_json FROM crawl_jobs WHERE key = ?", (self.key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def __contains__(self, normalized_url: str) -> bool:
+        return normalized_url in self._known
+
+    def add(self, url: str, normalized_url: str, meta: dict) -> bool:
+        """Record a scheduled request; False when this crawl already has the URL."""
+        if normalized_url in self._known:
+            return False
+        self._known.add(normalized_url)
+        self._seq += 1
+        self._adds.append((self.key, normalized_url, url, json.dumps(meta, default=str), PENDING, self._seq))
+        self._maybe_flush()
+        return True
+
+    def mark_done(self, normalized_url: str):
+        if normalized_url in self._known:
+            self._done.append((DONE, self.key, normalized_url))
+            self._maybe_flush()
+
+    def discard(self, normalized_url: str):
+        """Drop a request that failed for good; it goes to the remaining file, and may be scheduled again if seen again."""
+        if normalized_url in self._known:
+            self._known.discard(normalized_url)
+            self._discards.append((self.key, normalized_url))
+            # Failures are rare; flushing now keeps a later re-add of the same URL from being deleted by this batch
+            self.flush()
+
+    def mark_source_read(self, source: str, urls: int):
+        # Flush first: a source must never be marked read before the URLs found in it are stored
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO frontier_sources (key, source, urls, read_at) VALUES (?, ?, ?, ?)",
+                (self.key, source, int(urls), _now())
+            )
+
+    def read_sources(self) -> set:
+        """Sitemaps (or URL lists) whose URLs are all in the frontier."""
+        return {r[0] for r in self.conn.execute("SELECT source FROM frontier_sources WHERE key = ?", (self.key,))}
+
+    def iter_pending(self) -> Iterator[Tuple[str, dict]]:
+        """(url, meta) of every request recorded but not finished, in scheduling order."""
+        self.flush()
+        cursor = self.conn.execute(
+            "SELECT url, meta_json FROM frontier WHERE key = ? AND state = ? ORDER BY seq",
+            (self.key, PENDING)
+        )
+        for url, meta_json in cursor.fetchall():
+            yield url, json.loads(meta_json)
+
+    def counts(self) -> dict:
+        self.flush()
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM frontier WHERE key = ? GROUP BY state", (self.key,)).fetchall()
+        return {state: n for state, n in rows}
+
+    def _maybe_flush(self):
+        if len(self._adds) + len(self._done) + len(self._discards) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.time()
+        if not self._adds and not self._done and not self._discards:
+            return
+        with self.conn:
+            if self._adds:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (key, normalized_url, url, meta_json, state, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._adds
+                )
+            if self._done:
+                self.conn.executemany("UPDATE frontier SET state = ? WHERE key = ? AND normalized_url = ?", self._done)
+            if self._discards:
+                self.conn.executemany("DELETE FROM frontier WHERE key = ? AND normalized_url = ?", self._discards)
+            self.conn.execute("UPDATE crawl_jobs SET updated_at = ? WHERE key = ?", (_now(), self.key))
+        self._adds.clear()
+        self._done.clear()
+        self._discards.clear()
+
+    def close(self, finished: bool = False):
+        """Flush; a finished crawl drops its rows so the next run with this key starts over."""
+        try:
+            self.flush()
+            if finished:
+                with self.conn:
+                    self.conn.execute("DELETE FROM frontier WHERE key = ?", (self.key,))
+                    self.conn.execute("DELETE FROM frontier_sources WHERE key = ?", (self.key,))
+                    self.conn.execute("UPDATE crawl_jobs SET state = ?, updated_at = ? WHERE key = ?", (FINISHED, _now(), self.key))
+        finally:
+            self.conn.close()
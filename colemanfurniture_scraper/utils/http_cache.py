@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionalCacheStore:
+    """
+    Validators and last parsed item per normalized product URL.
+
+    Entries are only written after a page parsed into an item, so any entry can be
+    replayed when the server answers 304 or returns a byte-identical body.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 100):
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self._pending = {}
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                normalized_url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT,
+                item_json TEXT NOT NULL,
+                bundle_urls_json TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, normalized_url: str) -> Optional[dict]:
+        row = self._pending.get(normalized_url)
+        if row is None:
+            row = self.conn.execute(
+                """
+                SELECT normalized_url, etag, last_modified, body_hash, item_json, bundle_urls_json, updated_at
+                FROM http_cache WHERE normalized_url = ?
+                """,
+                (normalized_url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'etag': row[1],
+            'last_modified': row[2],
+            'body_hash': row[3],
+            'item': json.loads(row[4]),
+            'bundle_urls': json.loads(row[5]) if row[5] else [],
+        }
+
+    def put(self, normalized_url: str, validators: dict, item: dict, bundle_urls: List[str]):
+        self._pending[normalized_url] = (
+            normalized_url,
+            validators.get('etag'),
+            validators.get('last_modified'),
+            validators.get('body_hash'),
+            json.dumps(item, default=str),
+            json.dumps(bundle_urls),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        )
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO http_cache (normalized_url, etag, last_modified, body_hash, item_json, bundle_urls_json, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(normalized_url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    body_hash = excluded.body_hash,
+                    item_json = excluded.item_json,
+                    bundle_urls_json = excluded.bundle_urls_json,
+                    updated_at = excluded.updated_at
+                """,
+                list(self._pending.values())
+            )
+        self._pending.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+
+def _header(response, name: str) -> Optional[str]:
+    value = response.headers.get(name)
+    if not value:
+        return None
+    return value.decode('latin-1') if isinstance(value, bytes) else str(value)
+
+
+class ConditionalCacheMiddleware:
+    """
+    Downloader middleware that turns product requests into conditional GETs.
+
+    Works on requests with meta['conditional_cache'] when the spider exposes a
+    ConditionalCacheStore as `spider.http_cache`. On a 304, or a 200 whose body hash
+    matches the stored one, the stored item is put in meta['cached_item'] (and the
+    304 is passed on as a 200) so the callback can re-emit it without parsing.
+    Otherwise the new validators are left in meta['http_cache_validators'] for the
+    callback to store with the freshly parsed item.
+
+    Sits below HttpCompressionMiddleware (590) so bodies are hashed decompressed.
+    """
+
+    def process_request(self, request, spider):
+        store = getattr(spider, 'http_cache', None)
+        if store is None or not request.meta.get('conditional_cache'):
+            return None
+        entry = store.get(spider.normalize_url(request.meta.get('url', request.url)))
+        if entry is None:
+            return None
+        request.meta['http_cache_entry'] = entry
+        if entry.get('etag'):
+            request.headers.setdefault('If-None-Match', entry['etag'])
+        if entry.get('last_modified'):
+            request.headers.setdefault('If-Modified-Since', entry['last_modified'])
+        return None
+
+    def process_response(self, request, response, spider):
+        if getattr(spider, 'http_cache', None) is None or not request.meta.get('conditional_cache'):
+            return response
+        entry = request.meta.get('http_cache_entry')
+
+        if response.status == 304 and entry is not None:
+            request.meta['http_cache'] = 'not_modified'
+            request.meta['cached_item'] = entry['item']
+            request.meta['cached_bundle_urls'] = entry['bundle_urls']
+            return response.replace(status=200)
+
+        if response.status == 200:
+            body_hash = hashlib.sha1(response.body).hexdigest()
+            request.meta['http_cache_validators'] = {
+                'etag': _header(response, 'ETag'),
+                'last_modified': _header(response, 'Last-Modified'),
+                'body_hash': body_hash,
+            }
+            if entry is not None and entry.get('body_hash') == body_hash:
+                request.meta['http_cache'] = 'unchanged'
+                request.meta['cached_item'] = entry['item']
+                request.meta['cached_bundle_urls'] = entry['bundle_urls']
+        return response
@@ -0,0 +1,124 @@
+import json
+import logging
+import weakref
+from typing import Any, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json is used otherwise
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+LD_JSON_XPATH = '//script[@type="application/ld+json"]/text()'
+HYPERNOVA_APP_XPATH = '//script[@data-hypernova-key="App"]/text()'
+PRODUCT_TYPES = ('Product', 'ProductGroup')
+
+
+def loads_json(text):
+    """Decode JSON with orjson when it is installed, falling back to json for anything it rejects (NaN, huge ints)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def strip_html_comment(text: str) -> str:
+    """Hypernova payloads are wrapped in <!-- ... --> inside the script tag."""
+    text = text.strip()
+    if text.startswith('<!--'):
+        text = text[4:]
+    if text.endswith('-->'):
+        text = text[:-3]
+    return text.strip()
+
+
+def _has_product_type(data: dict) -> bool:
+    data_type = data.get('@type')
+    if isinstance(data_type, str):
+        return 'Product' in data_type
+    if isinstance(data_type, list):
+        return any('Product' in str(t) for t in data_type)
+    return False
+
+
+class ProductPageData:
+    """
+    Embedded JSON of one product page, decoded once.
+
+    Holds every ld+json block and the hypernova App payload; the extractors in
+    ProductFetcher read from here instead of re-running the script XPaths and
+    json.loads for every field.
+    """
+
+    def __init__(self, response):
+        self.url = response.url
+        self.ld_json: List[Any] = []
+        for script in response.xpath(LD_JSON_XPATH).getall():
+            try:
+                self.ld_json.append(loads_json(script.strip()))
+            except ValueError as e:
+                logger.debug(f"Error parsing JSON-LD: {e}")
+
+        self.app: Optional[dict] = None
+        app_script = response.xpath(HYPERNOVA_APP_XPATH).get()
+        if app_script:
+            try:
+                data = loads_json(strip_html_comment(app_script))
+                if isinstance(data, dict):
+                    self.app = data
+            except ValueError as e:
+                logger.debug(f"Error parsing hypernova App payload: {e}")
+
+        self.ld_products = [d for d in self.ld_json if isinstance(d, dict) and d.get('@type') in PRODUCT_TYPES]
+        self.ld_breadcrumbs = [d for d in self.ld_json if isinstance(d, dict) and d.get('@type') == 'BreadcrumbList']
+
+        app_data = self.app.get('data') if self.app is not None else None
+        content = app_data.get('content') if isinstance(app_data, dict) else None
+        self.content = content if isinstance(content, dict) else {}
+        product_layouts = self.content.get('productLayouts')
+        simple_items = product_layouts.get('simpleItems') if isinstance(product_layouts, dict) else None
+        self.simple_items = [item for item in simple_items or [] if isinstance(item, dict)]
+
+        current_url = self.url.rstrip('/')
+        self.current_items = [
+            item for item in self.simple_items
+            if current_url and (item.get('url') or '').rstrip('/') == current_url
+        ]
+
+    @property
+    def has_product_json(self) -> bool:
+        """Same test the spider used to decide a page is a product: a Product-typed ld+json block."""
+        for data in self.ld_json:
+            if isinstance(data, dict):
+                if data.get('@type'):
+                    if _has_product_type(data):
+                        return True
+                elif data.get('name') and (data.get('offers') or data.get('sku')):
+                    return True
+            elif isinstance(data, list):
+                if any(isinstance(item, dict) and item.get('@type') and _has_product_type(item) for item in data):
+                    return True
+        return False
+
+    def current_item_value(self, key: str):
+        """First truthy `key` among the simpleItems whose url is this page."""
+        for item in self.current_items:
+            value = item.get(key)
+            if value:
+                return value
+        return None
+
+
+_page_cache = weakref.WeakKeyDictionary()
+
+
+def get_page_data(response) -> ProductPageData:
+    """ProductPageData for `response`, built on first use and dropped with the response."""
+    page = _page_cache.get(response)
+    if page is None:
+        page = ProductPageData(response)
+        _page_cache[response] = page
+    return page
@@ -0,0 +1,249 @@
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from scrapy.exceptions import NotConfigured
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: without pyarrow the crawl only writes the CSV feeds
+    pa = None
+    pq = None
+
+from utils.chunk_routing import CHUNK_FIELD
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+FLOAT_FIELDS = ('Ref Price',)
+INT_FIELDS = ('Ref Quantity',)
+TIMESTAMP_FIELDS = ('Date Scrapped',)
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no")
+
+
+def build_schema(fields: List[str]):
+    """Arrow schema for the feed columns: numbers and dates typed, everything else string."""
+    columns = []
+    for name in fields:
+        if name in FLOAT_FIELDS:
+            columns.append(pa.field(name, pa.float64()))
+        elif name in INT_FIELDS:
+            columns.append(pa.field(name, pa.int64()))
+        elif name in TIMESTAMP_FIELDS:
+            columns.append(pa.field(name, pa.timestamp('s')))
+        else:
+            columns.append(pa.field(name, pa.string()))
+    return pa.schema(columns)
+
+
+def _to_float(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).replace('$', '').replace(',', '').strip()
+    return float(value) if value else None
+
+
+def _to_int(value) -> Optional[int]:
+    if isinstance(value, int):
+        return value
+    value = str(value).replace(',', '').strip()
+    return int(float(value)) if value else None
+
+
+def _to_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    return datetime.strptime(value, DATE_FORMAT) if value else None
+
+
+def _to_string(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+CONVERTERS = {name: _to_float for name in FLOAT_FIELDS}
+CONVERTERS.update({name: _to_int for name in INT_FIELDS})
+CONVERTERS.update({name: _to_timestamp for name in TIMESTAMP_FIELDS})
+
+
+def parquet_path_for(feed_uri: str) -> Optional[str]:
+    """Local path of the Parquet file that goes next to a feed, or None for remote/templated feeds."""
+    if feed_uri.startswith('file://'):
+        feed_uri = feed_uri[len('file://'):]
+    elif '://' in feed_uri or '%(' in feed_uri:
+        return None
+    return os.path.splitext(feed_uri)[0] + '.parquet'
+
+
+def merge_parquet_files(paths: List[str], output: str, compression: str = 'zstd') -> Optional[int]:
+    """
+    Concatenate Parquet files with the same schema row group by row group; returns the
+    row count, or None (nothing written) when pyarrow is missing or no file exists.
+    """
+    if pq is None:
+        return None
+    writer = None
+    rows = 0
+    try:
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            parquet_file = pq.ParquetFile(path)
+            if writer is None:
+                writer = pq.ParquetWriter(output + '.tmp', parquet_file.schema_arrow, compression=compression)
+            elif not parquet_file.schema_arrow.equals(writer.schema):
+                logger.error(f"Different columns, not merged: {path}")
+                continue
+            for i in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(i)
+                writer.write_table(table)
+                rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return None
+    os.replace(output + '.tmp', output)
+    return rows
+
+
+class ParquetTarget:
+    """One Parquet file: buffered columns flushed as a record batch (one row group) every batch_size rows."""
+
+    def __init__(self, path: str, fields: List[str], chunk_id, batch_size: int, compression: str):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.fields = fields
+        self.chunk_id = chunk_id
+        self.batch_size = batch_size
+        self.compression = compression
+        self.schema = build_schema(fields)
+        self.columns = {name: [] for name in fields}
+        self.buffered = 0
+        self.rows = 0
+        self.invalid = 0
+        self.writer = None
+
+    def accepts(self, item: dict) -> bool:
+        return self.chunk_id is None or item.get(CHUNK_FIELD) == self.chunk_id
+
+    def add(self, item: dict):
+        for name in self.fields:
+            value = item.get(name)
+            if value is None or value == '':
+                self.columns[name].append(None)
+                continue
+            convert = CONVERTERS.get(name, _to_string)
+            try:
+                self.columns[name].append(convert(value))
+            except (TypeError, ValueError):
+                self.invalid += 1
+                self.columns[name].append(None)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(self.columns[name], type=self.schema.field(name).type) for name in self.fields],
+            schema=self.schema
+        )
+        if self.writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=self.compression)
+        self.writer.write_batch(batch)
+        self.rows += self.buffered
+        self.buffered = 0
+        self.columns = {name: [] for name in self.fields}
+
+    def close(self):
+        self.flush()
+        if self.writer is None:
+            # Same as the CSV exporter with FEED_STORE_EMPTY: an empty feed still gets a file with the header/schema
+            pq.write_table(self.schema.empty_table(), self.tmp_path, compression=self.compression)
+        else:
+            self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class ParquetExportPipeline:
+    """
+    Item pipeline that writes every CSV feed a second time as a typed Parquet file.
+
+    Each local FEEDS entry (or FEED_URI) gets <feed name>.parquet next to it, with one
+    column per feed field (the feed's `fields` or FEED_EXPORT_FIELDS), in that order.
+    Ref Price is float64, Ref Quantity int64 and Date Scrapped a timestamp; other
+    columns are strings, and empty or unparseable values are null. Chunk feeds
+    (`chunk_id` option, see utils.chunk_routing) only get their chunk's items.
+
+    Rows are buffered and written as one record batch / row group every
+    PARQUET_BATCH_SIZE items, compressed with PARQUET_COMPRESSION (zstd). Files are
+    written under a .tmp name and moved into place when the spider closes, so a
+    .parquet file is always complete. Needs pyarrow; PARQUET_EXPORT=0 turns it off.
+    """
+
+    def __init__(self, targets: List[ParquetTarget]):
+        self.targets = targets
+        self.stats = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PARQUET_EXPORT_ENABLED', _env_flag('PARQUET_EXPORT')):
+            raise NotConfigured
+        if pa is None:
+            logger.warning("pyarrow is not installed; writing CSV feeds only")
+            raise NotConfigured
+
+        feeds = dict(settings.getdict('FEEDS'))
+        if not feeds and settings.get('FEED_URI'):
+            feeds = {settings.get('FEED_URI'): {'format': settings.get('FEED_FORMAT', 'csv')}}
+        default_fields = settings.getlist('FEED_EXPORT_FIELDS')
+        batch_size = max(1, settings.getint('PARQUET_BATCH_SIZE', int(os.getenv('PARQUET_BATCH_SIZE', '1000'))))
+        compression = settings.get('PARQUET_COMPRESSION', os.getenv('PARQUET_COMPRESSION', 'zstd'))
+
+        targets = []
+        for uri, options in feeds.items():
+            options = options or {}
+            fields = list(options.get('fields') or default_fields)
+            path = parquet_path_for(str(uri))
+            if path is None or not fields:
+                logger.info(f"Parquet export skipped for feed {uri} (not a local file or no fixed field list)")
+                continue
+            targets.append(ParquetTarget(path, fields, options.get('chunk_id'), batch_size, compression))
+        if not targets:
+            raise NotConfigured
+
+        pipeline = cls(targets)
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def process_item(self, item, spider):
+        if isinstance(item, dict):
+            for target in self.targets:
+                if target.accepts(item):
+                    target.add(item)
+        return item
+
+    def close_spider(self, spider):
+        for target in self.targets:
+            try:
+                target.close()
+            except Exception as e:
+                logger.error(f"❌ Failed to write {target.path}: {e}")
+                continue
+            if self.stats is not None:
+                self.stats.inc_value('parquet_export/rows', target.rows)
+                self.stats.inc_value('parquet_export/invalid_values', target.invalid)
+            logger.info(f"🧱 {target.path}: {target.rows} rows" + (f", {target.invalid} values not parseable" if target.invalid else ""))
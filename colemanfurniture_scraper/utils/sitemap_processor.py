@@ -1,25 +1,114 @@
 import requests
 import xml.etree.ElementTree as ET
-import gzip
-from typing import List
-from urllib.parse import urljoin
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
 from .proxy_manager import ProxyManager
 import logging
 import time
 import sys
 
 logger = logging.getLogger(__name__)
+
+SITEMAP_READ_CHUNK = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+SitemapEntry = Tuple[str, str, Optional[str], Optional[str]]  # kind ('url'/'sitemap'), loc, lastmod, changefreq
+
+
+def iter_sitemap_entries(chunks: Iterable[bytes]) -> Iterator[SitemapEntry]:
+    """
+    Incrementally parse a sitemap or sitemap index from byte chunks, gzip-compressed
+    or plain (detected from the first bytes). Each <url>/<sitemap> entry is yielded as
+    soon as its closing tag is decoded and then cleared, so neither the decompressed
+    document nor its element tree is ever held in memory.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    decompressor = None
+    state = {'root': None, 'sniffed': False}
+
+    def drain():
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if state['root'] is None:
+                    state['root'] = elem
+                continue
+            kind = elem.tag.rsplit('}', 1)[-1]
+            if kind not in ('url', 'sitemap'):
+                continue
+            fields = {}
+            for child in elem:
+                fields[child.tag.rsplit('}', 1)[-1]] = (child.text or '').strip() or None
+            if fields.get('loc'):
+                yield kind, fields['loc'], fields.get('lastmod'), fields.get('changefreq')
+            elem.clear()
+            if state['root'] is not None:
+                state['root'].clear()
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not state['sniffed']:
+            state['sniffed'] = True
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor is None:
+            parser.feed(chunk)
+            yield from drain()
+            continue
+        # Bound each inflate step: sitemaps compress ~30x, so one network chunk can be megabytes of XML
+        while chunk:
+            parser.feed(decompressor.decompress(chunk, SITEMAP_READ_CHUNK))
+            chunk = decompressor.unconsumed_tail
+            yield from drain()
+    if decompressor:
+        parser.feed(decompressor.flush())
+    parser.close()
+    yield from drain()
+
+
+def iter_bytes(data: bytes, size: int = SITEMAP_READ_CHUNK) -> Iterator[bytes]:
+    """Slice an in-memory body into chunks for iter_sitemap_entries."""
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        yield bytes(view[start:start + size])
+
+
 class SitemapProcessor:
+    """
+    Finds a site's sitemap index and lists its sitemaps.
+
+    Discovery results (the sitemap URL from robots.txt and the sitemap list from the
+    index) are cached per host in SITEMAP_CACHE_DIR, so chunk jobs of one run share a
+    single discovery. Entries younger than SITEMAP_CACHE_TTL seconds are used as-is;
+    older ones are revalidated with If-None-Match / If-Modified-Since.
+    """
+    
+    COMMON_SITEMAP_PATHS = [
+        '/sitemap.xml',
+        '/sitemap_index.xml',
+        '/sitemap/sitemap.xml',
+        '/sitemap/sitemap_index.xml',
+        '/sitemap.xml.gz',
+        '/sitemap_index.xml.gz',
+    ]
     
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None, cache_ttl: Optional[float] = None):
         self.proxy_manager = None
+        self.cache_dir = os.getenv('SITEMAP_CACHE_DIR', os.path.join('output', 'sitemap_cache')) if cache_dir is None else cache_dir
+        self.cache_ttl = float(os.getenv('SITEMAP_CACHE_TTL', '21600')) if cache_ttl is None else float(cache_ttl)
 
     def _get_proxy_manager(self):
         if self.proxy_manager is None:
             self.proxy_manager = ProxyManager()
         return self.proxy_manager
     
-    def _make_request_with_proxy(self, url: str, proxy: str = None, max_retries: int = 2) -> requests.Response:
+    def _make_request_with_proxy(self, url: str, proxy: str = None, max_retries: int = 2, stream: bool = False,
+                                 extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
         for attempt in range(max_retries):
             try:
                 headers = {
@@ -27,17 +116,21 @@ class SitemapProcessor:
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                     'Accept-Language': 'en-US,en;q=0.5',
                 }
+                if extra_headers:
+                    headers.update(extra_headers)
                 
                 proxies = None
                 if proxy:
                     proxies = {"http": proxy, "https": proxy}
                     logger.debug(f"Attempt {attempt + 1} with proxy: {proxy}")
                 
-                response = requests.get(url, headers=headers, timeout=15, proxies=proxies)
+                response = requests.get(url, headers=headers, timeout=15, proxies=proxies, stream=stream)
                 
-                if response.status_code == 200:
+                if response.status_code in (200, 304):
                     return response
-                elif response.status_code in [403, 429]:
+                if stream:
+                    response.close()
+                if response.status_code in [403, 429]:
                     logger.warning(f"Blocked with proxy {proxy}, status {response.status_code}")
                     if attempt < max_retries - 1:
                         time.sleep(1)
@@ -49,121 +142,182 @@ class SitemapProcessor:
                     time.sleep(1)
         
         raise Exception(f"Failed to fetch {url} after {max_retries} attempts")
+
+    def _proxy_for(self, url: str, purpose: str) -> Optional[str]:
+        if 'homegallerystores.com' not in url:
+            return None
+        proxy = self._get_proxy_manager().get_proxy_for_homegallery()
+        if proxy:
+            logger.info(f"Using proxy for HomeGallery {purpose}: {proxy}")
+        return proxy
+
+    def _fetch(self, url: str, proxy: Optional[str], stream: bool = False,
+               extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Fetch through the proxy when one is set, falling back to a direct request."""
+        if proxy:
+            try:
+                return self._make_request_with_proxy(url, proxy, stream=stream, extra_headers=extra_headers)
+            except Exception as e:
+                logger.warning(f"Failed with proxy, trying without: {e}")
+        return self._make_request_with_proxy(url, None, stream=stream, extra_headers=extra_headers)
+
+    def _cache_path(self, site_url: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        host = urlparse(site_url).netloc.lower() or site_url
+        return os.path.join(self.cache_dir, f"{re.sub(r'[^a-z0-9._-]', '_', host)}.json")
+
+    def _load_cache(self, site_url: str) -> dict:
+        path = self._cache_path(site_url)
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable sitemap cache {path}: {e}")
+            return {}
+
+    def _save_cache(self, site_url: str, key: str, entry: dict):
+        path = self._cache_path(site_url)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cache = self._load_cache(site_url)
+            cache[key] = entry
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write sitemap cache {path}: {e}")
+
+    def _is_fresh(self, entry: Optional[dict]) -> bool:
+        return bool(entry) and (time.time() - entry.get('fetched_at', 0)) < self.cache_ttl
+
+    @staticmethod
+    def _conditional_headers(entry: Optional[dict]) -> Dict[str, str]:
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def _validators(response: requests.Response) -> dict:
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+
+    def _probe_common_paths(self, site_url: str, proxy: Optional[str]) -> Optional[str]:
+        """Probe every common sitemap path at once; the earliest path in the list that answers wins."""
+        candidates = [urljoin(site_url + '/', path.lstrip('/')) for path in self.COMMON_SITEMAP_PATHS]
+
+        def probe(sitemap_url):
+            try:
+                response = self._make_request_with_proxy(sitemap_url, proxy, stream=True)
+            except Exception as e:
+                logger.debug(f"Failed for {sitemap_url}: {e}")
+                return False
+            try:
+                content_type = response.headers.get('content-type', '').lower()
+                return any(x in content_type for x in ['xml', 'gzip', 'octet-stream'])
+            finally:
+                response.close()
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            found = list(executor.map(probe, candidates))
+        for sitemap_url, ok in zip(candidates, found):
+            if ok:
+                logger.info(f"Found sitemap at common path: {sitemap_url}")
+                return sitemap_url
+        return None
     
     def get_sitemap_from_robots(self, site_url: str) -> str:
         site_url = site_url.rstrip('/')
         robots_url = urljoin(site_url + '/', 'robots.txt')
         
-        logger.info(f"Checking robots.txt at: {robots_url}")
-        
-        use_proxy = 'homegallerystores.com' in site_url
-        proxy = None
+        cached = self._load_cache(site_url).get('robots')
+        if cached and cached.get('sitemap_url') and self._is_fresh(cached):
+            logger.info(f"Using cached sitemap URL for {site_url}: {cached['sitemap_url']}")
+            return cached['sitemap_url']
         
-        if use_proxy:
-            proxy_manager = self._get_proxy_manager()
-            proxy = proxy_manager.get_proxy_for_homegallery()
-            if proxy:
-                logger.info(f"Using proxy for HomeGallery: {proxy}")
+        logger.info(f"Checking robots.txt at: {robots_url}")
+        proxy = self._proxy_for(site_url, 'robots.txt')
+        conditional = self._conditional_headers(cached) if cached and cached.get('sitemap_url') else {}
         
         try:
-            response = self._make_request_with_proxy(robots_url, proxy)
+            response = self._fetch(robots_url, proxy, extra_headers=conditional)
+            if response.status_code == 304:
+                cached['fetched_at'] = time.time()
+                self._save_cache(site_url, 'robots', cached)
+                logger.info(f"robots.txt unchanged, using cached sitemap URL: {cached['sitemap_url']}")
+                return cached['sitemap_url']
             for line in response.text.split('\n'):
                 line = line.strip()
                 if line.lower().startswith('sitemap:'):
                     sitemap_url = line.split(':', 1)[1].strip()
                     logger.info(f"Found sitemap in robots.txt: {sitemap_url}")
+                    self._save_cache(site_url, 'robots', dict(self._validators(response), sitemap_url=sitemap_url))
                     return sitemap_url
         except Exception as e:
-            logger.warning(f"Failed to get robots.txt with proxy: {e}")
-            if use_proxy and proxy:
-                try:
-                    logger.info("Trying without proxy...")
-                    response = self._make_request_with_proxy(robots_url, None)
-                    for line in response.text.split('\n'):
-                        line = line.strip()
-                        if line.lower().startswith('sitemap:'):
-                            sitemap_url = line.split(':', 1)[1].strip()
-                            logger.info(f"Found sitemap in robots.txt (no proxy): {sitemap_url}")
-                            return sitemap_url
-                except Exception as e2:
-                    logger.warning(f"Failed to get robots.txt without proxy: {e2}")
-        
-        common_paths = [
-            '/sitemap.xml',
-            '/sitemap_index.xml',
-            '/sitemap/sitemap.xml',
-            '/sitemap/sitemap_index.xml',
-            '/sitemap.xml.gz',
-            '/sitemap_index.xml.gz',
-        ]
+            logger.warning(f"Failed to get robots.txt: {e}")
         
         logger.info("Trying common sitemap paths...")
-        for path in common_paths:
-            sitemap_url = urljoin(site_url + '/', path.lstrip('/'))
-            try:
-                response = self._make_request_with_proxy(sitemap_url, proxy)
-                content_type = response.headers.get('content-type', '').lower()
-                if any(x in content_type for x in ['xml', 'gzip', 'octet-stream']):
-                    logger.info(f"Found sitemap at common path: {sitemap_url}")
-                    return sitemap_url
-            except Exception as e:
-                logger.debug(f"Failed for {sitemap_url}: {e}")
-                continue
+        sitemap_url = self._probe_common_paths(site_url, proxy)
+        if sitemap_url:
+            self._save_cache(site_url, 'robots', {'sitemap_url': sitemap_url, 'fetched_at': time.time()})
+            return sitemap_url
         
         raise ValueError(f"No sitemap found for {site_url}")
     
     def extract_all_sitemaps(self, main_sitemap_url: str) -> List[str]:
-        logger.info(f"Extracting sitemaps from: {main_sitemap_url}")
-        
-        use_proxy = 'homegallerystores.com' in main_sitemap_url
-        proxy = None
+        cached = self._load_cache(main_sitemap_url).get('index')
+        if cached and cached.get('url') != main_sitemap_url:
+            cached = None
+        if cached and self._is_fresh(cached):
+            logger.info(f"Using {len(cached['sitemaps'])} cached sitemaps for {main_sitemap_url}")
+            return list(cached['sitemaps'])
         
-        if use_proxy:
-            proxy_manager = self._get_proxy_manager()
-            proxy = proxy_manager.get_proxy_for_homegallery()
-            if proxy:
-                logger.info(f"Using proxy for HomeGallery sitemap extraction: {proxy}")
+        logger.info(f"Extracting sitemaps from: {main_sitemap_url}")
+        proxy = self._proxy_for(main_sitemap_url, 'sitemap extraction')
         
         try:
-            if use_proxy and proxy:
-                try:
-                    response = self._make_request_with_proxy(main_sitemap_url, proxy)
-                    return self._parse_sitemap_response(response, main_sitemap_url)
-                except Exception as e:
-                    logger.warning(f"Failed with proxy, trying without: {e}")
-            
-            response = self._make_request_with_proxy(main_sitemap_url, None)
-            return self._parse_sitemap_response(response, main_sitemap_url)
+            response = self._fetch(main_sitemap_url, proxy, stream=True, extra_headers=self._conditional_headers(cached))
+            if response.status_code == 304:
+                response.close()
+                cached['fetched_at'] = time.time()
+                self._save_cache(main_sitemap_url, 'index', cached)
+                logger.info(f"Sitemap index unchanged, using {len(cached['sitemaps'])} cached sitemaps")
+                return list(cached['sitemaps'])
+            validators = self._validators(response)
+            sitemaps = self._parse_sitemap_response(response, main_sitemap_url)
+            self._save_cache(main_sitemap_url, 'index', dict(validators, url=main_sitemap_url, sitemaps=sitemaps))
+            return sitemaps
             
         except Exception as e:
             logger.error(f"Failed to extract sitemaps from {main_sitemap_url}: {e}")
             raise Exception(f"Failed to parse sitemap {main_sitemap_url}: {e}")
     
     def _parse_sitemap_response(self, response: requests.Response, main_sitemap_url: str) -> List[str]:
-        content = response.content
-        
-        try:
-            if (main_sitemap_url.endswith('.gz') or 
-                response.headers.get('content-encoding') == 'gzip'):
-                content = gzip.decompress(content)
-        except:
-            pass
-        
-        root = ET.fromstring(content)
-        ns = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-        
         sitemaps = []
-        for sitemap in root.findall('ns:sitemap/ns:loc', ns):
-            if sitemap.text:
-                sitemaps.append(sitemap.text.strip())
+        urls = []
+        try:
+            # iter_content undoes Content-Encoding; a .gz body is still gzip and is sniffed by the parser
+            for kind, loc, _, _ in iter_sitemap_entries(response.iter_content(chunk_size=SITEMAP_READ_CHUNK)):
+                if kind == 'sitemap':
+                    sitemaps.append(loc)
+                elif not sitemaps:
+                    urls.append(loc)
+        finally:
+            response.close()
         
         if not sitemaps:
-            for url in root.findall('ns:url/ns:loc', ns):
-                if url.text:
-                    sitemaps.append(url.text.strip())
-            
-            if not sitemaps:
-                sitemaps = [main_sitemap_url]
+            sitemaps = urls or [main_sitemap_url]
         
         logger.info(f"Extracted {len(sitemaps)} sitemaps/URLs")
         return sitemaps
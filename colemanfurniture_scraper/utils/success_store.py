@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import struct
+from datetime import datetime
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOOM_MAGIC = b'SBF2'
+BLOOM_HEADER = struct.Struct('<4sQIQqQ')  # magic, bits, hashes, items, max rowid covered, capacity
+LEGACY_BLOOM_MAGIC = b'SBF1'
+LEGACY_BLOOM_HEADER = struct.Struct('<4sQIQq')  # SBF1 files have no capacity field
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over a bytearray, using double hashing of one blake2b digest."""
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytearray] = None, count: int = 0,
+                 capacity: Optional[int] = None):
+        self.num_bits = max(8, int(num_bits))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+        # Items the filter was sized for; past it the false-positive rate climbs
+        self.capacity = int(capacity) if capacity else int(self.num_bits * math.log(2) / self.num_hashes)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.001) -> 'BloomFilter':
+        capacity = max(1000, int(capacity))
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes, capacity=capacity)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SuccessUrlStore:
+    """
+    Persistent record of successfully scraped URLs for one domain.
+
+    Membership goes through a Bloom filter saved next to the SQLite file, so opening
+    the store reads one fixed-size file instead of every URL; a filter hit is
+    confirmed with a primary-key lookup. Rows added since the filter was saved (for
+    example by a run that was killed) are folded in on open by rowid. Writes are
+    buffered and inserted in batches.
+
+    `capacity` only sizes a new filter. The filter's own capacity is saved in its
+    header; once it holds more URLs than that (on open or during a run) it is rebuilt
+    from the table with room for twice the current count.
+    """
+
+    def __init__(self, db_path: str, domain: str, capacity: int = 2_000_000,
+                 error_rate: float = 0.001, batch_size: int = 200):
+        self.db_path = db_path
+        self.domain = domain.lower()
+        self.batch_size = max(1, int(batch_size))
+        self.error_rate = error_rate
+        self.bloom_path = f"{db_path}.{self.domain.replace('.', '_')}.bloom"
+        self._pending = {}  # normalized_url -> row tuple waiting for the next batch insert
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._ensure_schema()
+
+        self.bloom, self.bloom_rowid = self._load_bloom(capacity)
+        added = self._catch_up_bloom()
+        if self._grow_bloom_if_full():
+            added = self.bloom.count
+        logger.info(f"Success filter ready: {self.bloom.count} URLs, {len(self.bloom.bits) / 1024 / 1024:.1f} MB ({added} caught up)")
+
+    def _ensure_schema(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS successful_urls (
+                domain TEXT NOT NULL,
+                normalized_url TEXT NOT NULL,
+                first_success_at TEXT NOT NULL,
+                job_id TEXT,
+                PRIMARY KEY (domain, normalized_url)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_successful_urls_domain
+            ON successful_urls(domain)
+        """)
+        # Stores created before the recrawl policy only have first_success_at
+        existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(successful_urls)")}
+        for column in ('last_success_at', 'lastmod', 'changefreq'):
+            if column not in existing_columns:
+                cursor.execute(f"ALTER TABLE successful_urls ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+    def _new_bloom(self, capacity: int):
+        return BloomFilter.for_capacity(capacity, self.error_rate), 0
+
+    def _load_bloom(self, capacity: int):
+        try:
+            with open(self.bloom_path, 'rb') as f:
+                data = f.read()
+            if data[:4] == LEGACY_BLOOM_MAGIC:
+                magic, num_bits, num_hashes, count, max_rowid = LEGACY_BLOOM_HEADER.unpack_from(data)
+                bits = bytearray(data[LEGACY_BLOOM_HEADER.size:])
+                filter_capacity = None  # derived from the filter's size
+            else:
+                magic, num_bits, num_hashes, count, max_rowid, filter_capacity = BLOOM_HEADER.unpack_from(data)
+                bits = bytearray(data[BLOOM_HEADER.size:])
+            if magic not in (BLOOM_MAGIC, LEGACY_BLOOM_MAGIC) or len(bits) != (num_bits + 7) // 8:
+                raise ValueError("unrecognised filter file")
+            return BloomFilter(num_bits, num_hashes, bits, count, filter_capacity), max_rowid
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring success filter {self.bloom_path}: {e}")
+        return self._new_bloom(capacity)
+
+    def _catch_up_bloom(self) -> int:
+        """Add rows with a rowid above the one the filter was saved at; streams, never loads the table."""
+        added = 0
+        max_rowid = self.bloom_rowid
+        cursor = self.conn.execute(
+            "SELECT rowid, normalized_url FROM successful_urls WHERE domain = ? AND rowid > ? ORDER BY rowid",
+            (self.domain, self.bloom_rowid)
+        )
+        for rowid, normalized_url in cursor:
+            if normalized_url:
+                self.bloom.add(normalized_url)
+                added += 1
+            max_rowid = rowid
+        self.bloom_rowid = max_rowid
+        return added
+
+    def _grow_bloom_if_full(self) -> bool:
+        """Rebuild the filter from the table with 2x headroom once it holds more than its capacity."""
+        if self.bloom.count <= self.bloom.capacity:
+            return False
+        logger.info(f"Success filter holds {self.bloom.count} URLs (capacity {self.bloom.capacity}); rebuilding larger")
+        self.bloom, self.bloom_rowid = self._new_bloom(self.bloom.count * 2)
+        self._catch_up_bloom()
+        return True
+
+    def save_bloom(self):
+        tmp_path = f"{self.bloom_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.bloom.num_bits, self.bloom.num_hashes, self.bloom.count,
+                                      self.bloom_rowid, self.bloom.capacity))
+            f.write(self.bloom.bits)
+        os.replace(tmp_path, self.bloom_path)
+
+    def __contains__(self, normalized_url: str) -> bool:
+        if normalized_url in self._pending:
+            return True
+        if normalized_url not in self.bloom:
+            return False
+        row = self.conn.execute(
+            "SELECT 1 FROM successful_urls WHERE domain = ? AND normalized_url = ?",
+            (self.domain, normalized_url)
+        ).fetchone()
+        return row is not None
+
+    def get_record(self, normalized_url: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """(last success time, lastmod) as stored text, or None when the URL never succeeded."""
+        pending = self._pending.get(normalized_url)
+        if pending is not None:
+            return pending[4], pending[5]
+        if normalized_url not in self.bloom:
+            return None
+        return self.conn.execute(
+            """
+            SELECT COALESCE(last_success_at, first_success_at), lastmod
+            FROM successful_urls WHERE domain = ? AND normalized_url = ?
+            """,
+            (self.domain, normalized_url)
+        ).fetchone()
+
+    def add(self, normalized_url: str, job_id: str, lastmod: Optional[str] = None, changefreq: Optional[str] = None):
+        now_text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        previous = self._pending.get(normalized_url)
+        if previous is not None:
+            lastmod = lastmod or previous[5]
+            changefreq = changefreq or previous[6]
+        self._pending[normalized_url] = (self.domain, normalized_url, now_text, job_id, now_text, lastmod, changefreq)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        rows = list(self._pending.values())
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO successful_urls (domain, normalized_url, first_success_at, job_id, last_success_at, lastmod, changefreq)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(domain, normalized_url) DO UPDATE SET
+                    last_success_at = excluded.last_success_at,
+                    job_id = excluded.job_id,
+                    lastmod = COALESCE(excluded.lastmod, successful_urls.lastmod),
+                    changefreq = COALESCE(excluded.changefreq, successful_urls.changefreq)
+                """,
+                rows
+            )
+        # New rows get fresh rowids; updates keep theirs and are already in the filter
+        self._catch_up_bloom()
+        self._grow_bloom_if_full()
+        self._pending.clear()
+
+    def close(self):
+        try:
+            self.flush()
+            self.save_bloom()
+        finally:
+            self.conn.close()
@@ -1,5 +1,9 @@
+import csv
+import io
 import os
+import shutil
 import sys
+import tempfile
 import time
 import zipfile
 import traceback
@@ -192,11 +196,307 @@ def safe_read_sql(sql, params, conn_holder, max_retries=5):
             conn_holder[0] = None
             time.sleep(2 ** attempt)
 
+ZIP_FILENAME = "1stopbedrooms_export.zip"
+
+# Set EXPORT_STREAMING=0 to go back to the in-memory pandas export
+EXPORT_STREAMING = os.environ.get("EXPORT_STREAMING", "1").strip().lower() not in ("0", "false", "no")
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", "20000"))
+
+COLUMNS_PRICE = [
+    'Product Name', 'Product Code', 'Barcode', 'Brand', 'Category',
+    'Product Tags', 'Number of Matches', 'My Index', 'My Position',
+    'Cheapest Site', 'Highest Site', 'Minimum Price', 'Maximum Price',
+    'Average Price', 'My Price', 'My Product Cost', 'Additional Cost',
+    'SmartPrice', 'Last Update Cycle', 'Site', 'Site Index', 'Price',
+    'Change direction', 'Stock', 'URL'
+]
+
+COLUMNS_TOTAL_PRICE = [
+    'Product Name', 'Product Code', 'Barcode', 'Brand', 'Category',
+    'Product Tags', 'Number of Matches', 'My Index', 'My Position',
+    'Cheapest Site', 'Highest Site', 'Minimum Price (Total Price)',
+    'Maximum Price (Total Price)', 'Average Price (Total Price)',
+    'My Price', 'My Total Price', 'My Product Cost', 'Additional Cost',
+    'SmartPrice', 'Last Update Cycle', 'Site', 'Site Index', 'Total Price',
+    'Change direction', 'Stock', 'URL'
+]
+
+# One row per offer of google_shopping_sellers `s` ({filter} is a JOIN/WHERE on s) with
+# site_display / is_me falling back to the same rules as get_site_display_and_is_me
+# (domain from seller_url, else the seller name) when the stored columns are empty.
+# Shared with gscraper_pg's google_shopping_product_summary so both agree on is_me.
+OFFER_ROWS_SQL = """
+    SELECT
+        offer_id, product_id, s_name, seller_name, price, seller_url, stock_status, google_position, site_display,
+        COALESCE(
+            stored_is_me,
+            lower(s_name) = '1stopbedrooms' OR lower(split_part(site_display, ' — ', 1)) = '1stopbedrooms.com'
+        ) AS is_me
+    FROM (
+        SELECT
+            *,
+            COALESCE(stored_display, CASE
+                WHEN domain <> '' AND s_name <> '' THEN
+                    CASE WHEN domain = lower(s_name) THEN s_name ELSE domain || ' — ' || s_name END
+                ELSE COALESCE(NULLIF(s_name, ''), domain, '')
+            END) AS site_display
+        FROM (
+            SELECT
+                s.id AS offer_id,
+                s.product_id,
+                btrim(COALESCE(s.seller_name, '')) AS s_name,
+                COALESCE(s.seller_name, '') AS seller_name,
+                s.price::float8 AS price,
+                COALESCE(s.seller_url, '') AS seller_url,
+                COALESCE(s.stock_status, 'In Stock') AS stock_status,
+                s.google_position,
+                NULLIF(s.site_display, '') AS stored_display,
+                s.is_me AS stored_is_me,
+                COALESCE(
+                    NULLIF(replace(lower(substring(btrim(COALESCE(s.seller_url, '')) FROM '^(?:[A-Za-z][A-Za-z0-9+.-]*://)?([^/?#]*)')), 'www.', ''), ''),
+                    replace(lower(COALESCE(s.seller_name, '')), 'www.', '')
+                ) AS domain
+            FROM google_shopping_sellers s
+            {filter}
+        ) raw_offers
+    ) displayed
+"""
+
+# One row per (product, offer) with every per-product figure of the export already
+# computed; offers come from OFFER_ROWS_SQL. A NULL my_index means "-".
+# {stats_cte} is the per-product rollup, see export_sql().
+EXPORT_SQL_TEMPLATE = """
+WITH prods AS (
+    SELECT
+        p.product_id, p.name, p.gtin, p.brand, p.product_type AS category, p.osb_url,
+        p.margin::float8 AS margin, r.google_title, r.updated_at
+    FROM osb_products p
+    JOIN google_shopping_results r ON p.product_id = r.product_id
+    WHERE p.status = 1
+      AND p.scraping_status = 'completed'
+),
+offers AS ({offers}),
+{stats_cte}
+summary AS (
+    SELECT
+        p.*,
+        COALESCE(st.my_price, 0::float8) AS my_price,
+        COALESCE(st.comp_count, 0) AS comp_count,
+        st.comp_min,
+        st.comp_max,
+        COALESCE(st.comp_sum, 0::float8) AS comp_sum,
+        COALESCE(st.cheapest_site, '') AS cheapest_site,
+        COALESCE(st.highest_site, '') AS highest_site
+    FROM prods p
+    LEFT JOIN stats st ON st.product_id = p.product_id
+),
+priced AS (
+    SELECT
+        *,
+        CASE
+            WHEN my_price > 0 AND comp_count > 0 THEN LEAST(comp_min, my_price)
+            WHEN my_price > 0 THEN my_price
+            WHEN comp_count > 0 THEN comp_min
+            ELSE 0::float8
+        END AS min_price,
+        CASE
+            WHEN my_price > 0 AND comp_count > 0 THEN GREATEST(comp_max, my_price)
+            WHEN my_price > 0 THEN my_price
+            WHEN comp_count > 0 THEN comp_max
+            ELSE 0::float8
+        END AS max_price,
+        round((CASE
+            WHEN my_price > 0 THEN (comp_sum + my_price) / (comp_count + 1)
+            WHEN comp_count > 0 THEN comp_sum / comp_count
+            ELSE 0
+        END)::numeric, 2)::float8 AS avg_price
+    FROM summary
+)
+SELECT
+    COALESCE(pr.google_title, pr.name, ''),
+    pr.product_id,
+    COALESCE(pr.gtin, ''),
+    COALESCE(pr.brand, ''),
+    COALESCE(pr.category, ''),
+    pr.comp_count,
+    CASE WHEN pr.avg_price > 0 AND pr.my_price > 0 THEN round((pr.my_price / pr.avg_price * 100)::numeric, 2)::float8 END,
+    CASE
+        WHEN pr.comp_count = 0 THEN 'I am unique'
+        WHEN pr.my_price <= 0 THEN 'N/A'
+        WHEN pr.my_price <= pr.comp_min THEN 'I am cheapest'
+        WHEN pr.my_price >= pr.comp_max THEN 'I am highest'
+        ELSE 'I am in the middle'
+    END,
+    pr.cheapest_site,
+    pr.highest_site,
+    pr.min_price,
+    pr.max_price,
+    pr.avg_price,
+    pr.my_price,
+    CASE
+        WHEN pr.my_price > 0 AND pr.margin IS NOT NULL THEN round((pr.my_price / (pr.margin / 100.0 + 1.0))::numeric, 2)::float8
+        ELSE 0::float8
+    END,
+    pr.updated_at,
+    o.site_display,
+    COALESCE(o.price, 0::float8),
+    o.stock_status,
+    COALESCE(o.seller_url, pr.osb_url, '')
+FROM priced pr
+LEFT JOIN offers o ON o.product_id = pr.product_id
+ORDER BY pr.product_id, o.google_position NULLS LAST
+"""
+
+# Rollup maintained by gscraper_pg.insert_to_postgres
+SUMMARY_STATS_CTE = """stats AS (
+    SELECT
+        ps.product_id, ps.my_price, ps.comp_count, ps.comp_min, ps.comp_max, ps.comp_sum,
+        ps.cheapest_site, ps.highest_site
+    FROM google_shopping_product_summary ps
+    JOIN prods p ON p.product_id = ps.product_id
+),"""
+
+# Fallback for databases where the summary table has not been created yet
+AGGREGATE_STATS_CTE = """stats AS (
+    SELECT
+        product_id,
+        (array_agg(price ORDER BY google_position NULLS LAST) FILTER (WHERE is_me AND price IS NOT NULL))[1] AS my_price,
+        count(price) FILTER (WHERE NOT is_me) AS comp_count,
+        min(price) FILTER (WHERE NOT is_me) AS comp_min,
+        max(price) FILTER (WHERE NOT is_me) AS comp_max,
+        sum(price) FILTER (WHERE NOT is_me) AS comp_sum,
+        (array_agg(site_display ORDER BY price ASC, google_position NULLS LAST) FILTER (WHERE price IS NOT NULL))[1] AS cheapest_site,
+        (array_agg(site_display ORDER BY price DESC, google_position NULLS LAST) FILTER (WHERE price IS NOT NULL))[1] AS highest_site
+    FROM offers
+    GROUP BY product_id
+),"""
+
+def export_sql(conn):
+    """EXPORT_SQL_TEMPLATE reading google_shopping_product_summary when it exists."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('google_shopping_product_summary') IS NOT NULL")
+        has_summary = bool(cursor.fetchone()[0])
+    if not has_summary:
+        print("google_shopping_product_summary not found; aggregating google_shopping_sellers instead.")
+    offers = OFFER_ROWS_SQL.replace("{filter}", "JOIN prods p ON p.product_id = s.product_id")
+    return (EXPORT_SQL_TEMPLATE
+            .replace("{offers}", offers)
+            .replace("{stats_cte}", SUMMARY_STATS_CTE if has_summary else AGGREGATE_STATS_CTE))
+
+def export_file_names():
+    now = datetime.now()
+    date_prefix = now.strftime("%Y.%m.%d-%H%M")
+    ts_ms = int(time.time() * 1000)
+
+    file1_name = f"{date_prefix}_1stopbedrooms_Prisync_Vertical_Report_price_change_stock_{ts_ms}.csv"
+    file2_name = f"{date_prefix}_1stopbedrooms_Prisync_Vertical_Report_total_price_change_stock_{ts_ms + 1}.csv"
+    return file1_name, file2_name
+
+def stream_export_rows(conn, file1, file2, now_dt):
+    """Run the export query through a named cursor and write both report layouts row by row."""
+    writer1 = csv.writer(file1, lineterminator='\n')
+    writer2 = csv.writer(file2, lineterminator='\n')
+    writer1.writerow(COLUMNS_PRICE)
+    writer2.writerow(COLUMNS_TOTAL_PRICE)
+
+    sql = export_sql(conn)
+    rows = 0
+    with conn.cursor(name="gs_export_stream") as cursor:
+        cursor.itersize = EXPORT_FETCH_SIZE
+        cursor.execute(sql)
+        for (name, product_id, gtin, brand, category, comp_count, my_index, my_position,
+             cheapest_site, highest_site, min_price, max_price, avg_price, my_price,
+             my_product_cost, updated_at, site, price, stock, url) in cursor:
+            my_index = '-' if my_index is None else my_index
+            last_update_cycle = format_last_update_cycle(updated_at or now_dt)
+            writer1.writerow([
+                name, product_id, gtin, brand, category, '-', comp_count, my_index, my_position,
+                cheapest_site, highest_site, min_price, max_price, avg_price, my_price,
+                my_product_cost, 0, '-', last_update_cycle, site, '-', price, '-', stock, url,
+            ])
+            writer2.writerow([
+                name, product_id, gtin, brand, category, '-', comp_count, my_index, my_position,
+                cheapest_site, highest_site, '-', '-', '-', my_price, '-',
+                my_product_cost, 0, '-', last_update_cycle, site, '-', price, '-', stock, url,
+            ])
+            rows += 1
+            if rows % 500000 == 0:
+                print(f"  ...streamed {rows} rows")
+    return rows
+
+def build_streaming_export(zip_path, file1_name, file2_name, max_retries=3):
+    """
+    Stream the export straight from PostgreSQL into the ZIP archive.
+
+    File 1 is deflated into the archive as rows arrive; file 2 (same rows, total-price
+    layout) is spooled to a temporary file during the same pass and appended afterwards,
+    so the query runs once and memory stays flat.
+    """
+    for attempt in range(max_retries):
+        conn = None
+        try:
+            conn = get_connection()
+            # Named cursors need a transaction
+            conn.autocommit = False
+            started = time.time()
+            now_dt = datetime.now()
+            with tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8') as spool, \
+                    zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                print("Streaming File 1 into ZIP...")
+                with zipf.open(file1_name, 'w') as raw1:
+                    with io.TextIOWrapper(raw1, encoding='utf-8', newline='') as f1:
+                        rows = stream_export_rows(conn, f1, spool, now_dt)
+                conn.rollback()
+
+                print("Compressing File 2 into ZIP...")
+                spool.seek(0)
+                with zipf.open(file2_name, 'w') as raw2:
+                    with io.TextIOWrapper(raw2, encoding='utf-8', newline='') as f2:
+                        shutil.copyfileobj(spool, f2, 1024 * 1024)
+
+            print(f"✓ Streamed {rows} rows into {zip_path} in {time.time() - started:.1f}s")
+            return True
+        except Exception as e:
+            print(f"Streaming export failed on attempt {attempt+1}/{max_retries}: {e}")
+            traceback.print_exc()
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+    return False
+
+def upload_and_exit(zip_path, zip_filename):
+    # SFTP upload to Oracle server
+    oracle_success = upload_to_oracle_sftp(zip_path, zip_filename)
+    if oracle_success:
+        print("✓ Export and SFTP upload completed successfully!")
+        try:
+            os.remove(zip_path)
+        except Exception as e:
+            print(f"Warning: Failed to remove local ZIP file: {e}")
+        sys.exit(0)
+    else:
+        print("❌ SFTP upload failed.")
+        sys.exit(1)
+
 def main():
     if os.environ.get("ORACLE_SFTP_UPLOAD") != "1":
         print("Skipping export generation and upload because ORACLE_SFTP_UPLOAD is not set to '1'.")
         sys.exit(0)
 
+    if EXPORT_STREAMING:
+        file1_name, file2_name = export_file_names()
+        zip_path = os.path.join(os.getcwd(), ZIP_FILENAME)
+        print(f"Streaming export from PostgreSQL into {ZIP_FILENAME}...")
+        if not build_streaming_export(zip_path, file1_name, file2_name):
+            print("❌ Failed to build ZIP archive.")
+            sys.exit(1)
+        upload_and_exit(zip_path, ZIP_FILENAME)
+
     print("Connecting to PostgreSQL...")
     conn_holder = [None]
     try:
@@ -516,16 +816,10 @@ def main():
     ]
     df2 = df2[cols2]
 
-    # Generate file names
-    now = datetime.now()
-    date_prefix = now.strftime("%Y.%m.%d-%H%M")
-    ts_ms = int(time.time() * 1000)
-
-    file1_name = f"{date_prefix}_1stopbedrooms_Prisync_Vertical_Report_price_change_stock_{ts_ms}.csv"
-    file2_name = f"{date_prefix}_1stopbedrooms_Prisync_Vertical_Report_total_price_change_stock_{ts_ms + 1}.csv"
+    file1_name, file2_name = export_file_names()
 
     # Zip the files directly using stream buffers (prevents writing giant intermediate CSVs to disk)
-    zip_filename = "1stopbedrooms_export.zip"
+    zip_filename = ZIP_FILENAME
     zip_path = os.path.join(os.getcwd(), zip_filename)
     
     print(f"Streaming CSVs directly into ZIP archive {zip_filename}...")
@@ -544,18 +838,7 @@ def main():
         print(f"❌ Failed to build ZIP archive: {e}")
         sys.exit(1)
 
-    # SFTP upload to Oracle server
-    oracle_success = upload_to_oracle_sftp(zip_path, zip_filename)
-    if oracle_success:
-        print("✓ Export and SFTP upload completed successfully!")
-        try:
-            os.remove(zip_path)
-        except Exception as e:
-            print(f"Warning: Failed to remove local ZIP file: {e}")
-        sys.exit(0)
-    else:
-        print("❌ SFTP upload failed.")
-        sys.exit(1)
+    upload_and_exit(zip_path, zip_filename)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 import sys
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, message=".*pandas only supports SQLAlchemy connectable.*")
+import hashlib
 import json
 import random
 import os
@@ -9,6 +10,8 @@ from datetime import datetime
 import threading
 import queue
 from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
 
 try:
     from dotenv import load_dotenv
@@ -49,7 +52,38 @@ DEFAULT_MAX_RUNTIME_HOURS = 5
 DEFAULT_CLAIM_TTL_MINUTES = 480
 DEFAULT_DB_BATCH_SIZE = 50
 DEFAULT_DB_WRITE_PAGE_SIZE = 500
+DEFAULT_DB_WRITE_MODE = "copy"  # "copy" (COPY into temp table + upsert) or "values" (execute_values)
 _CLAIM_COLUMN_SUPPORT = None
+_SUMMARY_TABLE_SUPPORT = None
+_CONTENT_HASH_SUPPORT = None
+
+CLAIM_RETURNING_COLUMNS = (
+    'p.product_id, p.web_id, p.name, p.sku AS mpn_sku, p.gtin, p.brand, p.product_type AS category, '
+    'p.keyword, p.url, p.osb_url, p.status, p.mfr_sales_30d AS "30daymfrsales", p.scraping_status, '
+    'p.claimed_by, p.claimed_at, p.last_attempt, p.error_message, p.created_at, p.updated_at, '
+    'p.color, p.bed_size_measure, p.mattress_size'
+)
+
+# Lease-mode workers claim under "lease:<worker id>"; their short lease TTL only applies to those rows,
+# never to static claims, which are not heartbeated and keep the full claim TTL
+LEASE_CLAIM_PREFIX = "lease:"
+ANY_CLAIM_PATTERN = "%"
+LEASE_CLAIM_PATTERN = LEASE_CLAIM_PREFIX + "%"
+
+RELEASE_EXPIRED_SQL = """
+    UPDATE osb_products
+    SET scraping_status = $1::text,
+        claimed_by = NULL,
+        claimed_at = NULL
+    WHERE product_id IN (
+        SELECT product_id FROM osb_products
+        WHERE scraping_status = $2::text
+          AND claimed_at IS NOT NULL
+          AND claimed_at < (NOW() - $3::int * interval '1 minute')
+          AND COALESCE(claimed_by, '') LIKE $4::text
+        FOR UPDATE SKIP LOCKED
+    )
+"""
 
 def upload_to_ftp(ftp_host, ftp_user, ftp_pass, ftp_path, local_file, remote_filename):
     """Upload a file to the FTP server securely."""
@@ -284,6 +318,243 @@ def extract_mapped_attributes(attributes):
     return mapped
 
 
+GS_RESULT_COLUMNS = [
+    "product_id", "google_title", "google_description", "gs_main_image", "gs_images",
+    "brand", "color", "width", "height", "depth", "style", "material", "shape", "assembly_required", "weight",
+    "rating_star", "rating_count", "typical_price_low", "typical_price_high",
+    "best_price_url", "popular_url", "other_attributes",
+    "last_response", "osb_url_match", "google_seller_page_url", "cid", "pid",
+    "osb_position", "osb_id", "seller_count", "status", "scraped_at", "updated_at",
+]
+
+GS_SELLER_COLUMNS = [
+    "product_id", "competitor_id", "seller_name", "seller_product_name", "seller_url", "price",
+    "original_price", "discount_amount", "coupon_code", "coupon_remark", "stock_status",
+    "seller_rating", "delivery_tagline", "google_position", "site_display", "is_me",
+]
+
+# Fields of a scraped result / offer that end up in google_shopping_results / _sellers.
+# Timestamps are left out so a re-scrape of an unchanged product hashes the same.
+GS_HASH_RESULT_FIELDS = [
+    "product_id", "google_title", "product_name", "google_description", "description",
+    "gs_main_image", "main_image", "gs_images", "brand", "color", "width", "height", "depth",
+    "style", "material", "shape", "assembly_required", "weight", "rating_star", "rating_count",
+    "typical_price_low", "typical_price_high", "best_price_url", "popular_url", "attributes",
+    "last_response", "osb_url_match", "product_url", "cid", "pid", "osb_position", "osb_id",
+    "seller_count", "status",
+]
+
+GS_HASH_SELLER_FIELDS = [
+    "seller", "seller_name", "seller_product_name", "seller_url", "seller_price", "original_price",
+    "discount_amount", "coupon_code", "coupon_remark", "stock_status", "seller_rating",
+    "delivery_tagline", "google_position",
+]
+
+def compute_content_hash(result, sellers):
+    """Stable digest of a product result and its offer set."""
+    offers = sorted(
+        json.dumps({k: s.get(k) for k in GS_HASH_SELLER_FIELDS}, sort_keys=True, default=str)
+        for s in sellers or []
+    )
+    payload = {
+        "result": {k: result.get(k) for k in GS_HASH_RESULT_FIELDS},
+        "offers": offers,
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+try:
+    from export_reports import OFFER_ROWS_SQL
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from export_reports import OFFER_ROWS_SQL
+
+# Per-product rollup of google_shopping_sellers, refreshed by insert_to_postgres for
+# every product it writes so reports read one row per product instead of aggregating offers.
+# Created once by --migrate-summary (migrate_product_summary), never by the scrape workers.
+GS_SUMMARY_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS google_shopping_product_summary (
+        product_id bigint PRIMARY KEY,
+        offer_count integer NOT NULL DEFAULT 0,
+        priced_offer_count integer NOT NULL DEFAULT 0,
+        min_price double precision,
+        max_price double precision,
+        avg_price double precision,
+        cheapest_seller text,
+        highest_seller text,
+        cheapest_site text,
+        highest_site text,
+        comp_count integer NOT NULL DEFAULT 0,
+        comp_min double precision,
+        comp_max double precision,
+        comp_sum double precision,
+        my_price double precision,
+        my_google_position integer,
+        updated_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# (index, table, columns), built with CREATE INDEX CONCURRENTLY
+GS_SUMMARY_INDEXES = [
+    ("idx_gs_product_summary_updated_at", "google_shopping_product_summary", "updated_at"),
+    # Report queries walk offers per product in google_position order
+    ("idx_gs_sellers_product_position", "google_shopping_sellers", "product_id, google_position"),
+]
+
+# pg_advisory_lock key serialising concurrent --migrate-summary runs
+GS_SUMMARY_MIGRATION_LOCK = 4711035
+
+GS_SUMMARY_VALUE_COLUMNS = [
+    "offer_count", "priced_offer_count", "min_price", "max_price", "avg_price",
+    "cheapest_seller", "highest_seller", "cheapest_site", "highest_site",
+    "comp_count", "comp_min", "comp_max", "comp_sum", "my_price", "my_google_position",
+]
+
+# {products} is a relation with a product_id column: the batch's ids or every scraped product.
+# Offers (site_display / is_me fallbacks included) come from export_reports.OFFER_ROWS_SQL so
+# the summary matches the export's inline aggregate.
+GS_SUMMARY_SELECT_SQL = """
+    SELECT
+        p.product_id,
+        count(o.product_id) AS offer_count,
+        count(o.price) AS priced_offer_count,
+        min(o.price) AS min_price,
+        max(o.price) AS max_price,
+        avg(o.price) AS avg_price,
+        (array_agg(o.seller_name ORDER BY o.price ASC, o.google_position NULLS LAST) FILTER (WHERE o.price IS NOT NULL))[1] AS cheapest_seller,
+        (array_agg(o.seller_name ORDER BY o.price DESC, o.google_position NULLS LAST) FILTER (WHERE o.price IS NOT NULL))[1] AS highest_seller,
+        (array_agg(o.site_display ORDER BY o.price ASC, o.google_position NULLS LAST) FILTER (WHERE o.price IS NOT NULL))[1] AS cheapest_site,
+        (array_agg(o.site_display ORDER BY o.price DESC, o.google_position NULLS LAST) FILTER (WHERE o.price IS NOT NULL))[1] AS highest_site,
+        count(o.price) FILTER (WHERE NOT o.is_me) AS comp_count,
+        min(o.price) FILTER (WHERE NOT o.is_me) AS comp_min,
+        max(o.price) FILTER (WHERE NOT o.is_me) AS comp_max,
+        sum(o.price) FILTER (WHERE NOT o.is_me) AS comp_sum,
+        (array_agg(o.price ORDER BY o.google_position NULLS LAST) FILTER (WHERE o.is_me AND o.price IS NOT NULL))[1] AS my_price,
+        (array_agg(o.google_position ORDER BY o.google_position NULLS LAST) FILTER (WHERE o.is_me))[1] AS my_google_position,
+        CURRENT_TIMESTAMP AS updated_at
+    FROM {products}
+    LEFT JOIN ({offers}) o ON o.product_id = p.product_id
+    GROUP BY p.product_id
+"""
+
+GS_SUMMARY_UPSERT_SQL = """
+    INSERT INTO google_shopping_product_summary AS ps (product_id, {value_cols}, updated_at)
+    {select}
+    ON CONFLICT (product_id) DO UPDATE SET
+        {set_clause},
+        updated_at = CURRENT_TIMESTAMP
+    WHERE ({current}) IS DISTINCT FROM ({excluded})
+"""
+
+def _summary_select_sql(products):
+    return GS_SUMMARY_SELECT_SQL.format(products=products, offers=OFFER_ROWS_SQL.replace("{filter}", ""))
+
+def _summary_upsert_sql(products):
+    return GS_SUMMARY_UPSERT_SQL.format(
+        select=_summary_select_sql(products),
+        value_cols=", ".join(GS_SUMMARY_VALUE_COLUMNS),
+        set_clause=", ".join(f"{c} = EXCLUDED.{c}" for c in GS_SUMMARY_VALUE_COLUMNS),
+        current=", ".join(f"ps.{c}" for c in GS_SUMMARY_VALUE_COLUMNS),
+        excluded=", ".join(f"EXCLUDED.{c}" for c in GS_SUMMARY_VALUE_COLUMNS),
+    )
+
+def _refresh_product_summary(cursor, prod_ids):
+    """Recompute summary rows for `prod_ids` from their current offers; returns rows changed."""
+    if not prod_ids or not _summary_table_available(cursor):
+        return 0
+    cursor.execute(
+        _summary_upsert_sql("unnest(%s::bigint[]) AS p(product_id)"),
+        (sorted({int(pid) for pid in prod_ids}),),
+    )
+    return cursor.rowcount
+
+def _copy_text_value(val):
+    """Encode a Python value as a field of COPY ... FROM STDIN (text format)."""
+    if val is None:
+        return "\\N"
+    if isinstance(val, bool):
+        return "t" if val else "f"
+    if isinstance(val, datetime):
+        return val.isoformat()
+    if isinstance(val, psycopg2.extras.Json):
+        val = json.dumps(val.adapted)
+    return (
+        str(val)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+def _copy_rows_into_temp(cursor, temp_table, source_table, columns, rows):
+    """Create an ON COMMIT DROP temp table shaped like `source_table` and COPY `rows` into it."""
+    import io
+    col_list = ", ".join(columns)
+    cursor.execute(f"DROP TABLE IF EXISTS {temp_table}")
+    cursor.execute(
+        f"CREATE TEMP TABLE {temp_table} ON COMMIT DROP AS SELECT {col_list} FROM {source_table} WITH NO DATA"
+    )
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_text_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {temp_table} ({col_list}) FROM STDIN", buf)
+
+def _copy_upsert_results(cursor, prod_values):
+    _copy_rows_into_temp(cursor, "tmp_gs_results", "google_shopping_results", GS_RESULT_COLUMNS, prod_values)
+    col_list = ", ".join(GS_RESULT_COLUMNS)
+    update_cols = [c for c in GS_RESULT_COLUMNS if c not in ("product_id", "scraped_at", "updated_at")]
+    set_clause = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
+    # DISTINCT ON guards against the same product appearing twice in one batch
+    cursor.execute(f"""
+        INSERT INTO google_shopping_results ({col_list})
+        SELECT DISTINCT ON (product_id) {col_list} FROM tmp_gs_results ORDER BY product_id
+        ON CONFLICT (product_id) DO UPDATE SET
+            {set_clause},
+            updated_at = CURRENT_TIMESTAMP
+    """)
+    return cursor.rowcount
+
+def _copy_merge_sellers(cursor, prod_ids, seller_values):
+    """
+    Diff the batch's offers against google_shopping_sellers: delete offers that disappeared,
+    insert new ones and update only rows whose values changed. Unchanged offers are left untouched.
+    """
+    _copy_rows_into_temp(cursor, "tmp_gs_sellers", "google_shopping_sellers", GS_SELLER_COLUMNS, seller_values)
+
+    deleted = 0
+    if prod_ids:
+        cursor.execute(
+            """
+            DELETE FROM google_shopping_sellers s
+            WHERE s.product_id = ANY(%s::integer[])
+              AND NOT EXISTS (
+                  SELECT 1 FROM tmp_gs_sellers t
+                  WHERE t.product_id = s.product_id
+                    AND t.competitor_id = s.competitor_id
+                    AND md5(t.seller_url) = md5(s.seller_url)
+              )
+            """,
+            (prod_ids,),
+        )
+        deleted = cursor.rowcount
+
+    col_list = ", ".join(GS_SELLER_COLUMNS)
+    value_cols = [c for c in GS_SELLER_COLUMNS if c not in ("product_id", "competitor_id", "seller_url")]
+    set_clause = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in value_cols)
+    current = ", ".join(f"google_shopping_sellers.{c}" for c in value_cols)
+    excluded = ", ".join(f"EXCLUDED.{c}" for c in value_cols)
+    cursor.execute(f"""
+        INSERT INTO google_shopping_sellers ({col_list})
+        SELECT {col_list} FROM tmp_gs_sellers
+        ON CONFLICT (product_id, competitor_id, (md5(seller_url))) DO UPDATE SET
+            {set_clause},
+            scraped_at = NOW()
+        WHERE ({current}) IS DISTINCT FROM ({excluded})
+    """)
+    written = cursor.rowcount
+    return written, deleted
+
 def insert_to_postgres(product_results, seller_results):
     def parse_jsonb_field(val):
         if not val:
@@ -319,7 +590,6 @@ def insert_to_postgres(product_results, seller_results):
         return None
 
     pg_host = os.environ.get("PG_HOST")
-    pg_port = os.environ.get("PG_PORT", "5432")
     pg_user = os.environ.get("PG_USER")
     pg_pass = os.environ.get("PG_PASS")
     pg_db = os.environ.get("PG_DB")
@@ -331,6 +601,7 @@ def insert_to_postgres(product_results, seller_results):
     db_page_size = _env_int("DB_WRITE_PAGE_SIZE", DEFAULT_DB_WRITE_PAGE_SIZE)
     if db_page_size <= 0:
         db_page_size = DEFAULT_DB_WRITE_PAGE_SIZE
+    use_copy = os.environ.get("DB_WRITE_MODE", DEFAULT_DB_WRITE_MODE).strip().lower() == "copy"
 
     def execute_transaction(conn, cursor):
 
@@ -348,12 +619,43 @@ def insert_to_postgres(product_results, seller_results):
             else:
                 valid_product_results.append(r)
 
+        # Products whose result + offers hash matches the stored content_hash are not rewritten
+        result_hashes = {}
+        unchanged_ids = set()
+        if valid_product_results and _content_hash_available(cursor):
+            sellers_by_pid = {}
+            for s_row in seller_results or []:
+                sellers_by_pid.setdefault(str(s_row.get("product_id", s_row.get("product_code", ""))).strip(), []).append(s_row)
+            for r in valid_product_results:
+                p_id = str(r.get("product_id", "")).strip()
+                if p_id:
+                    result_hashes[p_id] = r.get("content_hash") or compute_content_hash(r, sellers_by_pid.get(p_id, []))
+            _execute_prepared(
+                cursor,
+                "gs_stored_hashes",
+                "SELECT product_id::text, content_hash FROM google_shopping_results WHERE product_id = ANY($1::text[]::bigint[])",
+                (sorted(result_hashes),),
+            )
+            unchanged_ids = {p_id for p_id, stored in cursor.fetchall() if stored and result_hashes.get(p_id) == stored}
+            if unchanged_ids:
+                valid_product_results = [r for r in valid_product_results if str(r.get("product_id", "")).strip() not in unchanged_ids]
+                _execute_prepared(
+                    cursor,
+                    "gs_touch_unchanged",
+                    "UPDATE google_shopping_results SET updated_at = CURRENT_TIMESTAMP WHERE product_id = ANY($1::text[]::bigint[])",
+                    (sorted(unchanged_ids),),
+                )
+
         # Gather all product_ids to clean up pre-existing competitor/seller records
+        prod_ids = []
         if product_results:
-            prod_ids = sorted({str(r.get("product_id", "")).strip() for r in product_results if r.get("product_id")})
-            if prod_ids:
+            prod_ids = sorted({str(r.get("product_id", "")).strip() for r in product_results if r.get("product_id")} - unchanged_ids)
+            if prod_ids and not use_copy:
                 # Delete existing sellers for these products to prevent duplicate or stale entries
                 cursor.execute("DELETE FROM google_shopping_sellers WHERE product_id = ANY(%s::integer[])", (prod_ids,))
+        sellers_written = 0
+        sellers_deleted = 0
+        seller_values = []
 
         # 1. Upsert google_shopping_results (1-to-1 relationship)
         if valid_product_results:
@@ -473,13 +775,16 @@ def insert_to_postgres(product_results, seller_results):
                     datetime.now(),
                     datetime.now()
                 ))
-            execute_values(cursor, prod_insert, prod_values, page_size=db_page_size)
+            if use_copy:
+                _copy_upsert_results(cursor, prod_values)
+            else:
+                execute_values(cursor, prod_insert, prod_values, page_size=db_page_size)
 
         # 2. Upsert google_shopping_sellers (1-to-many relationship)
         valid_seller_results = []
         for r in seller_results or []:
             p_code = str(r.get("product_id", r.get("product_code", ""))).strip()
-            if p_code not in retry_product_ids:
+            if p_code not in retry_product_ids and p_code not in unchanged_ids:
                 valid_seller_results.append(r)
 
         if valid_seller_results:
@@ -570,7 +875,6 @@ def insert_to_postgres(product_results, seller_results):
                     is_me = EXCLUDED.is_me,
                     scraped_at = NOW()
             """
-            seller_values = []
             seen_sellers = set()
             for r in valid_seller_results:
                 p_code = str(r.get("product_id", r.get("product_code", ""))).strip()
@@ -586,7 +890,6 @@ def insert_to_postgres(product_results, seller_results):
                 
                 seller_url = str(r.get("seller_url") or "").strip()
                 
-                import hashlib
                 url_hash = hashlib.md5(seller_url.encode('utf-8', errors='ignore')).hexdigest()
                 
                 # Check for duplicates in the current batch to avoid:
@@ -646,8 +949,31 @@ def insert_to_postgres(product_results, seller_results):
                     is_me_flag
                 ))
 
-            if seller_values:
+            if use_copy:
+                # Products whose offers all disappeared still need their stale rows diffed away
+                sellers_written, sellers_deleted = _copy_merge_sellers(cursor, prod_ids, seller_values)
+            elif seller_values:
                 execute_values(cursor, seller_insert, seller_values, page_size=db_page_size)
+                sellers_written = len(seller_values)
+        elif use_copy and prod_ids:
+            sellers_written, sellers_deleted = _copy_merge_sellers(cursor, prod_ids, [])
+
+        if prod_ids:
+            _refresh_product_summary(cursor, prod_ids)
+
+        written_hashes = {p_id: h for p_id, h in result_hashes.items() if p_id not in unchanged_ids}
+        if written_hashes:
+            _execute_prepared(
+                cursor,
+                "gs_store_hashes",
+                """
+                UPDATE google_shopping_results AS r
+                SET content_hash = v.content_hash
+                FROM unnest($1::text[], $2::text[]) AS v(product_id, content_hash)
+                WHERE r.product_id = v.product_id::bigint
+                """,
+                (list(written_hashes), list(written_hashes.values())),
+            )
 
         # 3. Transactionally update scraping_status in osb_products table
         if product_results:
@@ -672,16 +998,25 @@ def insert_to_postgres(product_results, seller_results):
 
             if status_values:
                 if _supports_claim_columns(cursor):
-                    status_update_query = """
+                    _execute_prepared(
+                        cursor,
+                        "gs_batch_status_update",
+                        """
                         UPDATE osb_products AS p
                         SET scraping_status = v.scraping_status,
                             last_attempt = CURRENT_TIMESTAMP,
                             error_message = v.error_message,
                             claimed_by = NULL,
                             claimed_at = NULL
-                        FROM (VALUES %s) AS v(product_id, scraping_status, error_message)
+                        FROM unnest($1::text[], $2::text[], $3::text[]) AS v(product_id, scraping_status, error_message)
                         WHERE p.product_id = v.product_id::bigint
-                    """
+                        """,
+                        (
+                            [v[0] for v in status_values],
+                            [v[1] for v in status_values],
+                            [v[2] for v in status_values],
+                        ),
+                    )
                 else:
                     status_update_query = """
                         UPDATE osb_products AS p
@@ -691,12 +1026,24 @@ def insert_to_postgres(product_results, seller_results):
                         FROM (VALUES %s) AS v(product_id, scraping_status, error_message)
                         WHERE p.product_id = v.product_id::bigint
                     """
-                execute_values(cursor, status_update_query, status_values, page_size=db_page_size)
+                    execute_values(cursor, status_update_query, status_values, page_size=db_page_size)
 
         conn.commit()
         cursor.close()
         conn.close()
-        print(f"✓ Transaction committed: Upserted {len(product_results)} products and {len(seller_results)} sellers into PostgreSQL.")
+        if use_copy:
+            print(
+                f"✓ Transaction committed (COPY): Upserted {len(product_results) - len(unchanged_ids)} products, "
+                f"{len(unchanged_ids)} skipped (content unchanged); "
+                f"{sellers_written} seller rows written, {len(seller_values) - sellers_written} unchanged, "
+                f"{sellers_deleted} stale removed."
+            )
+        else:
+            print(
+                f"✓ Transaction committed: Upserted {len(product_results) - len(unchanged_ids)} products and "
+                f"{len(valid_seller_results)} sellers into PostgreSQL; "
+                f"{len(unchanged_ids)} products skipped (content unchanged)."
+            )
 
     max_attempts = 5
     base_delay = 0.5
@@ -704,11 +1051,11 @@ def insert_to_postgres(product_results, seller_results):
         conn = None
         cursor = None
         try:
-            conn = psycopg2.connect(
-                host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db
-            )
+            conn = _get_pg_conn()
             cursor = conn.cursor()
+            started = time.perf_counter()
             execute_transaction(conn, cursor)
+            _record_pg_query("insert_batch", time.perf_counter() - started)
             return
         except Exception as e:
             if conn:
@@ -743,27 +1090,11 @@ def sync_csv_to_db(csv_path):
     conn = None
     cursor = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        if not all([pg_host, pg_user, pg_pass, pg_db]):
+        if not all(os.environ.get(k) for k in ("PG_HOST", "PG_USER", "PG_PASS", "PG_DB")):
             print("Skipping DB sync: Missing credentials")
             return
 
-        conn = psycopg2.connect(
-            host=pg_host, 
-            port=pg_port, 
-            user=pg_user, 
-            password=pg_pass, 
-            dbname=pg_db,
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
-        )
+        conn = _get_pg_conn()
         cursor = conn.cursor()
 
         # Optimization: check if products are already present in DB
@@ -866,13 +1197,7 @@ def get_pending_count_from_db():
     conn = None
     cursor = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+        conn = _get_pg_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM osb_products WHERE scraping_status = 'pending' AND status = 1")
         count = cursor.fetchone()[0]
@@ -892,13 +1217,301 @@ def get_pending_count_from_db():
             except Exception:
                 pass
 
+# ---------------- Shared PostgreSQL connection pool ----------------
+
+_PG_POOL = None
+_PG_POOL_PID = None
+_PG_POOL_LOCK = threading.Lock()
+_PG_POOL_SLOTS = None
+_PG_METRICS_LOCK = threading.Lock()
+_PG_METRICS = {
+    "checkouts": 0,
+    "pool_wait_seconds": 0.0,
+    "pool_wait_max": 0.0,
+    "discarded": 0,
+    "queries": {},  # name -> {"count", "total", "max"}
+}
+
+def _record_pg_query(name, seconds):
+    with _PG_METRICS_LOCK:
+        stat = _PG_METRICS["queries"].setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        stat["count"] += 1
+        stat["total"] += seconds
+        stat["max"] = max(stat["max"], seconds)
+
+class _PgConnection(psycopg2.extensions.connection):
+    """Pool connection that carries its own per-session state.
+
+    Kept on the connection rather than in a dict keyed by id(): the pool closes
+    connections above minconn when they are returned, and a new connection can then
+    get the same id without any of the old one's prepared statements.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.last_used = None  # monotonic time it was returned to the pool
+
+def _get_pg_pool():
+    """Create (once per process) the shared ThreadedConnectionPool for PG_* credentials."""
+    global _PG_POOL, _PG_POOL_PID, _PG_POOL_SLOTS
+    if _PG_POOL is not None and _PG_POOL_PID == os.getpid():
+        return _PG_POOL
+    with _PG_POOL_LOCK:
+        if _PG_POOL is not None and _PG_POOL_PID == os.getpid():
+            return _PG_POOL
+        from psycopg2.pool import ThreadedConnectionPool
+
+        min_conn = max(1, _env_int("PG_POOL_MIN_CONN", 1))
+        max_conn = max(min_conn, _env_int("PG_POOL_MAX_CONN", max(4, _env_int("MAX_WORKERS", 2) + 2)))
+        _PG_POOL = ThreadedConnectionPool(
+            min_conn,
+            max_conn,
+            host=os.environ.get("PG_HOST"),
+            port=os.environ.get("PG_PORT", "5432"),
+            user=os.environ.get("PG_USER"),
+            password=os.environ.get("PG_PASS"),
+            dbname=os.environ.get("PG_DB"),
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=5,
+            connection_factory=_PgConnection,
+        )
+        # ThreadedConnectionPool raises instead of blocking when exhausted; the semaphore makes callers wait
+        _PG_POOL_SLOTS = threading.BoundedSemaphore(max_conn)
+        _PG_POOL_PID = os.getpid()
+        return _PG_POOL
+
+def _discard_pg_conn(pool, raw):
+    try:
+        pool.putconn(raw, close=True)
+    except Exception:
+        pass
+    with _PG_METRICS_LOCK:
+        _PG_METRICS["discarded"] += 1
+
+def _pg_conn_is_healthy(raw):
+    if raw.closed:
+        return False
+    idle_since = getattr(raw, "last_used", None)
+    healthcheck_after = _env_float("PG_POOL_HEALTHCHECK_SECONDS", 30.0)
+    if idle_since is not None and (time.monotonic() - idle_since) < healthcheck_after:
+        return True
+    try:
+        cur = raw.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        raw.rollback()
+        return True
+    except Exception:
+        return False
+
+class _PooledConnection:
+    """Proxy for a pooled psycopg2 connection; close() hands it back to the pool instead of disconnecting."""
+
+    def __init__(self, pool, raw):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_released", False)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def close(self):
+        if self._released:
+            return
+        object.__setattr__(self, "_released", True)
+        raw = self._raw
+        try:
+            if raw.closed:
+                _discard_pg_conn(self._pool, raw)
+                return
+            if raw.status != psycopg2.extensions.STATUS_READY:
+                raw.rollback()
+            if raw.autocommit:
+                raw.autocommit = False
+            raw.last_used = time.monotonic()
+            self._pool.putconn(raw)
+        except Exception:
+            _discard_pg_conn(self._pool, raw)
+        finally:
+            _PG_POOL_SLOTS.release()
+
 def _get_pg_conn():
-    pg_host = os.environ.get("PG_HOST")
-    pg_port = os.environ.get("PG_PORT", "5432")
-    pg_user = os.environ.get("PG_USER")
-    pg_pass = os.environ.get("PG_PASS")
-    pg_db = os.environ.get("PG_DB")
-    return psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+    """Check out a healthy connection from the shared pool; call close() to return it."""
+    pool = _get_pg_pool()
+    wait_started = time.perf_counter()
+    _PG_POOL_SLOTS.acquire()
+    try:
+        for _ in range(3):
+            raw = pool.getconn()
+            if _pg_conn_is_healthy(raw):
+                break
+            _discard_pg_conn(pool, raw)
+        else:
+            raw = pool.getconn()
+    except Exception:
+        _PG_POOL_SLOTS.release()
+        raise
+
+    waited = time.perf_counter() - wait_started
+    with _PG_METRICS_LOCK:
+        _PG_METRICS["checkouts"] += 1
+        _PG_METRICS["pool_wait_seconds"] += waited
+        _PG_METRICS["pool_wait_max"] = max(_PG_METRICS["pool_wait_max"], waited)
+    return _PooledConnection(pool, raw)
+
+def _execute_prepared(cursor, name, sql, params):
+    """Execute `sql` as a server-side prepared statement, preparing it once per pooled connection."""
+    prepared = cursor.connection.prepared_statements
+    if name not in prepared:
+        try:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+        except psycopg2.errors.DuplicatePreparedStatement:
+            # Prepared statements outlive transactions; the session already has it
+            prepared.add(name)
+            raise
+        prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    started = time.perf_counter()
+    try:
+        # A failed EXECUTE leaves the statement prepared on the server, so the name stays in the set
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+    finally:
+        _record_pg_query(name, time.perf_counter() - started)
+
+def get_pg_metrics():
+    """Snapshot of pool wait time and per-statement query latency."""
+    with _PG_METRICS_LOCK:
+        checkouts = _PG_METRICS["checkouts"]
+        return {
+            "checkouts": checkouts,
+            "pool_wait_avg_ms": round(_PG_METRICS["pool_wait_seconds"] / checkouts * 1000, 2) if checkouts else 0.0,
+            "pool_wait_max_ms": round(_PG_METRICS["pool_wait_max"] * 1000, 2),
+            "discarded": _PG_METRICS["discarded"],
+            "queries": {
+                name: {
+                    "count": stat["count"],
+                    "avg_ms": round(stat["total"] / stat["count"] * 1000, 2) if stat["count"] else 0.0,
+                    "max_ms": round(stat["max"] * 1000, 2),
+                }
+                for name, stat in _PG_METRICS["queries"].items()
+            },
+        }
+
+def log_pg_metrics():
+    metrics = get_pg_metrics()
+    if not metrics["checkouts"]:
+        return
+    print(
+        f"[DB Pool] checkouts={metrics['checkouts']} wait_avg={metrics['pool_wait_avg_ms']}ms "
+        f"wait_max={metrics['pool_wait_max_ms']}ms discarded={metrics['discarded']}"
+    )
+    for name, stat in sorted(metrics["queries"].items()):
+        print(f"[DB Pool]   {name}: n={stat['count']} avg={stat['avg_ms']}ms max={stat['max_ms']}ms")
+
+STAGE_TIMINGS_FILE = os.environ.get("GS_STAGE_TIMINGS", "").strip()  # JSON lines, one record per product
+_STAGE_LOCAL = threading.local()
+_STAGE_METRICS_LOCK = threading.Lock()
+_STAGE_SAMPLES = {}  # stage -> [seconds, ...]
+_WORKER_THROUGHPUT = {}  # worker label -> {"products", "busy_seconds", "first_started", "last_finished"}
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Add the wall time of the block to the current product's `stage` bucket.
+    Nested stages (e.g. offers inside selection) are also counted in their parent.
+    No-op outside begin_product_timing/finish_product_timing.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_STAGE_LOCAL, "timings", None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started)
+
+def begin_product_timing():
+    _STAGE_LOCAL.timings = {}
+    _STAGE_LOCAL.started = time.perf_counter()
+    _STAGE_LOCAL.started_wall = time.monotonic()
+
+def finish_product_timing(product_id, worker_label, status=""):
+    """Close the current product's timings: aggregate them, update the worker gauge, append a JSON line."""
+    timings = getattr(_STAGE_LOCAL, "timings", None)
+    if timings is None:
+        return None
+    total = time.perf_counter() - _STAGE_LOCAL.started
+    started_wall = _STAGE_LOCAL.started_wall
+    _STAGE_LOCAL.timings = None
+    timings["total"] = total
+
+    with _STAGE_METRICS_LOCK:
+        for stage, seconds in timings.items():
+            _STAGE_SAMPLES.setdefault(stage, []).append(seconds)
+        gauge = _WORKER_THROUGHPUT.setdefault(
+            worker_label, {"products": 0, "busy_seconds": 0.0, "first_started": started_wall, "last_finished": started_wall}
+        )
+        gauge["products"] += 1
+        gauge["busy_seconds"] += total
+        gauge["last_finished"] = time.monotonic()
+        if STAGE_TIMINGS_FILE:
+            record = {
+                "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "worker": worker_label,
+                "product_id": str(product_id),
+                "status": status,
+                "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()},
+            }
+            try:
+                with open(STAGE_TIMINGS_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except Exception as e:
+                print(f"[Timings] Could not write {STAGE_TIMINGS_FILE}: {e}")
+    return timings
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+def get_stage_metrics():
+    """Per-stage p50/p95/max (seconds) and per-worker throughput, for tuning PRODUCTS_PER_HOUR."""
+    with _STAGE_METRICS_LOCK:
+        stages = {}
+        for stage, samples in _STAGE_SAMPLES.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": len(ordered),
+                "p50": round(_percentile(ordered, 0.50), 2),
+                "p95": round(_percentile(ordered, 0.95), 2),
+                "max": round(ordered[-1], 2),
+                "total": round(sum(ordered), 1),
+            }
+        workers = {}
+        for label, gauge in _WORKER_THROUGHPUT.items():
+            elapsed = max(gauge["last_finished"] - gauge["first_started"], 1e-6)
+            workers[label] = {
+                "products": gauge["products"],
+                "products_per_hour": round(gauge["products"] / elapsed * 3600, 1),
+                "busy_share": round(min(gauge["busy_seconds"] / elapsed, 1.0), 2),
+            }
+        return {"stages": stages, "workers": workers}
+
+def log_stage_metrics():
+    metrics = get_stage_metrics()
+    if not metrics["stages"]:
+        return
+    print("[Timings] stage            n      p50      p95      max   total")
+    for stage, stat in sorted(metrics["stages"].items(), key=lambda item: -item[1]["total"]):
+        print(f"[Timings] {stage:<15} {stat['count']:>4} {stat['p50']:>7.2f}s {stat['p95']:>7.2f}s {stat['max']:>7.2f}s {stat['total']:>7.1f}s")
+    for label, gauge in sorted(metrics["workers"].items()):
+        print(f"[Timings] worker {label}: {gauge['products']} products, {gauge['products_per_hour']}/hour, busy {gauge['busy_share']:.0%}")
 
 def _get_worker_id(explicit_worker_id=None):
     if explicit_worker_id:
@@ -909,6 +1522,13 @@ def _get_worker_id(explicit_worker_id=None):
             return f"{key}:{val}"
     return f"pid:{os.getpid()}"
 
+def _lease_worker_id(explicit_worker_id=None):
+    worker_id = _get_worker_id(explicit_worker_id)
+    return worker_id if worker_id.startswith(LEASE_CLAIM_PREFIX) else LEASE_CLAIM_PREFIX + worker_id
+
+def _claim_pattern(leases_only):
+    return LEASE_CLAIM_PATTERN if leases_only else ANY_CLAIM_PATTERN
+
 def _env_int(name, default):
     val = os.environ.get(name)
     if val is None or str(val).strip() == "":
@@ -945,34 +1565,175 @@ def _supports_claim_columns(cursor):
     _CLAIM_COLUMN_SUPPORT = cursor.fetchone() is not None
     return _CLAIM_COLUMN_SUPPORT
 
+def _summary_table_available(cursor):
+    global _SUMMARY_TABLE_SUPPORT
+    if _SUMMARY_TABLE_SUPPORT is not None:
+        return _SUMMARY_TABLE_SUPPORT
+
+    cursor.execute("SELECT to_regclass('google_shopping_product_summary') IS NOT NULL")
+    _SUMMARY_TABLE_SUPPORT = bool(cursor.fetchone()[0])
+    return _SUMMARY_TABLE_SUPPORT
+
+def _content_hash_available(cursor):
+    global _CONTENT_HASH_SUPPORT
+    if _CONTENT_HASH_SUPPORT is not None:
+        return _CONTENT_HASH_SUPPORT
+
+    cursor.execute(
+        """
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_name = 'google_shopping_results'
+          AND column_name = 'content_hash'
+        """
+    )
+    _CONTENT_HASH_SUPPORT = cursor.fetchone() is not None
+    return _CONTENT_HASH_SUPPORT
+
+def _create_index_concurrently(cursor, name, table, columns):
+    """CREATE INDEX CONCURRENTLY unless a valid index `name` exists; needs an autocommit connection."""
+    cursor.execute(
+        "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)",
+        (name,),
+    )
+    row = cursor.fetchone()
+    if row and row[0]:
+        return False
+    if row:
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+    print(f"✓ Created index {name}")
+    return True
+
+def migrate_product_summary(backfill=True):
+    """
+    One-off migration for the batch writer's schema (--migrate-summary): add
+    google_shopping_results.content_hash, create google_shopping_product_summary, build its
+    indexes with CREATE INDEX CONCURRENTLY and backfill it the first time.
+    Runs under an advisory lock so concurrent invocations wait for the first one and then
+    find everything in place.
+    """
+    global _SUMMARY_TABLE_SUPPORT, _CONTENT_HASH_SUPPORT
+    conn = None
+    cursor = None
+    locked = False
+    locked_wait_logged = False
+    try:
+        conn = _get_pg_conn()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        # Poll instead of pg_advisory_lock(): a session blocked inside that call holds a
+        # transaction open, and CREATE INDEX CONCURRENTLY in the lock holder waits for it
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (GS_SUMMARY_MIGRATION_LOCK,))
+            if cursor.fetchone()[0]:
+                break
+            if not locked_wait_logged:
+                print("Another --migrate-summary run holds the migration lock; waiting...")
+                locked_wait_logged = True
+            time.sleep(2)
+        locked = True
+        _CONTENT_HASH_SUPPORT = None
+        if not _content_hash_available(cursor):
+            cursor.execute("ALTER TABLE google_shopping_results ADD COLUMN IF NOT EXISTS content_hash text")
+            _CONTENT_HASH_SUPPORT = True
+            print("✓ Added google_shopping_results.content_hash")
+        cursor.execute("SELECT to_regclass('google_shopping_product_summary') IS NOT NULL")
+        existed = bool(cursor.fetchone()[0])
+        cursor.execute(GS_SUMMARY_TABLE_DDL)
+        for name, table, columns in GS_SUMMARY_INDEXES:
+            _create_index_concurrently(cursor, name, table, columns)
+        _SUMMARY_TABLE_SUPPORT = True
+        if not existed and backfill:
+            print("✓ Created google_shopping_product_summary; backfilling from existing offers...")
+            rebuild_product_summary(conn)
+        return True
+    except Exception as e:
+        print(f"Could not run the --migrate-summary migration: {e}")
+        return False
+    finally:
+        if cursor:
+            try:
+                if locked:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (GS_SUMMARY_MIGRATION_LOCK,))
+                cursor.close()
+            except Exception:
+                pass
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+def rebuild_product_summary(conn=None):
+    """
+    Recompute the summary row of every scraped product from google_shopping_sellers.
+    Pass `conn` to reuse a connection the caller already holds (it is left open); with
+    PG_POOL_MAX_CONN=1 a second checkout would wait forever.
+    """
+    own_conn = conn is None
+    autocommit = None
+    cursor = None
+    try:
+        started = time.perf_counter()
+        if own_conn:
+            conn = _get_pg_conn()
+        else:
+            autocommit = conn.autocommit
+            conn.autocommit = False
+        cursor = conn.cursor()
+        cursor.execute(_summary_upsert_sql("(SELECT product_id::bigint AS product_id FROM google_shopping_results) AS p"))
+        changed = cursor.rowcount
+        cursor.execute(
+            """
+            DELETE FROM google_shopping_product_summary ps
+            WHERE NOT EXISTS (SELECT 1 FROM google_shopping_results r WHERE r.product_id = ps.product_id)
+            """
+        )
+        removed = cursor.rowcount
+        conn.commit()
+        print(f"✓ Product summary rebuilt: {changed} rows updated, {removed} orphaned rows removed ({time.perf_counter() - started:.1f}s)")
+        return changed
+    except Exception as e:
+        print(f"Error rebuilding product summary: {e}")
+        traceback.print_exc()
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        return 0
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        if conn and own_conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        elif conn and autocommit is not None:
+            try:
+                conn.autocommit = autocommit
+            except Exception:
+                pass
+
 def calculate_parallel_claim_limit(claim_limit=None, products_per_hour=DEFAULT_PRODUCTS_PER_HOUR, max_runtime_hours=DEFAULT_MAX_RUNTIME_HOURS):
     if claim_limit is not None and int(claim_limit) > 0:
         return int(claim_limit)
     return max(1, int(math.ceil(float(products_per_hour) * float(max_runtime_hours))))
 
-def release_expired_claims(ttl_minutes=60):
-    """Release old claims so another runner can pick them up."""
+def release_expired_claims(ttl_minutes=60, leases_only=False):
+    """Release old claims so another runner can pick them up; leases_only limits it to lease-mode claims."""
     conn = None
     cursor = None
     try:
         conn = _get_pg_conn()
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE osb_products
-            SET scraping_status = %s,
-                claimed_by = NULL,
-                claimed_at = NULL
-            WHERE product_id IN (
-                SELECT product_id FROM osb_products
-                WHERE scraping_status = %s
-                  AND claimed_at IS NOT NULL
-                  AND claimed_at < (NOW() - (%s || ' minutes')::interval)
-                FOR UPDATE SKIP LOCKED
-            )
-            """,
-            (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes)),
-        )
+        _execute_prepared(cursor, "gs_release_expired", RELEASE_EXPIRED_SQL, (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes), _claim_pattern(leases_only)))
         released = cursor.rowcount
         conn.commit()
         if released:
@@ -993,7 +1754,7 @@ def release_expired_claims(ttl_minutes=60):
             except Exception:
                 pass
 
-def claim_pending_products_from_db(limit=30, worker_id=None, ttl_minutes=60):
+def claim_pending_products_from_db(limit=30, worker_id=None, ttl_minutes=60, leases_only=False):
     """
     Atomically claim up to `limit` pending products using row locks (FOR UPDATE SKIP LOCKED).
     Requires columns: claimed_by, claimed_at; and supports scraping_status='claimed'.
@@ -1007,46 +1768,33 @@ def claim_pending_products_from_db(limit=30, worker_id=None, ttl_minutes=60):
         cursor = conn.cursor()
         # Release expired claims first (best-effort)
         try:
-            cursor.execute(
-                """
-                UPDATE osb_products
-                SET scraping_status = %s,
-                    claimed_by = NULL,
-                    claimed_at = NULL
-                WHERE product_id IN (
-                    SELECT product_id FROM osb_products
-                    WHERE scraping_status = %s
-                      AND claimed_at IS NOT NULL
-                      AND claimed_at < (NOW() - (%s || ' minutes')::interval)
-                    FOR UPDATE SKIP LOCKED
-                )
-                """,
-                (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes)),
-            )
+            _execute_prepared(cursor, "gs_release_expired", RELEASE_EXPIRED_SQL, (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes), _claim_pattern(leases_only)))
         except Exception:
             conn.rollback()
             # If schema doesn't have claim columns yet, let the caller know via empty df.
             return pd.DataFrame()
 
-        cursor.execute(
-            """
+        _execute_prepared(
+            cursor,
+            "gs_claim_pending",
+            f"""
             WITH picked AS (
                 SELECT product_id
                 FROM osb_products
-                WHERE scraping_status = %s AND status = 1
+                WHERE scraping_status = $1::text AND status = 1
                 ORDER BY mfr_sales_30d DESC NULLS LAST, product_id ASC
                 FOR UPDATE SKIP LOCKED
-                LIMIT %s
+                LIMIT $2::int
             )
             UPDATE osb_products p
-            SET scraping_status = %s,
-                claimed_by = %s,
+            SET scraping_status = $3::text,
+                claimed_by = $4::text,
                 claimed_at = NOW(),
                 last_attempt = NOW(),
                 error_message = NULL
             FROM picked
             WHERE p.product_id = picked.product_id
-            RETURNING p.product_id, p.web_id, p.name, p.sku AS mpn_sku, p.gtin, p.brand, p.product_type AS category, p.keyword, p.url, p.osb_url, p.status, p.mfr_sales_30d AS "30daymfrsales", p.scraping_status, p.claimed_by, p.claimed_at, p.last_attempt, p.error_message, p.created_at, p.updated_at, p.color, p.bed_size_measure, p.mattress_size
+            RETURNING {CLAIM_RETURNING_COLUMNS}
             """,
             (PENDING_STATUS, int(limit), CLAIM_STATUS, worker_id),
         )
@@ -1106,7 +1854,7 @@ def get_product_ids_in_boundary(start_sales, start_id, end_sales, end_id):
         if conn:
             conn.close()
 
-def claim_specific_products_from_db(product_ids, worker_id=None, limit=30, ttl_minutes=60):
+def claim_specific_products_from_db(product_ids, worker_id=None, limit=30, ttl_minutes=60, leases_only=False):
     """Claim only from the pre-selected static list of product IDs."""
     if not product_ids:
         return pd.DataFrame()
@@ -1121,50 +1869,37 @@ def claim_specific_products_from_db(product_ids, worker_id=None, limit=30, ttl_m
         
         # Release expired claims first (best-effort)
         try:
-            cursor.execute(
-                """
-                UPDATE osb_products
-                SET scraping_status = %s,
-                    claimed_by = NULL,
-                    claimed_at = NULL
-                WHERE product_id IN (
-                    SELECT product_id FROM osb_products
-                    WHERE scraping_status = %s
-                      AND claimed_at IS NOT NULL
-                      AND claimed_at < (NOW() - (%s || ' minutes')::interval)
-                    FOR UPDATE SKIP LOCKED
-                )
-                """,
-                (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes)),
-            )
+            _execute_prepared(cursor, "gs_release_expired", RELEASE_EXPIRED_SQL, (PENDING_STATUS, CLAIM_STATUS, int(ttl_minutes), _claim_pattern(leases_only)))
         except Exception:
             conn.rollback()
             return pd.DataFrame()
 
         # Now claim from specific list of product IDs that are still pending
-        cursor.execute(
-            """
+        _execute_prepared(
+            cursor,
+            "gs_claim_specific",
+            f"""
             WITH picked AS (
                 SELECT product_id
                 FROM osb_products
-                WHERE product_id = ANY(%s::bigint[])
-                  AND scraping_status = %s 
+                WHERE product_id = ANY($1::bigint[])
+                  AND scraping_status = $2::text
                   AND status = 1
                 ORDER BY mfr_sales_30d DESC NULLS LAST, product_id ASC
                 FOR UPDATE SKIP LOCKED
-                LIMIT %s
+                LIMIT $3::int
             )
             UPDATE osb_products p
-            SET scraping_status = %s,
-                claimed_by = %s,
+            SET scraping_status = $4::text,
+                claimed_by = $5::text,
                 claimed_at = NOW(),
                 last_attempt = NOW(),
                 error_message = NULL
             FROM picked
             WHERE p.product_id = picked.product_id
-            RETURNING p.product_id, p.web_id, p.name, p.sku AS mpn_sku, p.gtin, p.brand, p.product_type AS category, p.keyword, p.url, p.osb_url, p.status, p.mfr_sales_30d AS "30daymfrsales", p.scraping_status, p.claimed_by, p.claimed_at, p.last_attempt, p.error_message, p.created_at, p.updated_at, p.color, p.bed_size_measure, p.mattress_size
+            RETURNING {CLAIM_RETURNING_COLUMNS}
             """,
-            (product_ids, PENDING_STATUS, int(limit), CLAIM_STATUS, worker_id),
+            ([int(pid) for pid in product_ids], PENDING_STATUS, int(limit), CLAIM_STATUS, worker_id),
         )
         rows = cursor.fetchall()
         cols = [d[0] for d in cursor.description] if cursor.description else []
@@ -1185,13 +1920,7 @@ def get_pending_chunk_from_db(limit, offset):
     """Fetch only a specific partitioned slice of pending products using SQL LIMIT and OFFSET."""
     conn = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+        conn = _get_pg_conn()
         # Fetch only the assigned chunk's slice, ordered by sales descending
         query = """
             SELECT product_id, web_id, name, sku AS mpn_sku, gtin, brand, product_type AS category, keyword, url, osb_url, status, mfr_sales_30d AS "30daymfrsales", scraping_status, claimed_by, claimed_at, last_attempt, error_message, created_at, updated_at, color, bed_size_measure, mattress_size
@@ -1212,7 +1941,7 @@ def get_pending_chunk_from_db(limit, offset):
             except Exception:
                 pass
 
-def verify_and_claim_product(product_id, worker_id=None, ttl_minutes=60):
+def verify_and_claim_product(product_id, worker_id=None, ttl_minutes=60, leases_only=False):
     """
     Verify that a product is still available or claimed by us, and atomically claim/renew it.
     Returns True if we successfully claimed/renewed it and can scrape it.
@@ -1221,18 +1950,12 @@ def verify_and_claim_product(product_id, worker_id=None, ttl_minutes=60):
     conn = None
     cursor = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        if not all([pg_host, pg_user, pg_pass, pg_db]):
+        if not all(os.environ.get(k) for k in ("PG_HOST", "PG_USER", "PG_PASS", "PG_DB")):
             # Standalone mode: assume it is safe to scrape
             return True
 
         worker_id = _get_worker_id(worker_id)
-        conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+        conn = _get_pg_conn()
         cursor = conn.cursor()
 
         if not _supports_claim_columns(cursor):
@@ -1258,22 +1981,25 @@ def verify_and_claim_product(product_id, worker_id=None, ttl_minutes=60):
             return claimed
 
         # With claims support, atomically claim or renew our claim
-        cursor.execute(
+        _execute_prepared(
+            cursor,
+            "gs_verify_claim",
             """
             UPDATE osb_products
-            SET scraping_status = %s,
-                claimed_by = %s,
+            SET scraping_status = $1::text,
+                claimed_by = $2::text,
                 claimed_at = NOW(),
                 last_attempt = NOW()
-            WHERE product_id = %s
+            WHERE product_id = $3::text::bigint
               AND status = 1
               AND (
-                  scraping_status = %s
-                  OR (scraping_status = %s AND claimed_by = %s)
-                  OR (scraping_status = %s AND claimed_at < (NOW() - (%s || ' minutes')::interval))
+                  scraping_status = $4::text
+                  OR (scraping_status = $1::text AND claimed_by = $2::text)
+                  OR (scraping_status = $1::text AND claimed_at < (NOW() - $5::int * interval '1 minute')
+                      AND COALESCE(claimed_by, '') LIKE $6::text)
               )
             """,
-            (CLAIM_STATUS, worker_id, str(product_id), PENDING_STATUS, CLAIM_STATUS, worker_id, CLAIM_STATUS, int(ttl_minutes))
+            (CLAIM_STATUS, worker_id, str(product_id), PENDING_STATUS, int(ttl_minutes), _claim_pattern(leases_only))
         )
         claimed = cursor.rowcount > 0
         conn.commit()
@@ -1301,15 +2027,17 @@ def update_product_status(product_id, scraping_status, error_message=None):
         conn = _get_pg_conn()
         cursor = conn.cursor()
         try:
-            cursor.execute(
+            _execute_prepared(
+                cursor,
+                "gs_update_status",
                 """
                 UPDATE osb_products
-                SET scraping_status = %s,
+                SET scraping_status = $1::text,
                     last_attempt = CURRENT_TIMESTAMP,
-                    error_message = %s,
+                    error_message = $2::text,
                     claimed_by = NULL,
                     claimed_at = NULL
-                WHERE product_id = %s
+                WHERE product_id = $3::text::bigint
                 """,
                 (scraping_status, error_message, str(product_id)),
             )
@@ -1346,16 +2074,18 @@ def release_claimed_products(product_ids, worker_id=None, reason="not_processed"
         resolved_worker_id = _get_worker_id(worker_id)
         conn = _get_pg_conn()
         cursor = conn.cursor()
-        cursor.execute(
+        _execute_prepared(
+            cursor,
+            "gs_release_claimed",
             """
             UPDATE osb_products
-            SET scraping_status = %s,
+            SET scraping_status = $1::text,
                 claimed_by = NULL,
                 claimed_at = NULL,
-                error_message = %s
-            WHERE product_id = ANY(%s)
-              AND scraping_status = %s
-              AND claimed_by = %s
+                error_message = $2::text
+            WHERE product_id = ANY($3::text[]::bigint[])
+              AND scraping_status = $4::text
+              AND claimed_by = $5::text
             """,
             (PENDING_STATUS, reason, product_ids, CLAIM_STATUS, resolved_worker_id),
         )
@@ -1379,18 +2109,213 @@ def release_claimed_products(product_ids, worker_id=None, reason="not_processed"
             except Exception:
                 pass
 
+def extend_claim_leases(product_ids, worker_id=None):
+    """Heartbeat: push claimed_at forward for rows this worker still holds so they are not recycled."""
+    product_ids = [str(pid).strip() for pid in product_ids if str(pid).strip()]
+    if not product_ids:
+        return 0
+
+    conn = None
+    cursor = None
+    try:
+        resolved_worker_id = _get_worker_id(worker_id)
+        conn = _get_pg_conn()
+        cursor = conn.cursor()
+        _execute_prepared(
+            cursor,
+            "gs_extend_leases",
+            """
+            UPDATE osb_products
+            SET claimed_at = NOW()
+            WHERE product_id = ANY($1::text[]::bigint[])
+              AND scraping_status = $2::text
+              AND claimed_by = $3::text
+            """,
+            (product_ids, CLAIM_STATUS, resolved_worker_id),
+        )
+        extended = cursor.rowcount
+        conn.commit()
+        return extended
+    except Exception as e:
+        print(f"Error extending claim leases: {e}")
+        return 0
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+class LeaseWorkQueue:
+    """
+    Lease-based work queue over osb_products.
+
+    Claims small batches sized from this worker's measured throughput, prefetches the
+    next batch in the background while the current one is scraped, and heartbeats the
+    leases of every row it still holds. Short leases mean rows held by a dead worker are
+    recycled after lease_minutes instead of the full claim TTL.
+    """
+
+    def __init__(self, claim_fn, worker_id=None, lease_minutes=15, max_workers=1,
+                 min_batch=None, max_batch=200, target_batch_seconds=600,
+                 max_total=None, deadline=None):
+        self.claim_fn = claim_fn  # claim_fn(limit, ttl_minutes) -> DataFrame of claimed rows
+        self.worker_id = _get_worker_id(worker_id)
+        self.lease_minutes = max(1, int(lease_minutes))
+        self.min_batch = max(1, int(min_batch or max_workers * 2))
+        self.max_batch = max(self.min_batch, int(max_batch))
+        self.target_batch_seconds = float(target_batch_seconds)
+        self.max_total = max_total
+        self.deadline = deadline  # time.monotonic() value after which no new batches are claimed
+
+        self._buffer = queue.Queue()
+        self._lock = threading.Lock()
+        self._held = set()
+        self._claimed_frames = []
+        self._claimed_total = 0
+        self._next_index = 0
+        self._completions = deque(maxlen=50)
+        self._exhausted = threading.Event()
+        self._stop = threading.Event()
+        self._prefetching = threading.Lock()
+        self._prefetch_thread = None
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="LeaseHeartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def _rate_per_second(self):
+        with self._lock:
+            if len(self._completions) < 2:
+                return None
+            span = self._completions[-1] - self._completions[0]
+            return (len(self._completions) - 1) / span if span > 0 else None
+
+    def _next_batch_size(self):
+        rate = self._rate_per_second()
+        window = self.target_batch_seconds
+        if self.deadline:
+            window = min(window, max(0.0, self.deadline - time.monotonic()))
+        size = int(math.ceil(rate * window)) if rate else self.min_batch
+        size = max(self.min_batch, min(self.max_batch, size))
+        if self.max_total is not None:
+            size = min(size, self.max_total - self._claimed_total)
+        return size
+
+    def _claim_batch(self):
+        if self._exhausted.is_set() or self._stop.is_set():
+            return 0
+        if self.deadline and time.monotonic() >= self.deadline:
+            self._exhausted.set()
+            return 0
+        size = self._next_batch_size()
+        if size <= 0:
+            self._exhausted.set()
+            return 0
+
+        df = self.claim_fn(size, self.lease_minutes)
+        if df is None or df.empty:
+            self._exhausted.set()
+            return 0
+
+        with self._lock:
+            df = df.reset_index(drop=True)
+            df.index = range(self._next_index, self._next_index + len(df))
+            self._next_index += len(df)
+            self._claimed_total += len(df)
+            self._claimed_frames.append(df)
+            for idx, row in df.iterrows():
+                self._held.add(str(row['product_id']).strip())
+                self._buffer.put((idx, row))
+        rate = self._rate_per_second()
+        rate_label = f"{rate * 3600:.0f}/h" if rate else "n/a"
+        print(f"[LeaseQueue] Claimed {len(df)} products (rate={rate_label}, total={self._claimed_total})")
+        return len(df)
+
+    def _prefetch(self):
+        if not self._prefetching.acquire(blocking=False):
+            return
+        try:
+            self._claim_batch()
+        finally:
+            self._prefetching.release()
+
+    def _maybe_prefetch(self):
+        # Start claiming the next batch once the buffer runs low, while workers keep scraping
+        if self._exhausted.is_set() or self._prefetching.locked():
+            return
+        if self._buffer.qsize() <= self.min_batch // 2:
+            thread = threading.Thread(target=self._prefetch, name="LeasePrefetch", daemon=True)
+            self._prefetch_thread = thread
+            thread.start()
+
+    def get(self):
+        """Return the next (index, row) to scrape, or None once the queue is drained."""
+        while not self._stop.is_set():
+            try:
+                item = self._buffer.get_nowait()
+                self._maybe_prefetch()
+                return item
+            except queue.Empty:
+                pass
+            if self._exhausted.is_set() and not self._prefetching.locked():
+                try:
+                    return self._buffer.get_nowait()
+                except queue.Empty:
+                    return None
+            with self._prefetching:
+                if self._buffer.empty():
+                    self._claim_batch()
+        return None
+
+    def prime(self):
+        """Claim the first batch synchronously; returns how many rows were claimed."""
+        with self._prefetching:
+            return self._claim_batch()
+
+    def task_done(self, product_id, completed=True):
+        """Stop heartbeating `product_id`; only scraped products (completed=True) count towards the rate."""
+        with self._lock:
+            self._held.discard(str(product_id).strip())
+            if completed:
+                self._completions.append(time.monotonic())
+
+    def _heartbeat_loop(self):
+        interval = max(30.0, self.lease_minutes * 60 / 3.0)
+        while not self._stop.wait(interval):
+            with self._lock:
+                held = list(self._held)
+            if held:
+                extended = extend_claim_leases(held, self.worker_id)
+                print(f"[LeaseQueue] Heartbeat extended {extended}/{len(held)} leases")
+
+    def claimed_df(self):
+        with self._lock:
+            if not self._claimed_frames:
+                return pd.DataFrame()
+            return pd.concat(self._claimed_frames)
+
+    def close(self):
+        """Stop claiming and heartbeating; waits for an in-flight claim so claimed_df() includes its rows."""
+        self._stop.set()
+        self._exhausted.set()
+        thread = self._prefetch_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        # A synchronous claim from get() in another worker thread holds the same lock
+        with self._prefetching:
+            pass
+        self._heartbeat_thread.join(timeout=5)
+
 def reset_error_products_to_pending():
     """Reset all products with 'error' scraping_status to 'pending' to retry them."""
     conn = None
     cursor = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+        conn = _get_pg_conn()
         cursor = conn.cursor()
         cursor.execute(
             "UPDATE osb_products SET scraping_status = 'pending', claimed_at = NULL, claimed_by = NULL WHERE scraping_status = 'error'"
@@ -1423,13 +2348,7 @@ def reset_invalid_url_products_for_retry():
     conn = None
     cursor = None
     try:
-        pg_host = os.environ.get("PG_HOST")
-        pg_port = os.environ.get("PG_PORT", "5432")
-        pg_user = os.environ.get("PG_USER")
-        pg_pass = os.environ.get("PG_PASS")
-        pg_db = os.environ.get("PG_DB")
-
-        conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
+        conn = _get_pg_conn()
         cursor = conn.cursor()
         
         # Select target product IDs that have invalid URLs (e.g. 1stopbedrooms or not ibp/share URLs)
@@ -1450,6 +2369,8 @@ def reset_invalid_url_products_for_retry():
             
             # 2. Delete the scraping results for these products
             cursor.execute("DELETE FROM google_shopping_results WHERE product_id = ANY(%s)", (target_ids,))
+            if _summary_table_available(cursor):
+                cursor.execute("DELETE FROM google_shopping_product_summary WHERE product_id = ANY(%s)", (target_ids,))
             
             # 3. Update osb_products status to pending and clear claims/errors
             cursor.execute(
@@ -1485,324 +2406,195 @@ def reset_invalid_url_products_for_retry():
             except Exception:
                 pass
 
+RECONCILIATION_REPORT_COLUMNS = [
+    'Product Name', 'Product Code', 'Barcode', 'Brand', 'Category',
+    'Product Tags', 'Number of Matches', 'My Index', 'My Position',
+    'Cheapest Site', 'Highest Site', 'Minimum Price (Total Price)',
+    'Maximum Price (Total Price)', 'Average Price (Total Price)',
+    'My Price', 'My Total Price', 'My Product Cost', 'Additional Cost',
+    'SmartPrice', 'Last Update Cycle', 'Site', 'Site Index', 'Total Price',
+    'Change direction', 'Stock', 'URL', 'OSB URL match', 'Scrapped url(google url)',
+    'Original Price', 'Discount Amount', 'Coupon Code', 'Coupon Remark',
+    'Seller Rating', 'Delivery Tagline'
+]
+
+# One row per competitor offer (or one placeholder row for products without offers),
+# in RECONCILIATION_REPORT_COLUMNS order. Per-product price stats, cheapest/highest site
+# and My Price are read from google_shopping_product_summary; offers are ranked by
+# google_position (NULLs last) with row_number(). OSB URL match uses the OFFER_ROWS_SQL is_me
+# rule ({offer_rows}) like the summary. %(now)s fills an empty Last Update Cycle.
+RECONCILIATION_REPORT_SQL = """
+WITH prods AS (
+    SELECT product_id, name, gtin, brand, product_type AS category, keyword, url
+    FROM osb_products
+    WHERE scraping_status != 'pending' AND status = 1
+),
+offers AS (
+    SELECT
+        s.product_id,
+        s.seller_name,
+        s.price::float8 AS price,
+        s.seller_url,
+        s.stock_status,
+        s.original_price::float8 AS original_price,
+        s.discount_amount::float8 AS discount_amount,
+        s.coupon_code,
+        s.coupon_remark,
+        s.seller_rating::float8 AS seller_rating,
+        s.delivery_tagline,
+        s.google_position,
+        me.is_me,
+        row_number() OVER (
+            PARTITION BY s.product_id
+            ORDER BY s.google_position IS NULL, s.google_position
+        ) AS rn
+    FROM google_shopping_sellers s
+    JOIN prods p ON p.product_id = s.product_id
+    JOIN ({offer_rows}) me ON me.offer_id = s.id
+),
+stats AS (
+    SELECT
+        ps.product_id,
+        COALESCE(ps.min_price, 0) AS min_price,
+        COALESCE(ps.max_price, 0) AS max_price,
+        COALESCE(ps.avg_price, 0) AS avg_price,
+        COALESCE(ps.cheapest_seller, '') AS cheapest_site,
+        COALESCE(ps.highest_seller, '') AS highest_site,
+        COALESCE(ps.my_price, 0) AS my_price,
+        ps.comp_min AS cheapest_competitor
+    FROM {summary} ps
+    JOIN prods p ON p.product_id = ps.product_id
+)
+SELECT
+    COALESCE(NULLIF(r.google_title, ''), NULLIF(p.name, ''), '') AS product_name,
+    p.product_id,
+    COALESCE(p.gtin, ''),
+    COALESCE(p.brand, ''),
+    COALESCE(p.category, ''),
+    COALESCE(p.keyword, ''),
+    CASE WHEN o.product_id IS NULL THEN 0 ELSE COALESCE(r.seller_count, 0) END,
+    CASE WHEN o.product_id IS NOT NULL AND COALESCE(r.osb_position, 0) > 0 THEN r.osb_position - 1 ELSE -1 END,
+    CASE WHEN o.product_id IS NULL THEN 0 ELSE COALESCE(r.osb_position, 0) END,
+    COALESCE(st.cheapest_site, ''),
+    COALESCE(st.highest_site, ''),
+    COALESCE(st.min_price, 0::float8),
+    COALESCE(st.max_price, 0::float8),
+    COALESCE(st.avg_price, 0::float8),
+    COALESCE(st.my_price, 0::float8),
+    COALESCE(st.my_price, 0::float8),
+    0::float8,
+    0::float8,
+    CASE
+        WHEN o.product_id IS NULL THEN 0::float8
+        ELSE GREATEST(0::float8, CASE
+            WHEN st.cheapest_competitor IS NOT NULL THEN st.cheapest_competitor - 0.01::float8
+            WHEN st.my_price > 0 THEN st.my_price
+            ELSE st.min_price
+        END)
+    END,
+    COALESCE(to_char(r.updated_at, 'YYYY-MM-DD HH24:MI:SS'), %(now)s),
+    COALESCE(o.seller_name, ''),
+    CASE WHEN o.product_id IS NULL THEN -1 ELSE COALESCE(o.google_position::int, o.rn::int) END,
+    COALESCE(o.price, 0::float8),
+    CASE
+        WHEN st.my_price > 0 AND COALESCE(o.price, 0) > 0 THEN
+            CASE WHEN o.price < st.my_price THEN 'Lower' WHEN o.price > st.my_price THEN 'Higher' ELSE 'Equal' END
+        ELSE 'N/A'
+    END,
+    CASE WHEN o.product_id IS NULL THEN '' ELSE o.stock_status END,
+    CASE WHEN o.product_id IS NULL THEN '' ELSE o.seller_url END,
+    CASE
+        WHEN o.product_id IS NULL THEN COALESCE(NULLIF(r.osb_url_match, ''), 'No')
+        WHEN o.is_me THEN 'Yes'
+        ELSE 'No'
+    END,
+    COALESCE(NULLIF(r.google_seller_page_url, ''), NULLIF(p.url, ''), ''),
+    COALESCE(o.original_price, 0::float8),
+    COALESCE(o.discount_amount, 0::float8),
+    COALESCE(o.coupon_code, ''),
+    COALESCE(o.coupon_remark, ''),
+    o.seller_rating,
+    COALESCE(o.delivery_tagline, '')
+FROM prods p
+LEFT JOIN google_shopping_results r ON r.product_id = p.product_id
+LEFT JOIN stats st ON st.product_id = p.product_id
+LEFT JOIN offers o ON o.product_id = p.product_id
+ORDER BY p.product_id, o.rn
+"""
+
+REPORT_FETCH_SIZE = _env_int("REPORT_FETCH_SIZE", 5000)
+
+def _reconciliation_report_sql(cursor):
+    """RECONCILIATION_REPORT_SQL reading the summary table, or the same rollup inline when it does not exist yet."""
+    # OSB URL match uses the same is_me rule as the summary's My Price / competitor stats
+    sql = RECONCILIATION_REPORT_SQL.replace(
+        "{offer_rows}", OFFER_ROWS_SQL.replace("{filter}", "JOIN prods p ON p.product_id = s.product_id")
+    )
+    cursor.execute("SELECT to_regclass('google_shopping_product_summary') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        return sql.replace("{summary}", "google_shopping_product_summary")
+    print("google_shopping_product_summary not found (run --migrate-summary); aggregating google_shopping_sellers instead.")
+    return sql.replace("{summary}", f"({_summary_select_sql('prods p')})")
+
 def generate_reconciliation_report(output_path):
-    """Query the database and compile the detailed flat reconciliation CSV report."""
+    """Stream the detailed flat reconciliation CSV report straight from a server-side cursor."""
     conn = None
+    cursor = None
+    tmp_path = f"{output_path}.tmp"
     try:
-        try:
-            pg_host = os.environ.get("PG_HOST")
-            pg_port = os.environ.get("PG_PORT", "5432")
-            pg_user = os.environ.get("PG_USER")
-            pg_pass = os.environ.get("PG_PASS")
-            pg_db = os.environ.get("PG_DB")
-
-            conn = psycopg2.connect(host=pg_host, port=pg_port, user=pg_user, password=pg_pass, dbname=pg_db)
-            
-            # Fetch only products that have been scraped (non-pending status) and are active (status = 1)
-            products_df = pd.read_sql("SELECT product_id, name, gtin, brand, product_type AS category, keyword, url, scraping_status FROM osb_products WHERE scraping_status != 'pending' AND status = 1", conn)
-            results_df = pd.read_sql(
-                """
-                SELECT 
-                    r.product_id, 
-                    r.google_title AS product_name, 
-                    r.seller_count, 
-                    r.osb_position, 
-                    r.updated_at, 
-                    r.google_seller_page_url AS url, 
-                    r.osb_url_match 
-                FROM google_shopping_results r
-                JOIN osb_products p ON r.product_id = p.product_id
-                WHERE p.status = 1
-                """,
-                conn
-            )
-            sellers_df = pd.read_sql(
-                """
-                SELECT 
-                    s.product_id AS product_code, 
-                    s.seller_name, 
-                    s.price AS seller_price, 
-                    s.seller_url, 
-                    s.stock_status,
-                    s.original_price,
-                    s.discount_amount,
-                    s.coupon_code,
-                    s.coupon_remark,
-                    s.seller_rating,
-                    s.delivery_tagline,
-                    s.google_position
-                FROM google_shopping_sellers s
-                JOIN osb_products p ON s.product_id = p.product_id
-                WHERE p.status = 1
-                """,
-                conn
-            )
-        finally:
-            if conn:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-
-        if products_df.empty:
+        started = time.perf_counter()
+        conn = _get_pg_conn()
+        with conn.cursor() as probe:
+            report_sql = _reconciliation_report_sql(probe)
+        # Named cursor: rows are fetched REPORT_FETCH_SIZE at a time instead of materialising the report
+        cursor = conn.cursor(name="gs_reconciliation_report")
+        cursor.itersize = REPORT_FETCH_SIZE
+        cursor.execute(report_sql, {"now": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+
+        row_count = 0
+        product_count = 0
+        last_product_id = None
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(RECONCILIATION_REPORT_COLUMNS)
+            for row in cursor:
+                writer.writerow(row)
+                row_count += 1
+                if row[1] != last_product_id:
+                    # Rows arrive ordered by product_id
+                    product_count += 1
+                    last_product_id = row[1]
+
+        if row_count == 0:
+            os.remove(tmp_path)
             print("No products found in DB to generate report.")
             return None
 
-        print(f"Generating report from {len(products_df)} products, {len(results_df)} scraped results, and {len(sellers_df)} competitor offers...")
-
-        # Build a dictionary of scraped results for fast lookup
-        results_dict = {row['product_id']: row for _, row in results_df.iterrows()}
-        
-        # Group sellers by product_code for summary stats
-        sellers_by_prod = {}
-        for _, s_row in sellers_df.iterrows():
-            p_code = s_row['product_code']
-            if p_code not in sellers_by_prod:
-                sellers_by_prod[p_code] = []
-            sellers_by_prod[p_code].append(s_row)
-
-        report_rows = []
-
-        for _, p_row in products_df.iterrows():
-            p_id = p_row['product_id']
-            r_row = results_dict.get(p_id, {})
-            
-            # Product level fields
-            prod_name = r_row.get('product_name') or p_row.get('name') or ''
-            barcode = p_row.get('gtin') or ''
-            brand = p_row.get('brand') or ''
-            category = p_row.get('category') or ''
-            tags = p_row.get('keyword') or ''
-            num_matches = int(r_row.get('seller_count') or 0)
-            my_position = int(r_row.get('osb_position') or 0)
-            my_index = my_position - 1 if my_position > 0 else -1
-            
-            # Competitor stats for this product
-            p_sellers = sellers_by_prod.get(p_id, [])
-            prices = []
-            for s in p_sellers:
-                if s['seller_price'] is not None:
-                    try:
-                        prices.append(float(s['seller_price']))
-                    except:
-                        pass
-            
-            min_price = min(prices) if prices else 0.00
-            max_price = max(prices) if prices else 0.00
-            avg_price = sum(prices) / len(prices) if prices else 0.00
-            
-            # Find cheapest and highest site
-            cheapest_site = ''
-            highest_site = ''
-            if p_sellers:
-                valid_sellers = [s for s in p_sellers if s['seller_price'] is not None]
-                if valid_sellers:
-                    try:
-                        cheapest_item = min(valid_sellers, key=lambda x: float(x['seller_price']))
-                        highest_item = max(valid_sellers, key=lambda x: float(x['seller_price']))
-                        cheapest_site = cheapest_item['seller_name']
-                        highest_site = highest_item['seller_name']
-                    except:
-                        pass
-
-            # Find My Price (1StopBedrooms)
-            my_price = 0.00
-            for s in p_sellers:
-                if s['seller_name'] == '1StopBedrooms':
-                    try:
-                        my_price = float(s['seller_price']) if s['seller_price'] is not None else 0.00
-                    except:
-                        my_price = 0.00
-                    break
-            
-            my_total_price = my_price
-            my_product_cost = 0.00  # Default
-            additional_cost = 0.00  # Default
-            
-            # Calculate SmartPrice
-            # Rule: price below the cheapest competitor (excluding 1StopBedrooms)
-            competitor_prices = []
-            for s in p_sellers:
-                if s['seller_name'] != '1StopBedrooms' and s['seller_price'] is not None:
-                    try:
-                        competitor_prices.append(float(s['seller_price']))
-                    except:
-                        pass
-            
-            if competitor_prices:
-                cheapest_competitor_price = min(competitor_prices)
-                smart_price = cheapest_competitor_price - 0.01
-            else:
-                smart_price = my_price if my_price > 0 else min_price
-                
-            # Keep SmartPrice sane (e.g. not negative)
-            smart_price = max(0.00, smart_price)
-            
-            last_update_cycle = r_row.get('updated_at')
-            if pd.isna(last_update_cycle) or not last_update_cycle:
-                last_update_cycle = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                if isinstance(last_update_cycle, str):
-                    pass
-                else:
-                    last_update_cycle = last_update_cycle.strftime("%Y-%m-%d %H:%M:%S")
-
-            scrapped_url = r_row.get('url') or p_row.get('url') or ''
-            osb_url_match = r_row.get('osb_url_match') or 'No'
-
-            # If there are NO sellers, we still write 1 row for the product so it is represented in the file
-            if not p_sellers:
-                report_rows.append({
-                    'Product Name': prod_name,
-                    'Product Code': p_id,
-                    'Barcode': barcode,
-                    'Brand': brand,
-                    'Category': category,
-                    'Product Tags': tags,
-                    'Number of Matches': 0,
-                    'My Index': -1,
-                    'My Position': 0,
-                    'Cheapest Site': '',
-                    'Highest Site': '',
-                    'Minimum Price (Total Price)': 0.00,
-                    'Maximum Price (Total Price)': 0.00,
-                    'Average Price (Total Price)': 0.00,
-                    'My Price': 0.00,
-                    'My Total Price': 0.00,
-                    'My Product Cost': 0.00,
-                    'Additional Cost': 0.00,
-                    'SmartPrice': 0.00,
-                    'Last Update Cycle': last_update_cycle,
-                    'Site': '',
-                    'Site Index': -1,
-                    'Total Price': 0.00,
-                    'Change direction': 'N/A',
-                    'Stock': '',
-                    'URL': '',
-                    'OSB URL match': osb_url_match,
-                    'Scrapped url(google url)': scrapped_url,
-                    'Original Price': 0.00,
-                    'Discount Amount': 0.00,
-                    'Coupon Code': '',
-                    'Coupon Remark': '',
-                    'Seller Rating': '',
-                    'Delivery Tagline': ''
-                })
-            else:
-                # Sort sellers by google_position, placing Null/None/NaN values at the end
-                sorted_sellers = sorted(
-                    p_sellers, 
-                    key=lambda x: (
-                        x.get('google_position') is None or pd.isna(x.get('google_position')), 
-                        float(x.get('google_position')) if (x.get('google_position') is not None and not pd.isna(x.get('google_position'))) else 999.0
-                    )
-                )
-                # Add a row for EACH competitor offer
-                for idx, s in enumerate(sorted_sellers):
-                    s_name = s['seller_name']
-                    try:
-                        s_price = float(s['seller_price']) if s['seller_price'] is not None else 0.00
-                    except:
-                        s_price = 0.00
-                    s_url = s['seller_url']
-                    s_stock = s['stock_status']
-                    
-                    s_osb_match = 'Yes' if s_name == '1StopBedrooms' else 'No'
-                    
-                    # Determine Change direction
-                    change_dir = 'N/A'
-                    if my_price > 0 and s_price > 0:
-                        if s_price < my_price:
-                            change_dir = 'Lower'
-                        elif s_price > my_price:
-                            change_dir = 'Higher'
-                        else:
-                            change_dir = 'Equal'
-                            
-                    s_pos = s.get('google_position')
-                    if s_pos is not None and not pd.isna(s_pos):
-                        site_index = int(float(s_pos))
-                    else:
-                        site_index = idx + 1
-
-                    orig_price = s.get('original_price')
-                    orig_price = float(orig_price) if (orig_price is not None and not pd.isna(orig_price)) else 0.00
-                    
-                    disc_amount = s.get('discount_amount')
-                    disc_amount = float(disc_amount) if (disc_amount is not None and not pd.isna(disc_amount)) else 0.00
-
-                    coupon_code = s.get('coupon_code')
-                    coupon_code = str(coupon_code) if (coupon_code is not None and not pd.isna(coupon_code)) else ''
-
-                    coupon_remark = s.get('coupon_remark')
-                    coupon_remark = str(coupon_remark) if (coupon_remark is not None and not pd.isna(coupon_remark)) else ''
-
-                    sel_rating = s.get('seller_rating')
-                    sel_rating = float(sel_rating) if (sel_rating is not None and not pd.isna(sel_rating)) else None
-
-                    del_tagline = s.get('delivery_tagline')
-                    del_tagline = str(del_tagline) if (del_tagline is not None and not pd.isna(del_tagline)) else ''
-
-                    report_rows.append({
-                        'Product Name': prod_name,
-                        'Product Code': p_id,
-                        'Barcode': barcode,
-                        'Brand': brand,
-                        'Category': category,
-                        'Product Tags': tags,
-                        'Number of Matches': num_matches,
-                        'My Index': my_index,
-                        'My Position': my_position,
-                        'Cheapest Site': cheapest_site,
-                        'Highest Site': highest_site,
-                        'Minimum Price (Total Price)': min_price,
-                        'Maximum Price (Total Price)': max_price,
-                        'Average Price (Total Price)': avg_price,
-                        'My Price': my_price,
-                        'My Total Price': my_total_price,
-                        'My Product Cost': my_product_cost,
-                        'Additional Cost': additional_cost,
-                        'SmartPrice': smart_price,
-                        'Last Update Cycle': last_update_cycle,
-                        'Site': s_name,
-                        'Site Index': site_index,
-                        'Total Price': s_price,
-                        'Change direction': change_dir,
-                        'Stock': s_stock,
-                        'URL': s_url,
-                        'OSB URL match': s_osb_match,
-                        'Scrapped url(google url)': scrapped_url,
-                        'Original Price': orig_price,
-                        'Discount Amount': disc_amount,
-                        'Coupon Code': coupon_code,
-                        'Coupon Remark': coupon_remark,
-                        'Seller Rating': sel_rating if sel_rating is not None else '',
-                        'Delivery Tagline': del_tagline
-                    })
-
-        report_df = pd.DataFrame(report_rows)
-        # Reorder to guarantee exactly matching requested columns order
-        COLUMNS_ORDER = [
-            'Product Name', 'Product Code', 'Barcode', 'Brand', 'Category',
-            'Product Tags', 'Number of Matches', 'My Index', 'My Position',
-            'Cheapest Site', 'Highest Site', 'Minimum Price (Total Price)',
-            'Maximum Price (Total Price)', 'Average Price (Total Price)',
-            'My Price', 'My Total Price', 'My Product Cost', 'Additional Cost',
-            'SmartPrice', 'Last Update Cycle', 'Site', 'Site Index', 'Total Price',
-            'Change direction', 'Stock', 'URL', 'OSB URL match', 'Scrapped url(google url)',
-            'Original Price', 'Discount Amount', 'Coupon Code', 'Coupon Remark',
-            'Seller Rating', 'Delivery Tagline'
-        ]
-        report_df = report_df[COLUMNS_ORDER]
-        report_df.to_csv(output_path, index=False)
-        print(f"✓ Reconciliation report saved successfully to: {output_path} ({len(report_rows)} rows)")
-        
+        os.replace(tmp_path, output_path)
+        print(f"✓ Reconciliation report saved successfully to: {output_path} ({row_count} rows, {product_count} products, {time.perf_counter() - started:.1f}s)")
+
         # FTP upload has been disabled per user request
         return output_path
     except Exception as e:
         print(f"Error generating reconciliation report: {e}")
         traceback.print_exc()
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
         return None
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
 
 PRODUCT_FINAL_COLUMNS = [
     "product_id",
@@ -1848,6 +2640,18 @@ PRODUCT_FINAL_COLUMNS = [
     "best_price_url",
     "popular_url"
 ]
+try:
+    import panel_extract
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import panel_extract
+
+# Set FAST_PANEL_EXTRACT=0 to go back to one WebDriver call per element
+FAST_PANEL_EXTRACT = os.environ.get("FAST_PANEL_EXTRACT", "1").strip().lower() not in ("0", "false", "no")
+
+# Directory to save replayable panel fixtures into (see panel_extract.capture_fixture); off when empty
+CAPTURE_FIXTURES_DIR = os.environ.get("GS_CAPTURE_FIXTURES", "").strip() or None
+
 # Import the existing captcha solving functions
 try:
     from solvecaptcha import solve_recaptcha_audio
@@ -2135,6 +2939,240 @@ def is_driver_connectivity_error(err):
         or "session not created" in msg
     )
 
+# ---------------- Managed browser pool ----------------
+
+def _available_memory_mb():
+    """MemAvailable from /proc/meminfo (psutil when installed); None if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    return None
+
+def _driver_rss_mb(driver):
+    """Resident memory of the browser process tree behind a driver (requires psutil)."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    pid = getattr(driver, "browser_pid", None)
+    if not pid:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs if p.is_running()) / (1024 * 1024)
+    except Exception:
+        return None
+
+def is_driver_healthy(driver):
+    try:
+        _ = driver.current_url
+        return driver.execute_script("return document.readyState") is not None
+    except Exception:
+        return False
+
+class BrowserPool:
+    """
+    Pool of warm-started Selenium drivers for process_chunk worker threads.
+
+    Drivers come out of setup_driver already warmed (google.com visited, consent accepted).
+    Drivers are recycled after recycle_after_pages products, when their browser RSS crosses
+    max_rss_mb, or when a health check between products fails.
+
+    The pool follows memory headroom while it runs: a driver is only started while
+    MemAvailable minus reserve_mb leaves room for another est_browser_mb browser (the first
+    driver always starts), so workers wait for headroom instead of overcommitting and a
+    worker whose driver is recycled under memory pressure parks until memory frees up.
+    max_size (BROWSER_POOL_MAX_SIZE) is an optional hard ceiling on top of that.
+    prewarm > 0 keeps that many spare drivers starting in the background so a recycled
+    driver is replaced without startup latency; it is off by default because every spare
+    is a full Chrome held in memory.
+    """
+
+    def __init__(self, max_workers=1, recycle_after_pages=150, max_rss_mb=1500,
+                 prewarm=0, est_browser_mb=700, reserve_mb=1024, max_size=None, admit_wait_seconds=5):
+        self.recycle_after_pages = max(1, int(recycle_after_pages))
+        self.max_rss_mb = max_rss_mb
+        self.prewarm = max(0, int(prewarm))
+        self.est_browser_mb = est_browser_mb
+        self.reserve_mb = reserve_mb
+        self.max_size = max(1, int(max_size)) if max_size else None
+        self.admit_wait_seconds = admit_wait_seconds
+        self.target_size = self._initial_size(max_workers)
+
+        self._spares = queue.Queue()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._warming = 0
+        self._closed = False
+        self._pages = {}  # id(driver) -> pages served
+        self.stats = {"started": 0, "recycled": 0, "unhealthy": 0, "memory_recycled": 0,
+                      "spare_hits": 0, "memory_waits": 0, "peak_active": 0}
+
+    def _initial_size(self, requested):
+        """Worker slots to run: the requested count under max_size; memory is checked per driver start."""
+        size = max(1, int(requested))
+        if self.max_size is not None and self.max_size < size:
+            print(f"[BrowserPool] Capping pool at {self.max_size} drivers (requested {size}, BROWSER_POOL_MAX_SIZE)")
+            size = self.max_size
+        available = _available_memory_mb()
+        if available is not None:
+            fits = max(1, int((available - self.reserve_mb) // self.est_browser_mb))
+            if fits < size:
+                print(f"[BrowserPool] Memory currently fits {fits} of {size} drivers (available_mb={available:.0f}); "
+                      f"the rest start when headroom allows")
+        return size
+
+    def _has_headroom(self):
+        available = _available_memory_mb()
+        return available is None or available - self.reserve_mb >= self.est_browser_mb
+
+    def _start_driver(self):
+        driver = setup_driver(max_attempts=3, base_delay=5)
+        with self._lock:
+            self._pages[id(driver)] = 0
+            self.stats["started"] += 1
+        return driver
+
+    def _warm_spare(self):
+        try:
+            driver = self._start_driver()
+            if self._closed:
+                self._quit(driver)
+            else:
+                self._spares.put(driver)
+        except Exception as e:
+            print(f"[BrowserPool] Spare driver warm-up failed: {e}")
+        finally:
+            with self._lock:
+                self._warming -= 1
+
+    def _top_up_spares(self):
+        with self._lock:
+            if self._closed or not self.prewarm:
+                return
+            missing = self.prewarm - self._spares.qsize() - self._warming
+            if missing <= 0 or not self._has_headroom():
+                return
+            self._warming += missing
+        for _ in range(missing):
+            threading.Thread(target=self._warm_spare, name="BrowserPoolWarmup", daemon=True).start()
+
+    def _quit(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _take_spare(self):
+        while True:
+            try:
+                driver = self._spares.get_nowait()
+            except queue.Empty:
+                return None
+            if is_driver_healthy(driver):
+                with self._lock:
+                    self.stats["spare_hits"] += 1
+                return driver
+            self._quit(driver)
+
+    def _admit(self):
+        """Reserve an active slot if memory allows another browser (always for the first one)."""
+        with self._lock:
+            if self._closed:
+                return False
+            if self._active > 0 and not self._has_headroom():
+                return False
+            self._active += 1
+            self.stats["peak_active"] = max(self.stats["peak_active"], self._active)
+            return True
+
+    def acquire(self, stop_event=None):
+        """
+        Take a ready driver: a pre-warmed spare when available, else start one once memory
+        headroom allows. Waits for headroom; returns None if stop_event is set (or the pool
+        closes) while waiting.
+        """
+        waited = False
+        while not self._admit():
+            if self._closed:
+                return None
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.stats["memory_waits"] += 1
+                print(f"[BrowserPool] Waiting for memory headroom ({self._active} drivers active)")
+            if stop_event is not None:
+                if stop_event.wait(self.admit_wait_seconds):
+                    return None
+            else:
+                time.sleep(self.admit_wait_seconds)
+
+        try:
+            driver = self._take_spare() or self._start_driver()
+        except Exception:
+            with self._lock:
+                self._active -= 1
+            raise
+        self._top_up_spares()
+        return driver
+
+    def checkpoint(self, driver, stop_event=None):
+        """
+        Call between products. Returns the driver to keep using: the same one, or a fresh
+        replacement when it was recycled (after waiting for memory headroom if needed).
+        Returns None only when stop_event is set while waiting.
+        """
+        with self._lock:
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+
+        reason = None
+        if not is_driver_healthy(driver):
+            reason = "unhealthy"
+        elif pages >= self.recycle_after_pages:
+            reason = "recycled"
+        elif self.max_rss_mb:
+            rss = _driver_rss_mb(driver)
+            if rss is not None and rss >= self.max_rss_mb:
+                reason = "memory_recycled"
+        if reason is None:
+            return driver
+
+        print(f"[BrowserPool] Replacing driver after {pages} pages ({reason})")
+        with self._lock:
+            self.stats[reason] += 1
+        self.release(driver, reuse=False)
+        return self.acquire(stop_event)
+
+    def release(self, driver, reuse=True):
+        with self._lock:
+            self._active = max(0, self._active - 1)
+        if reuse and self.prewarm and not self._closed and is_driver_healthy(driver):
+            self._spares.put(driver)
+        else:
+            self._quit(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._quit(self._spares.get_nowait())
+            except queue.Empty:
+                break
+        print(f"[BrowserPool] Closed: {self.stats}")
+
 def build_error_result(product_id, keyword, url, message, status="error"):
     return {
         'product_id': product_id,
@@ -2838,78 +3876,8 @@ def expand_more_stores(driver):
         except Exception:
             break
 
-def populate_offers_for_selected_product(driver, result, product_id, osb_url):
-    result['competitors'] = []
-    raw_url = (extract_share_url(driver) or driver.current_url or "").strip()
-    if raw_url.startswith("https://www.google.com/search?ibp=oshop") or raw_url.startswith("https://share.google/"):
-        result['product_url'] = raw_url
-    else:
-        result['product_url'] = ""
-
-    expand_more_stores(driver)
-
-    last_error = None
-    offers_grid = None
-    for offer_attempt in range(OFFERS_RETRIES):
-        try:
-            offers_grid = WebDriverWait(driver, OFFERS_WAIT_SECONDS).until(
-                EC.presence_of_element_located((By.XPATH, "//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']"))
-            )
-            break
-        except Exception as exc:
-            last_error = exc
-            if offer_attempt + 1 < OFFERS_RETRIES:
-                time.sleep(1)
-
-    if offers_grid is None:
-        raise last_error or Exception("Offers grid not found")
-
-    exists = len(driver.find_elements(
-        By.XPATH,
-        "//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']"
-    )) > 0
-
-    if exists > 0:
-        result['options'] = get_product_options(driver)
-
-    # ★ NEW: Add product about info scraping
-    try:
-        about_data_json = get_product_about_info(driver)
-        about_data = json.loads(about_data_json)
-        result['product_about_info'] = about_data_json
-        result['description'] = about_data.get('description', '')
-        result['attributes'] = json.dumps(about_data.get('attributes', {}))
-        result['main_image'] = about_data.get('main_image', '')
-        result['gs_images'] = json.dumps(about_data.get('gs_images', []))
-        result['rating_star'] = about_data.get('rating_star')
-        result['rating_count'] = about_data.get('rating_count')
-        result['typical_price_low'] = about_data.get('typical_price_low')
-        result['typical_price_high'] = about_data.get('typical_price_high')
-        result['popular_url'] = about_data.get('popular_url', '')
-
-        # Extract mapped attributes and merge them into result
-        attr_dict = about_data.get('attributes', {})
-        mapped_attrs = extract_mapped_attributes(attr_dict)
-        result.update(mapped_attrs)
-
-        print("✓ Product about info, description, attributes, image, ratings, typical prices, and gallery extracted")
-    except Exception as e:
-        print(f"Error extracting product about info: {str(e)}")
-        result['product_about_info'] = json.dumps({'description': '', 'attributes': {}, 'main_image': '', 'gs_images': []})
-        result['description'] = ''
-        result['attributes'] = json.dumps({})
-        result['main_image'] = ''
-        result['gs_images'] = json.dumps([])
-        result['rating_star'] = None
-        result['rating_count'] = None
-        result['typical_price_low'] = None
-        result['typical_price_high'] = None
-        result['popular_url'] = ''
-        
-        # Merge empty mapped attributes
-        mapped_attrs = extract_mapped_attributes({})
-        result.update(mapped_attrs)
-
+def extract_offers_from_grid(offers_grid, product_id):
+    """Element-by-element offer extraction (fallback for the single-script panel extractor)."""
     offer_elements = offers_grid.find_elements(By.CLASS_NAME, 'R5K7Cb')
     print(f"Found {len(offer_elements)} offers")
 
@@ -3042,7 +4010,110 @@ def populate_offers_for_selected_product(driver, result, product_id, osb_url):
         }
 
         competitors.append(competitor_data)
-        result['competitors'].append(competitor_data)
+
+    return competitors
+
+def populate_offers_for_selected_product(driver, result, product_id, osb_url):
+    result['competitors'] = []
+    with stage_timer("share_url"):
+        raw_url = (extract_share_url(driver) or driver.current_url or "").strip()
+    if raw_url.startswith("https://www.google.com/search?ibp=oshop") or raw_url.startswith("https://share.google/"):
+        result['product_url'] = raw_url
+    else:
+        result['product_url'] = ""
+
+    with stage_timer("more_stores"):
+        expand_more_stores(driver)
+
+    last_error = None
+    offers_grid = None
+    with stage_timer("offers_wait"):
+        for offer_attempt in range(OFFERS_RETRIES):
+            try:
+                offers_grid = WebDriverWait(driver, OFFERS_WAIT_SECONDS).until(
+                    EC.presence_of_element_located((By.XPATH, "//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']"))
+                )
+                break
+            except Exception as exc:
+                last_error = exc
+                if offer_attempt + 1 < OFFERS_RETRIES:
+                    time.sleep(1)
+
+    if offers_grid is None:
+        raise last_error or Exception("Offers grid not found")
+
+    panel = None
+    if FAST_PANEL_EXTRACT:
+        try:
+            with stage_timer("panel_extract"):
+                panel = panel_extract.extract_panel(driver, product_id)
+        except Exception as e:
+            print(f"Single-script panel extraction failed, falling back to element lookups: {e}")
+
+    if panel is not None:
+        if panel['has_options']:
+            result['options'] = json.dumps(panel['options'], indent=2)
+    else:
+        exists = len(driver.find_elements(
+            By.XPATH,
+            "//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']"
+        )) > 0
+
+        if exists > 0:
+            result['options'] = get_product_options(driver)
+
+    # ★ NEW: Add product about info scraping
+    try:
+        about_data_json = json.dumps(panel['about']) if panel is not None else get_product_about_info(driver)
+        about_data = json.loads(about_data_json)
+        result['product_about_info'] = about_data_json
+        result['description'] = about_data.get('description', '')
+        result['attributes'] = json.dumps(about_data.get('attributes', {}))
+        result['main_image'] = about_data.get('main_image', '')
+        result['gs_images'] = json.dumps(about_data.get('gs_images', []))
+        result['rating_star'] = about_data.get('rating_star')
+        result['rating_count'] = about_data.get('rating_count')
+        result['typical_price_low'] = about_data.get('typical_price_low')
+        result['typical_price_high'] = about_data.get('typical_price_high')
+        result['popular_url'] = about_data.get('popular_url', '')
+
+        # Extract mapped attributes and merge them into result
+        attr_dict = about_data.get('attributes', {})
+        mapped_attrs = extract_mapped_attributes(attr_dict)
+        result.update(mapped_attrs)
+
+        print("✓ Product about info, description, attributes, image, ratings, typical prices, and gallery extracted")
+    except Exception as e:
+        print(f"Error extracting product about info: {str(e)}")
+        result['product_about_info'] = json.dumps({'description': '', 'attributes': {}, 'main_image': '', 'gs_images': []})
+        result['description'] = ''
+        result['attributes'] = json.dumps({})
+        result['main_image'] = ''
+        result['gs_images'] = json.dumps([])
+        result['rating_star'] = None
+        result['rating_count'] = None
+        result['typical_price_low'] = None
+        result['typical_price_high'] = None
+        result['popular_url'] = ''
+        
+        # Merge empty mapped attributes
+        mapped_attrs = extract_mapped_attributes({})
+        result.update(mapped_attrs)
+
+    if panel is not None:
+        competitors = panel['offers']
+        print(f"Found {len(competitors)} offers")
+    else:
+        with stage_timer("offers_extract"):
+            competitors = extract_offers_from_grid(offers_grid, product_id)
+    result['competitors'].extend(competitors)
+
+    if CAPTURE_FIXTURES_DIR:
+        try:
+            fixture_path = panel_extract.capture_fixture(driver, CAPTURE_FIXTURES_DIR, product_id, result['product_url'], panel)
+            print(f"✓ Saved panel fixture to {fixture_path}")
+        except Exception as e:
+            print(f"Could not save panel fixture for {product_id}: {e}")
 
     search_seller = '1StopBedrooms'
     sellers = [c['seller'] for c in competitors]
@@ -3166,9 +4237,16 @@ def run_product_selection_phase(driver, product_id, phase_name, search_url, base
     limit = min(MAX_PRODUCT_TRIES, len(products))
     log_matching(product_id, f"Found {len(products)} products -> trying {limit if len(products) >= MAX_PRODUCT_TRIES else 'all'}")
 
+    try:
+        metas = panel_extract.extract_card_metas(driver, products) if FAST_PANEL_EXTRACT else None
+    except Exception as e:
+        print(f"Batched card meta extraction failed, falling back: {e}")
+        metas = None
+    if metas is None or len(metas) != len(products):
+        metas = [extract_product_card_meta(product) for product in products]
+
     matching_products = []
-    for product in products:
-        meta = extract_product_card_meta(product)
+    for meta in metas:
         if fallback_first or product_matches_keyword(meta.get('product_name', ''), base_result['keyword']):
             matching_products.append(meta)
 
@@ -3220,8 +4298,10 @@ def get_existing_product_url_from_db(product_id):
     try:
         conn = _get_pg_conn()
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT google_seller_page_url FROM google_shopping_results WHERE product_id = %s",
+        _execute_prepared(
+            cursor,
+            "gs_existing_url",
+            "SELECT google_seller_page_url FROM google_shopping_results WHERE product_id = $1::text::bigint",
             (str(product_id),)
         )
         row = cursor.fetchone()
@@ -3376,10 +4456,12 @@ def build_fallback_search_url(name, bed_size_measure=None, mattress_size=None):
 def scrape_product(driver, product_id, keyword, url, osb_url="", name="", mpn_sku="", color="", bed_size_measure="", mattress_size=""):
     """Scrape individual product from Google Shopping with multi-step search retries."""
     # 1. Check if we already have a valid product_url in product_scraping_results
-    existing_product_url = get_existing_product_url_from_db(product_id)
+    with stage_timer("cache_lookup"):
+        existing_product_url = get_existing_product_url_from_db(product_id)
     if existing_product_url:
         print(f"Attempting to scrape directly using cached URL: {existing_product_url}")
-        result = scrape_product_directly(driver, product_id, keyword, existing_product_url, osb_url)
+        with stage_timer("direct"):
+            result = scrape_product_directly(driver, product_id, keyword, existing_product_url, osb_url)
         status_lower = str(result.get('status', '')).strip().lower()
         if status_lower in {'completed', 'product_found'}:
             return result
@@ -3409,10 +4491,12 @@ def scrape_product(driver, product_id, keyword, url, osb_url="", name="", mpn_sk
             print(f"\n[PID {os.getpid()}] Scraper Phase: {phase_name}")
             print(f"Search URL: {search_url}")
             
-            driver.get(search_url)
+            with stage_timer("search_load"):
+                driver.get(search_url)
             
             # Handle captcha before proceeding
-            captcha_result = handle_captcha(driver, search_url)
+            with stage_timer("captcha"):
+                captcha_result = handle_captcha(driver, search_url)
             if captcha_result == "failed":
                 result = initialize_product_result(product_id, keyword, search_url)
                 result.update({
@@ -3422,22 +4506,25 @@ def scrape_product(driver, product_id, keyword, url, osb_url="", name="", mpn_sk
                 last_result = result
                 continue
             
-            time.sleep(random.uniform(4, 8))
+            with stage_timer("settle_sleep"):
+                time.sleep(random.uniform(4, 8))
             
             # Initialize result structure
             result = initialize_product_result(product_id, keyword, search_url)
             
-            phase_result, matched = run_product_selection_phase(
-                driver, product_id, phase_name, search_url, result, osb_url
-            )
+            with stage_timer("selection"):
+                phase_result, matched = run_product_selection_phase(
+                    driver, product_id, phase_name, search_url, result, osb_url
+                )
             last_result = phase_result
             if matched:
                 return phase_result
             
             # Fallback to first matching product on page if not fully matched in standard mode
-            fallback_result, _ = run_product_selection_phase(
-                driver, product_id, f"{phase_name} fallback", search_url, result, osb_url, fallback_first=True
-            )
+            with stage_timer("fallback_selection"):
+                fallback_result, _ = run_product_selection_phase(
+                    driver, product_id, f"{phase_name} fallback", search_url, result, osb_url, fallback_first=True
+                )
             if fallback_result.get('status') in {'completed', 'product_found', 'product_not_clickable', 'no_offers_found'}:
                 return fallback_result
             
@@ -3526,10 +4613,10 @@ def split_dataframe_to_chunk_files(df, output_dir, total_chunks, prefix):
     return chunk_files
 
 
-def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', worker_id=None, ttl_minutes=60, max_runtime_seconds=None, max_workers=1):
-    """Process a chunk of products"""
+def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', worker_id=None, ttl_minutes=60, max_runtime_seconds=None, max_workers=1, work_queue=None, browser_pool=None):
+    """Process a chunk of products (or pull them from a LeaseWorkQueue when work_queue is given)"""
     try:
-        if df is None or df.empty:
+        if work_queue is None and (df is None or df.empty):
             print(f"Chunk {chunk_id} is empty, skipping")
             return {
                 "success": True,
@@ -3540,11 +4627,13 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
                 "seller_rows": 0,
                 "remaining_rows": 0,
             }
-        df = df.reset_index(drop=True)
+        df = df.reset_index(drop=True) if df is not None else pd.DataFrame()
         resolved_worker_id = _get_worker_id(worker_id)
         started_at = time.monotonic()
 
-        if max_workers > 1:
+        if work_queue is not None:
+            print(f"Processing chunk {chunk_id} from lease queue with {max_workers} thread(s)")
+        elif max_workers > 1:
             print(f"Processing {len(df)} products from chunk {chunk_id} in parallel with {max_workers} threads")
         else:
             print(f"Processing {len(df)} products from chunk {chunk_id} sequentially")
@@ -3558,8 +4647,18 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
         stop_event = threading.Event()
         product_queue = queue.Queue()
         
-        for idx, row in df.iterrows():
-            product_queue.put((idx, row))
+        if work_queue is None:
+            for idx, row in df.iterrows():
+                product_queue.put((idx, row))
+        total_label = "?" if work_queue is not None else len(df)
+
+        def next_product():
+            if work_queue is not None:
+                return work_queue.get()
+            try:
+                return product_queue.get_nowait()
+            except queue.Empty:
+                return None
             
         consecutive_timeouts_map = {} # thread_id -> count
 
@@ -3588,6 +4687,7 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
                         db_queue.task_done()
                         break
                     else:
+                        scraped_data['content_hash'] = compute_content_hash(scraped_data, scraped_data.get('competitors', []))
                         batch_products.append(scraped_data)
                         batch_sellers.extend(scraped_data.get('competitors', []))
                         db_queue.task_done()
@@ -3621,126 +4721,154 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
             thread_id = threading.get_ident()
             driver = None
             try:
-                driver = setup_driver(max_attempts=3, base_delay=5)
+                if browser_pool is not None:
+                    driver = browser_pool.acquire(stop_event)
+                    if driver is None:
+                        return
+                else:
+                    driver = setup_driver(max_attempts=3, base_delay=5)
             except Exception as e:
                 print(f"[Thread {thread_id}] Driver setup failed for chunk {chunk_id}: {str(e)}")
                 traceback.print_exc()
                 return
             
             try:
-                while not product_queue.empty() and not stop_event.is_set():
+                while not stop_event.is_set():
                     if max_runtime_seconds and (time.monotonic() - started_at) >= max_runtime_seconds:
                         print(f"[Thread {thread_id}] !!! MAX RUNTIME REACHED. Stopping worker thread.")
                         stop_event.set()
                         break
                         
-                    try:
-                        index, row = product_queue.get_nowait()
-                    except queue.Empty:
+                    item = next_product()
+                    if item is None:
                         break
-
+                    index, row = item
                     product_id = row['product_id']
-                    web_id = row['web_id']
-                    keyword = row['keyword']
-                    url = row['url']
-                    osb_url = row['osb_url']
-                    name = row['name']
-                    mpnsku = row['mpn_sku']
-                    gtin = row['gtin']
-                    brand = row['brand']
-                    cat = row['category']
-
-                    # Build/regenerate the search URL if it's missing or blank
-                    if not url or not str(url).strip():
-                        url = build_search_url(
-                            name=name,
-                            mpn=mpnsku,
-                            color=row.get('color'),
-                            bed_size_measure=row.get('bed_size_measure'),
-                            mattress_size=row.get('mattress_size')
-                        )
-                        print(f"[Thread {thread_id} - URL regenerated] {url}")
-
-                    # Also rebuild keyword if blank
-                    if not keyword or not str(keyword).strip():
-                        keyword = build_keyword(
-                            name=name,
-                            mpn=mpnsku,
-                            color=row.get('color'),
-                            bed_size_measure=row.get('bed_size_measure'),
-                            mattress_size=row.get('mattress_size')
-                        )
+                    completed = False
+                    try:
+                        web_id = row['web_id']
+                        keyword = row['keyword']
+                        url = row['url']
+                        osb_url = row['osb_url']
+                        name = row['name']
+                        mpnsku = row['mpn_sku']
+                        gtin = row['gtin']
+                        brand = row['brand']
+                        cat = row['category']
+
+                        # Build/regenerate the search URL if it's missing or blank
+                        if not url or not str(url).strip():
+                            url = build_search_url(
+                                name=name,
+                                mpn=mpnsku,
+                                color=row.get('color'),
+                                bed_size_measure=row.get('bed_size_measure'),
+                                mattress_size=row.get('mattress_size')
+                            )
+                            print(f"[Thread {thread_id} - URL regenerated] {url}")
+
+                        # Also rebuild keyword if blank
+                        if not keyword or not str(keyword).strip():
+                            keyword = build_keyword(
+                                name=name,
+                                mpn=mpnsku,
+                                color=row.get('color'),
+                                bed_size_measure=row.get('bed_size_measure'),
+                                mattress_size=row.get('mattress_size')
+                            )
                     
-                    print(f"\n[Thread {thread_id}] Processing {index+1}/{len(df)}: Product ID {product_id}")
+                        print(f"\n[Thread {thread_id}] Processing {index+1}/{total_label}: Product ID {product_id}")
                     
-                    # Check database status and claim the product atomically before scraping
-                    if not verify_and_claim_product(product_id, resolved_worker_id, ttl_minutes):
-                        print(f"[Thread {thread_id}] Skipping product {product_id} - already claimed/completed by another worker.")
-                        continue
+                        # Check database status and claim the product atomically before scraping
+                        if not verify_and_claim_product(product_id, resolved_worker_id, ttl_minutes, leases_only=work_queue is not None):
+                            print(f"[Thread {thread_id}] Skipping product {product_id} - already claimed/completed by another worker.")
+                            continue
                     
-                    try:
-                        scraped_data = scrape_product(
-                            driver, product_id, keyword, url, osb_url,
-                            name=name,
-                            mpn_sku=mpnsku,
-                            color=row.get('color'),
-                            bed_size_measure=row.get('bed_size_measure'),
-                            mattress_size=row.get('mattress_size')
-                        )
-                    except Exception as e:
-                        print(f"[Thread {thread_id}] Error scraping product {product_id}: {str(e)}")
-                        traceback.print_exc()
-                        scraped_data = None
+                        begin_product_timing()
+                        try:
+                            scraped_data = scrape_product(
+                                driver, product_id, keyword, url, osb_url,
+                                name=name,
+                                mpn_sku=mpnsku,
+                                color=row.get('color'),
+                                bed_size_measure=row.get('bed_size_measure'),
+                                mattress_size=row.get('mattress_size')
+                            )
+                        except Exception as e:
+                            print(f"[Thread {thread_id}] Error scraping product {product_id}: {str(e)}")
+                            traceback.print_exc()
+                            scraped_data = None
                     
-                    if not scraped_data:
-                        scraped_data = {
-                            'product_id': product_id,
-                            'status': 'error',
-                            'last_response': 'Scrape failed to return data'
-                        }
-
-                    # Add original fields back
-                    scraped_data['web_id'] = web_id
-                    scraped_data['keyword'] = keyword
-                    scraped_data['osb_url'] = osb_url
-                    scraped_data['name'] = name
-                    scraped_data['mpn_sku'] = mpnsku
-                    scraped_data['gtin'] = gtin
-                    scraped_data['brand'] = brand
-                    scraped_data['category'] = cat
+                        if not scraped_data:
+                            scraped_data = {
+                                'product_id': product_id,
+                                'status': 'error',
+                                'last_response': 'Scrape failed to return data'
+                            }
+                        finish_product_timing(product_id, f"{chunk_id}/{thread_id}", scraped_data.get('status', ''))
+
+                        # Add original fields back
+                        scraped_data['web_id'] = web_id
+                        scraped_data['keyword'] = keyword
+                        scraped_data['osb_url'] = osb_url
+                        scraped_data['name'] = name
+                        scraped_data['mpn_sku'] = mpnsku
+                        scraped_data['gtin'] = gtin
+                        scraped_data['brand'] = brand
+                        scraped_data['category'] = cat
                     
-                    # Queue the scraped data for batch database writing
-                    db_queue.put(scraped_data)
-
-                    # Add to thread-safe results for local CSV files
-                    with results_lock:
-                        product_results.append(scraped_data)
-                        seller_results.extend(scraped_data.get('competitors', []))
+                        # Queue the scraped data for batch database writing
+                        db_queue.put(scraped_data)
+                        completed = True
+
+                        # Add to thread-safe results for local CSV files
+                        with results_lock:
+                            product_results.append(scraped_data)
+                            seller_results.extend(scraped_data.get('competitors', []))
                     
-                    status_lower = str(scraped_data.get('status', '')).strip().lower()
-                    if status_lower == 'timeout_error':
-                        consecutive_timeouts_map[thread_id] = consecutive_timeouts_map.get(thread_id, 0) + 1
-                    else:
-                        consecutive_timeouts_map[thread_id] = 0
+                        status_lower = str(scraped_data.get('status', '')).strip().lower()
+                        if status_lower == 'timeout_error':
+                            consecutive_timeouts_map[thread_id] = consecutive_timeouts_map.get(thread_id, 0) + 1
+                        else:
+                            consecutive_timeouts_map[thread_id] = 0
 
-                    if status_lower == 'captcha_failed':
-                        print(f"[Thread {thread_id}] !!! CAPTCHA DETECTED on Product {product_id}. Stopping all threads in this chunk.")
-                        stop_event.set()
-                        break
-                    elif consecutive_timeouts_map.get(thread_id, 0) >= 2:
-                        print(f"[Thread {thread_id}] !!! TIMEOUT PERSISTS on Product {product_id}. Stopping all threads in this chunk.")
-                        stop_event.set()
-                        break
+                        if status_lower == 'captcha_failed':
+                            print(f"[Thread {thread_id}] !!! CAPTCHA DETECTED on Product {product_id}. Stopping all threads in this chunk.")
+                            stop_event.set()
+                            break
+                        elif consecutive_timeouts_map.get(thread_id, 0) >= 2:
+                            print(f"[Thread {thread_id}] !!! TIMEOUT PERSISTS on Product {product_id}. Stopping all threads in this chunk.")
+                            stop_event.set()
+                            break
                     
-                    # Sleep between products
-                    time.sleep(random.uniform(1, 3))
+                        # Health-check / recycle the pooled driver between products
+                        if browser_pool is not None:
+                            try:
+                                driver = browser_pool.checkpoint(driver, stop_event)
+                            except Exception as e:
+                                print(f"[Thread {thread_id}] Driver replacement failed: {e}")
+                                driver = None
+                            if driver is None:
+                                break
+
+                        # Sleep between products
+                        time.sleep(random.uniform(1, 3))
+                    finally:
+                        # Skipped or failed rows must leave the held set too, or heartbeats keep their leases alive
+                        if work_queue is not None:
+                            work_queue.task_done(product_id, completed=completed)
             finally:
                 try:
-                    if driver:
+                    if driver and browser_pool is not None:
+                        browser_pool.release(driver, reuse=False)
+                    elif driver:
                         driver.quit()
                 except Exception:
                     pass
 
+        if browser_pool is not None:
+            max_workers = min(max_workers, browser_pool.target_size)
+
         # Execute workers: parallel if max_workers > 1, else sequential in the main thread
         try:
             if max_workers > 1:
@@ -3761,6 +4889,13 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
             db_queue.put(None)
             db_writer_thread.join()
             print("[DB Writer] Database writer thread has shut down successfully.")
+            log_pg_metrics()
+            log_stage_metrics()
+            if work_queue is not None:
+                work_queue.close()
+                df = work_queue.claimed_df()
+            if browser_pool is not None:
+                browser_pool.close()
 
         # Identify processed product IDs
         processed_pids = {str(r.get('product_id', '')).strip(): r for r in product_results}
@@ -3907,7 +5042,10 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
     except Exception as e:
         print(f"Error processing chunk {chunk_id}: {str(e)}")
         traceback.print_exc()
-        if df is not None and is_driver_connectivity_error(e):
+        if work_queue is not None:
+            work_queue.close()
+            df = work_queue.claimed_df()
+        if df is not None and not df.empty and is_driver_connectivity_error(e):
             release_claimed_products(
                 df['product_id'].tolist(),
                 worker_id,
@@ -3939,6 +5077,7 @@ def process_chunk(df, chunk_id, total_chunks, round_id=1, output_dir='output', w
 
 
 def main():
+    global CAPTURE_FIXTURES_DIR, STAGE_TIMINGS_FILE
     parser = argparse.ArgumentParser(description='Google Shopping Scraper with Captcha Solving')
     parser.add_argument('--chunk-id', type=int, default=1, help='Chunk ID (1-based)')
     parser.add_argument('--total-chunks', type=int, required=False, default=1, help='Total number of chunks')
@@ -3947,6 +5086,8 @@ def main():
     parser.add_argument('--max-rounds', type=int, default=10, help='Maximum recursive rounds')
     parser.add_argument('--reset-errors', action='store_true', help='Reset all error products to pending and exit')
     parser.add_argument('--export-report', type=str, required=False, default=None, help='Generate reconciliation report CSV at specified path and exit')
+    parser.add_argument('--migrate-summary', action='store_true', help='Add google_shopping_results.content_hash, create google_shopping_product_summary and its indexes (concurrently), backfill it once, and exit')
+    parser.add_argument('--rebuild-summary', action='store_true', help='Recompute google_shopping_product_summary for every scraped product and exit')
     parser.add_argument('--claim-mode', action='store_true', help='Deprecated; DB claiming is the default unless --offset-mode is used')
     parser.add_argument('--offset-mode', action='store_true', help='Use legacy LIMIT/OFFSET chunking instead of DB claiming')
     parser.add_argument('--claim-limit', type=int, default=_env_int("CLAIM_LIMIT", None), help='How many products to claim and scrape; defaults to products/hour * runtime hours')
@@ -3959,8 +5100,20 @@ def main():
     parser.add_argument('--start-id', type=str, default=None, help='Start product ID boundary for this account partition')
     parser.add_argument('--end-sales', type=str, default=None, help='End sales boundary for this account partition')
     parser.add_argument('--end-id', type=str, default=None, help='End product ID boundary for this account partition')
+    parser.add_argument('--lease-mode', action='store_true', default=os.environ.get("LEASE_MODE", "").strip().lower() in ("1", "true", "yes"), help='Claim small lease-based batches sized from measured throughput instead of one static claim')
+    parser.add_argument('--browser-pool', action='store_true', default=os.environ.get("BROWSER_POOL", "").strip().lower() in ("1", "true", "yes"), help='Use a managed pool of warm-started, recycled drivers that follows memory headroom (BROWSER_POOL_MAX_SIZE caps it)')
+    parser.add_argument('--lease-minutes', type=int, default=_env_int("LEASE_MINUTES", 15), help='Lease length for --lease-mode; leases are extended by heartbeats while held')
+    parser.add_argument('--capture-fixtures', type=str, default=CAPTURE_FIXTURES_DIR, help='Save rendered panel HTML, share URL and parsed result per product into this directory for offline replay')
+    parser.add_argument('--stage-timings', type=str, default=STAGE_TIMINGS_FILE or None, help='Append one JSON line of per-stage timings per scraped product to this file')
     
     args = parser.parse_args()
+    if args.stage_timings:
+        STAGE_TIMINGS_FILE = args.stage_timings
+        print(f"✓ Writing per-stage timings to {args.stage_timings}")
+    if args.capture_fixtures:
+        CAPTURE_FIXTURES_DIR = args.capture_fixtures
+        os.makedirs(args.capture_fixtures, exist_ok=True)
+        print(f"✓ Capturing panel fixtures into {args.capture_fixtures}")
     args.claim_limit = int(args.claim_limit) if args.claim_limit is not None else None
     if args.claim_ttl_minutes is None:
         args.claim_ttl_minutes = max(DEFAULT_CLAIM_TTL_MINUTES, int(math.ceil(args.max_runtime_hours * 60)) + 120)
@@ -3972,15 +5125,39 @@ def main():
         max_runtime_hours=args.max_runtime_hours,
     )
     max_runtime_seconds = int(args.max_runtime_hours * 60 * 60)
+
+    def build_browser_pool():
+        if not args.browser_pool:
+            return None
+        return BrowserPool(
+            max_workers=args.max_workers,
+            recycle_after_pages=_env_int("BROWSER_RECYCLE_PAGES", 150),
+            max_rss_mb=_env_int("BROWSER_MAX_RSS_MB", 1500),
+            prewarm=_env_int("BROWSER_PREWARM", 0),
+            est_browser_mb=_env_int("BROWSER_EST_MB", 700),
+            reserve_mb=_env_int("BROWSER_MEM_RESERVE_MB", 1024),
+            max_size=_env_int("BROWSER_POOL_MAX_SIZE", None),
+        )
     
     # Handlers for dedicated utility commands
     if args.reset_errors:
         reset_invalid_url_products_for_retry()
         sys.exit(0)
         
+    if args.migrate_summary:
+        sys.exit(0 if migrate_product_summary() else 1)
+
+    if args.rebuild_summary:
+        if migrate_product_summary(backfill=False):
+            rebuild_product_summary()
+        sys.exit(0)
+
     if args.export_report:
         generate_reconciliation_report(args.export_report)
         sys.exit(0)
+
+    # Workers run no DDL: content_hash and the summary table come from --migrate-summary, and the
+    # batch writer skips either one (via _content_hash_available / _summary_table_available) until it exists
         
     print("=" * 60)
     print("Google Shopping Scraper with Captcha Solving")
@@ -4007,6 +5184,7 @@ def main():
     print(f"Total pending products in DB: {total_pending}")
 
     if not args.offset_mode:
+        worker_product_ids = None
         if args.start_id or args.end_id:
             print(f"Boundary partition mode: start=({args.start_sales}, {args.start_id}) end=({args.end_sales}, {args.end_id})")
             product_ids = get_product_ids_in_boundary(args.start_sales, args.start_id, args.end_sales, args.end_id)
@@ -4023,7 +5201,44 @@ def main():
             
             worker_product_ids = product_ids[offset : offset + limit]
             print(f"Worker chunk {args.chunk_id} of {args.total_chunks}: Slice size={len(worker_product_ids)} (Offset={offset}, Limit={limit})")
-            
+
+        if args.lease_mode:
+            lease_worker_id = _lease_worker_id(args.worker_id)
+
+            def claim_fn(n, ttl):
+                if worker_product_ids is not None:
+                    return claim_specific_products_from_db(
+                        worker_product_ids, worker_id=lease_worker_id, limit=n, ttl_minutes=ttl, leases_only=True
+                    )
+                return claim_pending_products_from_db(limit=n, worker_id=lease_worker_id, ttl_minutes=ttl, leases_only=True)
+
+            work_queue = LeaseWorkQueue(
+                claim_fn,
+                worker_id=lease_worker_id,
+                lease_minutes=args.lease_minutes,
+                max_workers=args.max_workers,
+                max_total=args.claim_limit,
+                deadline=time.monotonic() + max_runtime_seconds,
+            )
+            print(f"Lease queue enabled: worker={work_queue.worker_id} lease={args.lease_minutes}m batch={work_queue.min_batch}-{work_queue.max_batch}")
+            if not work_queue.prime():
+                work_queue.close()
+                print("No claimable pending products found (or claim columns missing).")
+                sys.exit(0)
+            chunk_result = process_chunk(
+                None,
+                args.chunk_id,
+                args.total_chunks,
+                worker_id=lease_worker_id,
+                ttl_minutes=args.lease_minutes,
+                max_runtime_seconds=max_runtime_seconds,
+                max_workers=args.max_workers,
+                work_queue=work_queue,
+                browser_pool=build_browser_pool(),
+            )
+            sys.exit(0 if chunk_result.get("success", False) else 1)
+
+        if worker_product_ids is not None:
             chunk_df = claim_specific_products_from_db(
                 worker_product_ids, 
                 worker_id=args.worker_id, 
@@ -4049,6 +5264,7 @@ def main():
             ttl_minutes=args.claim_ttl_minutes,
             max_runtime_seconds=max_runtime_seconds,
             max_workers=args.max_workers,
+            browser_pool=build_browser_pool(),
         )
         success = chunk_result.get("success", False)
         sys.exit(0 if success else 1)
@@ -4088,6 +5304,7 @@ def main():
         ttl_minutes=args.claim_ttl_minutes,
         max_runtime_seconds=max_runtime_seconds,
         max_workers=args.max_workers,
+        browser_pool=build_browser_pool(),
     )
     success = chunk_result.get("success", False)
     
@@ -1,9 +1,12 @@
 import argparse
 import csv
 import os
+import queue
 import random
+import threading
 import time
 import traceback
+from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import quote_plus
 
@@ -18,6 +21,20 @@ from gscrapperci import (
     get_product_options,
     normalize_url_path_slug,
 )
+import panel_extract
+
+RESULT_CARD_CLASS = "MtXiu"
+
+# undetected_chromedriver patches one shared chromedriver binary on every start, so pool
+# workers start their browsers one at a time
+DRIVER_START_LOCK = threading.Lock()
+
+# Bring the last rendered card into view, then keep going so the next page of cards lazy-loads
+SCROLL_PAST_LAST_CARD_JS = """
+const cards = document.getElementsByClassName(arguments[0]);
+if (cards.length) cards[cards.length - 1].scrollIntoView({block: 'end'});
+window.scrollBy(0, Math.max(700, window.innerHeight * 0.85));
+"""
 
 
 def build_search_url(keyword):
@@ -91,6 +108,98 @@ def collect_all_products(driver, keyword, search_url, max_products=0):
     return collected
 
 
+class StreamingCardIndex:
+    """
+    Ordered, de-duplicated index of result cards, filled one scroll step at a time.
+
+    Cards are keyed by normalize_name_key (cid when a card has no name) so the same
+    product listed by several sellers is scraped once. stream() yields each new card as
+    soon as it is rendered; the caller scrapes it before the next scroll step runs.
+    product_id is the card's ordinal, prefixed with id_prefix ("<prefix>-<n>") when given.
+    """
+
+    def __init__(self, driver, keyword, search_url, max_products=0, idle_rounds=5, max_rounds=120, id_prefix=""):
+        self.driver = driver
+        self.keyword = keyword
+        self.search_url = search_url
+        self.id_prefix = id_prefix
+        self.max_products = max_products
+        self.idle_rounds = idle_rounds
+        self.max_rounds = max_rounds
+        self.entries = OrderedDict()
+        self.full = False
+
+    def harvest(self):
+        """Index cards that appeared since the last call; returns the new entries in page order."""
+        cards = self.driver.find_elements(By.CLASS_NAME, RESULT_CARD_CLASS)
+        metas = panel_extract.extract_card_metas(self.driver, cards)
+        new_entries = []
+        for meta in metas:
+            cid = meta.get("cid") or ""
+            if not cid:
+                continue
+            product_name = (meta.get("product_name") or "").strip()
+            key = normalize_name_key(product_name) or cid
+            if key in self.entries:
+                continue
+            if self.max_products > 0 and len(self.entries) >= self.max_products:
+                self.full = True
+                break
+            entry = {
+                "product_id": f"{self.id_prefix}-{len(self.entries) + 1}" if self.id_prefix else str(len(self.entries) + 1),
+                "keyword": self.keyword,
+                "url": self.search_url,
+                "cid": cid,
+                "product_name": product_name,
+                "seller": (meta.get("seller") or "").strip(),
+            }
+            self.entries[key] = entry
+            new_entries.append(entry)
+        if self.max_products > 0 and len(self.entries) >= self.max_products:
+            self.full = True
+        return new_entries
+
+    def stream(self):
+        yield from self.harvest()
+        stable = 0
+        for _ in range(self.max_rounds):
+            if self.full:
+                break
+            self.driver.execute_script(SCROLL_PAST_LAST_CARD_JS, RESULT_CARD_CLASS)
+            time.sleep(random.uniform(0.8, 1.5))
+            new_entries = self.harvest()
+            if new_entries:
+                stable = 0
+            else:
+                stable += 1
+                if stable >= self.idle_rounds:
+                    break
+            yield from new_entries
+
+
+def click_product_by_cid(driver, cid):
+    """Click an indexed card directly by its element id instead of re-scanning the card list."""
+    try:
+        card = driver.find_element(By.ID, cid)
+    except Exception:
+        return None
+    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", card)
+    time.sleep(0.4)
+    try:
+        WebDriverWait(driver, 5).until(EC.element_to_be_clickable(card))
+    except Exception:
+        pass
+    try:
+        card.click()
+    except Exception:
+        driver.execute_script("arguments[0].click();", card)
+    return {
+        "cid": cid,
+        "product_name": get_text_safe(card, By.XPATH, ".//div[contains(@class,'gkQHve')]"),
+        "seller": get_text_safe(card, By.XPATH, ".//span[contains(@class,'WJMUdc')]"),
+    }
+
+
 def chunk_slice(items, chunk_id, total_chunks):
     if total_chunks <= 0:
         return items, 0, len(items)
@@ -190,7 +299,7 @@ def extract_share_url(driver):
     return share_url
 
 
-def scrape_product_for_meta(driver, meta, search_url, start_offset=0, processed_names=None):
+def scrape_product_for_meta(driver, meta, search_url, start_offset=0, processed_names=None, by_cid=False):
     processed_names = processed_names or set()
     result = {
         "product_id": meta["product_id"],
@@ -213,12 +322,15 @@ def scrape_product_for_meta(driver, meta, search_url, start_offset=0, processed_
 
     try:
         time.sleep(random.uniform(0.8, 1.5))
-        clicked_meta, next_offset = click_product_by_offset(
-            driver,
-            start_offset=start_offset,
-            target_name=meta.get("product_name", ""),
-            processed_names=processed_names,
-        )
+        clicked_meta = click_product_by_cid(driver, meta["cid"]) if by_cid and meta.get("cid") else None
+        next_offset = start_offset
+        if not clicked_meta:
+            clicked_meta, next_offset = click_product_by_offset(
+                driver,
+                start_offset=start_offset,
+                target_name=meta.get("product_name", ""),
+                processed_names=processed_names,
+            )
         if not clicked_meta:
             result["status"] = "product_not_clickable"
             result["last_response"] = (
@@ -305,10 +417,13 @@ def scrape_product_for_meta(driver, meta, search_url, start_offset=0, processed_
     return result, start_offset
 
 
-def append_product_row(csv_path, result):
+SELLER_FIELDS = ["product_id", "seller", "seller_product_name", "seller_url", "seller_price", "last_fetched_date"]
+
+
+def build_product_row(result):
     osb_id = result.get('osb_id', '')
     osb_url = f"https://www.1stopbedrooms.com/{osb_id}" if osb_id else ""
-    row = {
+    return {
         "product_id": result.get("product_id", ""),
         # "web_id": "",
         # "name": "",
@@ -333,9 +448,15 @@ def append_product_row(csv_path, result):
         "status": result.get("status", "error"),
     }
 
+
+PRODUCT_FIELDS = list(build_product_row({}).keys())
+
+
+def append_product_row(csv_path, result):
+    row = build_product_row(result)
     file_exists = os.path.exists(csv_path)
     with open(csv_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+        writer = csv.DictWriter(f, fieldnames=PRODUCT_FIELDS)
         if not file_exists:
             writer.writeheader()
         writer.writerow(row)
@@ -345,16 +466,106 @@ def append_seller_rows(csv_path, competitors):
     if not competitors:
         return
     file_exists = os.path.exists(csv_path)
-    fields = ["product_id", "seller", "seller_product_name", "seller_url", "seller_price", "last_fetched_date"]
     with open(csv_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fields)
+        writer = csv.DictWriter(f, fieldnames=SELLER_FIELDS)
         if not file_exists:
             writer.writeheader()
         for row in competitors:
-            writer.writerow({k: row.get(k, "") for k in fields})
+            writer.writerow({k: row.get(k, "") for k in SELLER_FIELDS})
+
+
+class KeywordResultWriter:
+    """
+    Single writer thread that keeps both output CSVs open for the whole run.
+    Scraper threads only put() results; rows are flushed every `flush_every`
+    products and whenever the queue goes quiet.
+    """
+
+    def __init__(self, products_path, sellers_path, flush_every=50):
+        self.products_path = products_path
+        self.sellers_path = sellers_path
+        self.flush_every = max(1, int(flush_every))
+        self.products_written = 0
+        self.sellers_written = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="KeywordResultWriter", daemon=True)
+        self._thread.start()
+
+    def put(self, result):
+        self._queue.put(result)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        with open(self.products_path, "w", newline="", encoding="utf-8") as pf, \
+                open(self.sellers_path, "w", newline="", encoding="utf-8") as sf:
+            product_writer = csv.DictWriter(pf, fieldnames=PRODUCT_FIELDS)
+            seller_writer = csv.DictWriter(sf, fieldnames=SELLER_FIELDS)
+            product_writer.writeheader()
+            seller_writer.writeheader()
+            pending = 0
+            while True:
+                try:
+                    result = self._queue.get(timeout=2)
+                except queue.Empty:
+                    if pending:
+                        pf.flush()
+                        sf.flush()
+                        pending = 0
+                    continue
+                if result is None:
+                    break
+                try:
+                    product_writer.writerow(build_product_row(result))
+                    self.products_written += 1
+                    for row in result.get("competitors", []):
+                        seller_writer.writerow({k: row.get(k, "") for k in SELLER_FIELDS})
+                        self.sellers_written += 1
+                except Exception as e:
+                    print(f"Error writing result for {result.get('keyword', '')} #{result.get('product_id', '')}: {str(e)}")
+                pending += 1
+                if pending >= self.flush_every:
+                    pf.flush()
+                    sf.flush()
+                    pending = 0
+
+
+def process_keyword_stream(driver, keyword, search_url, chunk_id, total_chunks, max_products, emit, id_prefix=""):
+    """
+    Scrape products while the result list is still being scrolled and hand each result
+    to emit(). Chunks take every total_chunks-th indexed card (ordinal modulo
+    total_chunks) since the final card count is not known up front.
+    """
+    WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.CLASS_NAME, "dURPMd")))
+    index = StreamingCardIndex(driver, keyword, search_url, max_products=max_products, id_prefix=id_prefix)
+
+    started = time.monotonic()
+    first_result_after = None
+    processed = 0
+    for ordinal, meta in enumerate(index.stream(), start=1):
+        if total_chunks > 0 and (ordinal - 1) % total_chunks != chunk_id - 1:
+            continue
+
+        print(f"\nProcessing #{ordinal} (indexed {len(index.entries)}) - Name: {meta.get('product_name', '')}")
+        result, _ = scrape_product_for_meta(driver, meta, search_url, by_cid=True)
+        emit(result)
+        processed += 1
+        if first_result_after is None:
+            first_result_after = time.monotonic() - started
+            print(f"✓ First result after {first_result_after:.1f}s")
+        time.sleep(random.uniform(1.2, 2.4))
+
+    print(f"Total discovered products: {len(index.entries)}")
+    if not index.entries:
+        print("No products discovered.")
+        return False
+    print(f"✓ {keyword} [{chunk_id}/{total_chunks}]: processed {processed} products in {time.monotonic() - started:.1f}s")
+    return True
 
 
-def process_keyword_chunk(keyword, chunk_id, total_chunks, max_products=0):
+def process_keyword_chunk(keyword, chunk_id, total_chunks, max_products=0, streaming=True):
     search_url = build_search_url(keyword)
     print(f"Keyword: {keyword}")
     print(f"Search URL: {search_url}")
@@ -373,6 +584,17 @@ def process_keyword_chunk(keyword, chunk_id, total_chunks, max_products=0):
             print("Captcha solving failed for initial search page.")
             return False
 
+        if streaming:
+            def emit(result):
+                append_product_row(csv1_path, result)
+                append_seller_rows(csv2_path, result.get("competitors", []))
+
+            if not process_keyword_stream(driver, keyword, search_url, chunk_id, total_chunks, max_products, emit):
+                return False
+            print(f"✓ Saved product info: {os.path.basename(csv1_path)}")
+            print(f"✓ Saved seller info: {os.path.basename(csv2_path)}")
+            return True
+
         products = collect_all_products(driver, keyword, search_url, max_products=max_products)
         print(f"Total discovered products: {len(products)}")
         if not products:
@@ -423,14 +645,140 @@ def process_keyword_chunk(keyword, chunk_id, total_chunks, max_products=0):
             pass
 
 
+def load_keywords(path):
+    """One keyword per line; blank lines and # comments are ignored, duplicates keep their first position."""
+    keywords = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            keyword = line.strip()
+            if not keyword or keyword.startswith("#") or keyword.lower() in seen:
+                continue
+            seen.add(keyword.lower())
+            keywords.append(keyword)
+    return keywords
+
+
+def run_keyword_pool(keywords, workers=2, shards_per_keyword=1, max_products=0, output_dir="output", flush_every=50):
+    """
+    Scrape many keywords on one host. Each keyword is split into `shards_per_keyword`
+    work units (shard N takes every Nth discovered product, as in streaming chunk mode);
+    `workers` threads each own one browser and pull units off a shared queue, and all
+    results go through a single KeywordResultWriter. Product ids are "<keyword no>-<n>"
+    so product and seller rows stay unique across keywords in the shared CSVs.
+    """
+    shards_per_keyword = max(1, int(shards_per_keyword))
+    units = queue.Queue()
+    for keyword_no, keyword in enumerate(keywords, start=1):
+        for shard in range(1, shards_per_keyword + 1):
+            units.put((keyword_no, keyword, shard))
+    total_units = units.qsize()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+    writer = KeywordResultWriter(
+        os.path.join(output_dir, f"product_info_keywords_{timestamp}.csv"),
+        os.path.join(output_dir, f"seller_info_keywords_{timestamp}.csv"),
+        flush_every=flush_every,
+    )
+    failed_units = []
+    failed_lock = threading.Lock()
+    shard_total = shards_per_keyword if shards_per_keyword > 1 else 0
+
+    def worker(worker_no):
+        driver = None
+        try:
+            while True:
+                try:
+                    keyword_no, keyword, shard = units.get_nowait()
+                except queue.Empty:
+                    return
+                search_url = build_search_url(keyword)
+                print(f"\n[worker {worker_no}] {keyword} shard {shard}/{shards_per_keyword} ({total_units - units.qsize()}/{total_units})")
+                ok = False
+                try:
+                    if driver is None:
+                        with DRIVER_START_LOCK:
+                            driver = setup_driver()
+                    driver.get(search_url)
+                    if handle_captcha(driver, search_url) == "failed":
+                        print(f"[worker {worker_no}] Captcha solving failed for {keyword}")
+                    else:
+                        ok = process_keyword_stream(
+                            driver, keyword, search_url, shard, shard_total, max_products, writer.put,
+                            id_prefix=str(keyword_no),
+                        )
+                except Exception as e:
+                    print(f"[worker {worker_no}] Error processing {keyword} shard {shard}: {str(e)}")
+                    traceback.print_exc()
+                    try:
+                        driver.quit()
+                    except Exception:
+                        pass
+                    driver = None
+                if not ok:
+                    with failed_lock:
+                        failed_units.append((keyword, shard))
+        finally:
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=worker, args=(n,), name=f"KeywordWorker-{n}")
+        for n in range(1, max(1, min(int(workers), total_units)) + 1)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+
+    print("=" * 60)
+    print(f"✓ {len(keywords)} keywords, {total_units} units in {time.monotonic() - started:.1f}s")
+    print(f"✓ Saved {writer.products_written} products: {os.path.basename(writer.products_path)}")
+    print(f"✓ Saved {writer.sellers_written} sellers: {os.path.basename(writer.sellers_path)}")
+    for keyword, shard in failed_units:
+        print(f"✗ Failed: {keyword} shard {shard}/{shards_per_keyword}")
+    return not failed_units
+
+
 def main():
     parser = argparse.ArgumentParser(description="Google Shopping Keyword Scraper")
     parser.add_argument("--chunk-id", type=int, default=1, help="Chunk ID (1-based)")
-    parser.add_argument("--total-chunks", type=int, default=0, help="Total number of chunks (0 = all products)")
+    parser.add_argument("--total-chunks", type=int, default=0, help="Total number of chunks (0 = all products); chunk N takes every Nth discovered product")
     parser.add_argument("--max-products", type=int, default=0, help="Maximum products to fetch (0 = no limit)")
-    parser.add_argument("--keyword", type=str, required=True, help="Keyword to search on Google Shopping")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--keyword", type=str, help="Keyword to search on Google Shopping")
+    source.add_argument("--keywords-file", type=str, help="File with one keyword per line; runs them all through a browser pool")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("KEYWORD_WORKERS", "2")), help="Browsers in the pool (--keywords-file only)")
+    parser.add_argument("--shards-per-keyword", type=int, default=1, help="Work units per keyword (--keywords-file only)")
+    parser.add_argument("--flush-every", type=int, default=50, help="Products buffered before the output CSVs are flushed (--keywords-file only)")
+    parser.add_argument("--legacy-collect", action="store_true", help="Scroll to the end and collect every card before scraping (old behaviour)")
     args = parser.parse_args()
 
+    if args.keywords_file:
+        keywords = load_keywords(args.keywords_file)
+        print("=" * 60)
+        print("Google Shopping Keyword Scraper (multi-keyword)")
+        print(f"Keywords: {len(keywords)} | Workers: {args.workers} | Shards per keyword: {args.shards_per_keyword}")
+        print(f"Max products: {args.max_products if args.max_products > 0 else 'no limit'}")
+        print("=" * 60)
+        if not keywords:
+            print("No keywords found.")
+            raise SystemExit(1)
+        ok = run_keyword_pool(
+            keywords,
+            workers=args.workers,
+            shards_per_keyword=args.shards_per_keyword,
+            max_products=args.max_products,
+            flush_every=args.flush_every,
+        )
+        raise SystemExit(0 if ok else 1)
+
     print("=" * 60)
     print("Google Shopping Keyword Scraper")
     print(f"Chunk: {args.chunk_id} of {args.total_chunks}")
@@ -438,7 +786,7 @@ def main():
     print(f"Keyword: {args.keyword}")
     print("=" * 60)
 
-    ok = process_keyword_chunk(args.keyword, args.chunk_id, args.total_chunks, args.max_products)
+    ok = process_keyword_chunk(args.keyword, args.chunk_id, args.total_chunks, args.max_products, streaming=not args.legacy_collect)
     if ok:
         print("\n✓ Processing completed successfully")
         raise SystemExit(0)
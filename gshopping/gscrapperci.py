@@ -50,6 +50,21 @@ PRODUCT_FINAL_COLUMNS = [
     "description",
     "attributes"
 ]
+try:
+    import panel_extract
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import panel_extract
+
+try:
+    import work_store
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import work_store
+
+# Set FAST_PANEL_EXTRACT=0 to go back to one WebDriver call per element
+FAST_PANEL_EXTRACT = os.environ.get("FAST_PANEL_EXTRACT", "1").strip().lower() not in ("0", "false", "no")
+
 # Import the existing captcha solving functions
 try:
     from solvecaptcha import solve_recaptcha_audio
@@ -884,52 +899,8 @@ def expand_more_stores(driver):
         except Exception:
             break
 
-def populate_offers_for_selected_product(driver, result, product_id, osb_url):
-    result['competitors'] = []
-    result['product_url'] = extract_share_url(driver) or driver.current_url
-
-    expand_more_stores(driver)
-
-    last_error = None
-    offers_grid = None
-    for offer_attempt in range(OFFERS_RETRIES):
-        try:
-            offers_grid = WebDriverWait(driver, OFFERS_WAIT_SECONDS).until(
-                EC.presence_of_element_located((By.XPATH, "//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']"))
-            )
-            break
-        except Exception as exc:
-            last_error = exc
-            if offer_attempt + 1 < OFFERS_RETRIES:
-                time.sleep(1)
-
-    if offers_grid is None:
-        raise last_error or Exception("Offers grid not found")
-
-    exists = len(driver.find_elements(
-        By.XPATH,
-        "//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']"
-    )) > 0
-
-    if exists > 0:
-        result['options'] = get_product_options(driver)
-
-    # ★ NEW: Add product about info scraping
-    try:
-        about_data_json = get_product_about_info(driver)
-        about_data = json.loads(about_data_json)
-        result['product_about_info'] = about_data_json
-        result['description'] = about_data.get('description', '')
-        result['attributes'] = json.dumps(about_data.get('attributes', {}))
-        result['main_image'] = about_data.get('main_image', '')
-        print("✓ Product about info, description, attributes and image extracted")
-    except Exception as e:
-        print(f"Error extracting product about info: {str(e)}")
-        result['product_about_info'] = json.dumps({'description': '', 'attributes': {}, 'main_image': ''})
-        result['description'] = ''
-        result['attributes'] = json.dumps({})
-        result['main_image'] = ''
-
+def extract_offers_from_grid(offers_grid, product_id):
+    """Element-by-element offer extraction (fallback for the single-script panel extractor)."""
     offer_elements = offers_grid.find_elements(By.CLASS_NAME, 'R5K7Cb')
     print(f"Found {len(offer_elements)} offers")
 
@@ -970,7 +941,80 @@ def populate_offers_for_selected_product(driver, result, product_id, osb_url):
         }
 
         competitors.append(competitor_data)
-        result['competitors'].append(competitor_data)
+
+    return competitors
+
+def populate_offers_for_selected_product(driver, result, product_id, osb_url):
+    result['competitors'] = []
+    result['product_url'] = extract_share_url(driver) or driver.current_url
+
+    expand_more_stores(driver)
+
+    last_error = None
+    offers_grid = None
+    for offer_attempt in range(OFFERS_RETRIES):
+        try:
+            offers_grid = WebDriverWait(driver, OFFERS_WAIT_SECONDS).until(
+                EC.presence_of_element_located((By.XPATH, "//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']"))
+            )
+            break
+        except Exception as exc:
+            last_error = exc
+            if offer_attempt + 1 < OFFERS_RETRIES:
+                time.sleep(1)
+
+    if offers_grid is None:
+        raise last_error or Exception("Offers grid not found")
+
+    panel = None
+    if FAST_PANEL_EXTRACT:
+        try:
+            panel = panel_extract.extract_panel(driver, product_id)
+        except Exception as e:
+            print(f"Single-script panel extraction failed, falling back to element lookups: {e}")
+
+    if panel is not None:
+        if panel['has_options']:
+            result['options'] = json.dumps(panel['options'], indent=2)
+    else:
+        exists = len(driver.find_elements(
+            By.XPATH,
+            "//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']"
+        )) > 0
+
+        if exists > 0:
+            result['options'] = get_product_options(driver)
+
+    # ★ NEW: Add product about info scraping
+    try:
+        if panel is not None:
+            about = panel['about']
+            about_data_json = json.dumps({k: about[k] for k in ('description', 'attributes', 'main_image')})
+        else:
+            about_data_json = get_product_about_info(driver)
+        about_data = json.loads(about_data_json)
+        result['product_about_info'] = about_data_json
+        result['description'] = about_data.get('description', '')
+        result['attributes'] = json.dumps(about_data.get('attributes', {}))
+        result['main_image'] = about_data.get('main_image', '')
+        print("✓ Product about info, description, attributes and image extracted")
+    except Exception as e:
+        print(f"Error extracting product about info: {str(e)}")
+        result['product_about_info'] = json.dumps({'description': '', 'attributes': {}, 'main_image': ''})
+        result['description'] = ''
+        result['attributes'] = json.dumps({})
+        result['main_image'] = ''
+
+    if panel is not None:
+        # This scraper only writes the basic offer columns
+        competitors = [
+            {k: offer[k] for k in ('product_id', 'seller', 'seller_product_name', 'seller_url', 'seller_price', 'last_fetched_date')}
+            for offer in panel['offers']
+        ]
+        print(f"Found {len(competitors)} offers")
+    else:
+        competitors = extract_offers_from_grid(offers_grid, product_id)
+    result['competitors'].extend(competitors)
 
     search_seller = '1StopBedrooms'
     sellers = [c['seller'] for c in competitors]
@@ -1082,9 +1126,16 @@ def run_product_selection_phase(driver, product_id, phase_name, search_url, base
     limit = min(MAX_PRODUCT_TRIES, len(products))
     log_matching(product_id, f"Found {len(products)} products -> trying {limit if len(products) >= MAX_PRODUCT_TRIES else 'all'}")
 
+    try:
+        metas = panel_extract.extract_card_metas(driver, products) if FAST_PANEL_EXTRACT else None
+    except Exception as e:
+        print(f"Batched card meta extraction failed, falling back: {e}")
+        metas = None
+    if metas is None or len(metas) != len(products):
+        metas = [extract_product_card_meta(product) for product in products]
+
     matching_products = []
-    for product in products:
-        meta = extract_product_card_meta(product)
+    for meta in metas:
         if fallback_first or product_matches_keyword(meta.get('product_name', ''), base_result['keyword']):
             matching_products.append(meta)
 
@@ -1295,6 +1346,111 @@ def split_dataframe_to_chunk_files(df, output_dir, total_chunks, prefix):
     return chunk_files
 
 
+SELLER_FINAL_COLUMNS = [
+    "product_id",
+    "seller",
+    "seller_product_name",
+    "seller_url",
+    "seller_price",
+    "last_fetched_date"
+]
+
+def build_product_csv_row(result):
+    return {
+        'product_id': result.get('product_id', ''),
+        'web_id': result.get('web_id', ''),
+        'name' : result.get('name',''),
+        'mpn_sku' : result.get('mpn_sku',''),
+        'gtin' : result.get('gtin',''),
+        'brand' : result.get('brand',''),
+        'category': result.get('category', ''),
+        'keyword': result.get('keyword', ''),
+        'url': result.get('url', ''),
+        'osb_url': result.get('osb_url', ''),
+        'last_response': result.get('last_response', ''),
+        'osb_url_match' : result.get('osb_url_match', ''),
+        'product_url': result.get('product_url', ''),
+        'seller': result.get('seller', ''),
+        'product_name': result.get('product_name', ''),
+        'cid': result.get('cid', ''),
+        'pid': result.get('pid', ''),
+        'last_fetched_date': result.get('last_fetched_date', ''),
+        'osb_position': result.get('osb_position', 0),
+        'osb_id': result.get('osb_id', ''),
+        'seller_count': result.get('seller_count', 0),
+        'status': result.get('status', 'error'),
+        'product_about_info': result.get('product_about_info', json.dumps({})),
+        'main_image': result.get('main_image', ''),
+        'description': result.get('description', ''),
+        'attributes': result.get('attributes', json.dumps({}))
+    }
+
+def build_seller_csv_row(seller):
+    return {
+        'product_id': seller.get('product_id', ''),
+        'seller': seller.get('seller', ''),
+        'seller_product_name': seller.get('seller_product_name', ''),
+        'seller_url': seller.get('seller_url', ''),
+        'seller_price': seller.get('seller_price', ''),
+        'last_fetched_date': seller.get('last_fetched_date', '')
+    }
+
+
+def scrape_row(driver, row):
+    """Scrape one input row; returns (scraped_data, driver) since the driver may be restarted."""
+    product_id = row['product_id']
+    web_id = row['web_id']
+    keyword = row['keyword']
+    url = row['url']
+    osb_url = row['osb_url']
+    name = row['name']
+    mpnsku = row['mpn_sku']
+    gtin = row['gtin']
+    brand = row['brand']
+    cat = row['category']
+
+    # Scrape product
+    try:
+        scraped_data = scrape_product(driver, product_id, keyword, url, osb_url)
+    except Exception as e:
+        print(f"Error scraping product {product_id}: {str(e)}")
+        traceback.print_exc()
+        scraped_data = None
+        if is_driver_connectivity_error(e):
+            try:
+                if driver:
+                    driver.quit()
+            except Exception:
+                pass
+            try:
+                driver = setup_driver(max_attempts=3, base_delay=5)
+                scraped_data = scrape_product(driver, product_id, keyword, url, osb_url)
+            except Exception as e2:
+                print(f"Retry after driver restart failed: {str(e2)}")
+                traceback.print_exc()
+                scraped_data = build_error_result(
+                    product_id, keyword, url,
+                    f"driver_error: {str(e2)[:160]}"
+                )
+        if scraped_data is None:
+            scraped_data = build_error_result(
+                product_id, keyword, url,
+                f"scrape_error: {str(e)[:160]}"
+            )
+    
+    # Add original fields back
+    scraped_data['web_id'] = web_id
+    scraped_data['keyword'] = keyword
+    scraped_data['osb_url'] = osb_url
+    scraped_data['name'] = name
+    scraped_data['mpn_sku'] = mpnsku
+    scraped_data['gtin'] = gtin
+    scraped_data['brand'] = brand
+    scraped_data['category'] = cat
+
+    return scraped_data, driver
+
+
 def process_chunk(chunk_file, chunk_id, total_chunks, round_id=1, output_dir='output'):
     """Process a chunk of products"""
     df = None
@@ -1346,57 +1502,9 @@ def process_chunk(chunk_file, chunk_id, total_chunks, round_id=1, output_dir='ou
             # Process each product
             for index, row in df.iterrows():
                 product_id = row['product_id']
-                web_id = row['web_id']
-                keyword = row['keyword']
-                url = row['url']
-                osb_url = row['osb_url']
-                name = row['name']
-                mpnsku = row['mpn_sku']
-                gtin = row['gtin']
-                brand = row['brand']
-                cat = row['category']
-                
                 print(f"\nProcessing {index+1}/{len(df)}: Product ID {product_id}")
-                
-                # Scrape product
-                try:
-                    scraped_data = scrape_product(driver, product_id, keyword, url, osb_url)
-                except Exception as e:
-                    print(f"Error scraping product {product_id}: {str(e)}")
-                    traceback.print_exc()
-                    scraped_data = None
-                    if is_driver_connectivity_error(e):
-                        try:
-                            if driver:
-                                driver.quit()
-                        except Exception:
-                            pass
-                        try:
-                            driver = setup_driver(max_attempts=3, base_delay=5)
-                            scraped_data = scrape_product(driver, product_id, keyword, url, osb_url)
-                        except Exception as e2:
-                            print(f"Retry after driver restart failed: {str(e2)}")
-                            traceback.print_exc()
-                            scraped_data = build_error_result(
-                                product_id, keyword, url,
-                                f"driver_error: {str(e2)[:160]}"
-                            )
-                    if scraped_data is None:
-                        scraped_data = build_error_result(
-                            product_id, keyword, url,
-                            f"scrape_error: {str(e)[:160]}"
-                        )
-                
-                # Add original fields back
-                scraped_data['web_id'] = web_id
-                scraped_data['keyword'] = keyword
-                scraped_data['osb_url'] = osb_url
-                scraped_data['name'] = name
-                scraped_data['mpn_sku'] = mpnsku
-                scraped_data['gtin'] = gtin
-                scraped_data['brand'] = brand
-                scraped_data['category'] = cat
-                
+                scraped_data, driver = scrape_row(driver, row)
+
                 # Add to results
                 product_results.append(scraped_data)
                 seller_results.extend(scraped_data.get('competitors', []))
@@ -1436,37 +1544,7 @@ def process_chunk(chunk_file, chunk_id, total_chunks, round_id=1, output_dir='ou
         ]
 
         # Create CSV 1: Product Information
-        csv1_data = []
-        for result in completed_product_results:
-            csv1_row = {
-                'product_id': result.get('product_id', ''),
-                'web_id': result.get('web_id', ''),
-                'name' : result.get('name',''),
-                'mpn_sku' : result.get('mpn_sku',''),
-                'gtin' : result.get('gtin',''),
-                'brand' : result.get('brand',''),
-                'category': result.get('category', ''),
-                'keyword': result.get('keyword', ''),
-                'url': result.get('url', ''),
-                'osb_url': result.get('osb_url', ''),
-                'last_response': result.get('last_response', ''),
-                'osb_url_match' : result.get('osb_url_match', ''),
-                'product_url': result.get('product_url', ''),
-                'seller': result.get('seller', ''),
-                'product_name': result.get('product_name', ''),
-                'cid': result.get('cid', ''),
-                'pid': result.get('pid', ''),
-                'last_fetched_date': result.get('last_fetched_date', ''),
-                'osb_position': result.get('osb_position', 0),
-                'osb_id': result.get('osb_id', ''),
-                'seller_count': result.get('seller_count', 0),
-                'status': result.get('status', 'error'),
-                'product_about_info': result.get('product_about_info', json.dumps({})),
-                'main_image': result.get('main_image', ''),
-                'description': result.get('description', ''),
-                'attributes': result.get('attributes', json.dumps({}))
-            }
-            csv1_data.append(csv1_row)
+        csv1_data = [build_product_csv_row(result) for result in completed_product_results]
         
         # Create CSV 2: Seller Information
         csv2_data = []
@@ -1474,15 +1552,7 @@ def process_chunk(chunk_file, chunk_id, total_chunks, round_id=1, output_dir='ou
         for seller in seller_results:
             if str(seller.get('product_id', '')).strip() not in completed_product_ids:
                 continue
-            csv2_row = {
-                'product_id': seller.get('product_id', ''),
-                'seller': seller.get('seller', ''),
-                'seller_product_name': seller.get('seller_product_name', ''),
-                'seller_url': seller.get('seller_url', ''),
-                'seller_price': seller.get('seller_price', ''),
-                'last_fetched_date': seller.get('last_fetched_date', '')
-            }
-            csv2_data.append(csv2_row)
+            csv2_data.append(build_seller_csv_row(seller))
         
         # Save CSV files locally
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1703,6 +1773,150 @@ def run_recursive_pipeline(input_csv, total_chunks, ftp_host, ftp_user, ftp_pass
 
     return bool(final_products_file or final_sellers_file)
 
+def process_store_session(store, round_id, worker_id, claim_batch=5):
+    """
+    Scrape items claimed from the work store with one driver until nothing is pending
+    or a captcha ends the session. Equivalent of one chunk in the CSV pipeline.
+    """
+    driver = None
+    processed = 0
+    try:
+        driver = setup_driver(max_attempts=3, base_delay=5)
+    except Exception as e:
+        print(f"Driver setup failed for round {round_id}: {str(e)}")
+        traceback.print_exc()
+        return {"success": is_driver_connectivity_error(e), "processed": 0, "stopped": "driver_setup_failed"}
+
+    try:
+        while True:
+            rows = store.claim(worker_id, claim_batch)
+            if not rows:
+                return {"success": True, "processed": processed, "stopped": None}
+
+            for pos, row in enumerate(rows):
+                product_id = row['product_id']
+                print(f"\nRound {round_id}: Product ID {product_id}")
+                scraped_data, driver = scrape_row(driver, row)
+                processed += 1
+
+                status_lower = str(scraped_data.get('status', '')).strip().lower()
+                if status_lower == 'captcha_failed':
+                    print(f"!!! CAPTCHA DETECTED on Product {product_id}. Ending this session; the rest of its claimed batch moves to retry for the next round.")
+                    store.retry(product_id, round_id, scraped_data.get('last_response', ''))
+                    for rest in rows[pos + 1:]:
+                        store.retry(rest['product_id'], round_id, 'captcha_stop', count_attempt=False)
+                    return {"success": True, "processed": processed, "stopped": "captcha"}
+                elif status_lower == 'error':
+                    store.retry(product_id, round_id, scraped_data.get('last_response', ''))
+                else:
+                    store.complete(
+                        product_id,
+                        round_id,
+                        build_product_csv_row(scraped_data),
+                        [build_seller_csv_row(seller) for seller in scraped_data.get('competitors', [])],
+                    )
+
+                time.sleep(random.uniform(1,3))
+    except Exception as e:
+        print(f"Error in work store session (round {round_id}): {str(e)}")
+        traceback.print_exc()
+        return {"success": is_driver_connectivity_error(e), "processed": processed, "stopped": "error"}
+    finally:
+        store.release(worker_id)
+        try:
+            if driver:
+                driver.quit()
+        except Exception:
+            pass
+
+def run_store_pipeline(input_csv, store_path, total_chunks, ftp_host, ftp_user, ftp_pass, ftp_path, max_rounds=10):
+    """
+    Recursive pipeline on top of a SQLite work store: rounds and chunks are state
+    transitions in the store, and outputs are exported and uploaded once at the end.
+    Re-running with the same store resumes where the previous run stopped.
+    """
+    run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_root = os.path.join("output", f"store_run_{run_ts}")
+    os.makedirs(run_root, exist_ok=True)
+
+    store = work_store.WorkStore(store_path, max_attempts=max_rounds)
+    try:
+        try:
+            added, reset = store.load(pd.read_csv(input_csv))
+        except Exception as e:
+            print(f"Error loading {input_csv} into work store: {e}")
+            return False
+        if reset:
+            print(f"Work store {store_path} held a different input; cleared items, results and round counter")
+        print(f"Work store {store_path}: {added} new items, states {store.counts()}")
+
+        worker_id = f"pid-{os.getpid()}"
+        round_id = int(store.get_meta('round', 0) or 0)
+        if round_id and store.counts().get(work_store.PENDING, 0):
+            print(f"Resuming round {round_id}")
+        else:
+            round_id += 1
+
+        any_session_failed = False
+        while round_id <= max_rounds:
+            store.set_meta('round', round_id)
+            pending = store.start_round()
+            if pending == 0:
+                print("No rows left to process. Ending recursion.")
+                break
+
+            print(f"\n{'=' * 60}")
+            print(f"Starting round {round_id}: {pending} items pending")
+            print(f"{'=' * 60}")
+
+            # Each session gets a fresh driver, like a chunk did; a captcha only ends its session
+            for session in range(1, max(1, int(total_chunks)) + 1):
+                store_session = process_store_session(store, round_id, worker_id)
+                if not store_session.get("success"):
+                    any_session_failed = True
+                print(f"Round {round_id} session {session}: {store_session['processed']} processed, stopped={store_session['stopped']}")
+                if not store.counts().get(work_store.PENDING, 0):
+                    break
+
+            counts = store.counts()
+            print(
+                f"Round {round_id} summary: done={counts.get(work_store.DONE, 0)}, "
+                f"retry={counts.get(work_store.RETRY, 0)}, failed={counts.get(work_store.FAILED, 0)}, "
+                f"pending={counts.get(work_store.PENDING, 0)}"
+            )
+            if not counts.get(work_store.RETRY, 0) and not counts.get(work_store.PENDING, 0):
+                print("No remaining rows after this round. Recursive processing is complete.")
+                break
+            round_id += 1
+
+        if round_id > max_rounds:
+            print(f"Reached max rounds limit ({max_rounds}). Stopping recursion.")
+        if any_session_failed:
+            print("One or more sessions failed.")
+
+        final_products_file = os.path.join(run_root, f"merged_products_final_{run_ts}.csv")
+        final_sellers_file = os.path.join(run_root, f"merged_sellers_final_{run_ts}.csv")
+        final_product_rows, final_seller_rows = store.export_csv(
+            final_products_file, final_sellers_file, PRODUCT_FINAL_COLUMNS, SELLER_FINAL_COLUMNS
+        )
+        remaining_file, remaining_rows = store.export_remaining(
+            os.path.join(run_root, f"gshopping_remaining_final_{run_ts}.csv")
+        )
+
+        for path, rows in ((final_products_file, final_product_rows), (final_sellers_file, final_seller_rows), (remaining_file, remaining_rows)):
+            if path and rows:
+                upload_to_ftp(ftp_host, ftp_user, ftp_pass, ftp_path, path, os.path.basename(path))
+
+        print("\nFinal merge summary:")
+        print(f"Final products: {final_product_rows} rows")
+        print(f"Final sellers:  {final_seller_rows} rows")
+        print(f"Remaining:      {remaining_rows} rows")
+        print(f"Output root:    {run_root}")
+
+        return bool(final_product_rows or final_seller_rows) and not any_session_failed
+    finally:
+        store.close()
+
 def main():
     parser = argparse.ArgumentParser(description='Google Shopping Scraper with Captcha Solving')
     parser.add_argument('--chunk-id', type=int, default=1, help='Chunk ID (1-based)')
@@ -1710,6 +1924,7 @@ def main():
     parser.add_argument('--input-file', type=str, required=True, help='Input CSV filename on FTP')
     parser.add_argument('--recursive', action='store_true', help='Run recursive chunk processing until remaining is empty')
     parser.add_argument('--max-rounds', type=int, default=10, help='Maximum recursive rounds')
+    parser.add_argument('--work-store', type=str, default=os.getenv('GS_WORK_STORE'), help='SQLite work-queue file; runs rounds as claim/complete/retry state changes and resumes from it')
     
     args = parser.parse_args()
     
@@ -1718,6 +1933,8 @@ def main():
     print(f"Chunk: {args.chunk_id} of {args.total_chunks}")
     print(f"Input file: {args.input_file}")
     print(f"Recursive mode: {'Yes' if args.recursive else 'No'}")
+    if args.work_store:
+        print(f"Work store: {args.work_store}")
     print("=" * 60)
     
 
@@ -1743,7 +1960,18 @@ def main():
             print("Failed to download input CSV")
             sys.exit(1)
     
-    if args.recursive:
+    if args.work_store:
+        success = run_store_pipeline(
+            input_csv=input_csv,
+            store_path=args.work_store,
+            total_chunks=args.total_chunks,
+            ftp_host=ftp_host,
+            ftp_user=ftp_user,
+            ftp_pass=ftp_pass,
+            ftp_path=ftp_path,
+            max_rounds=max(1, args.max_rounds),
+        )
+    elif args.recursive:
         success = run_recursive_pipeline(
             input_csv=input_csv,
             total_chunks=args.total_chunks,
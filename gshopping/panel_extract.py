@@ -0,0 +1,488 @@
+"""
+Single-round-trip extraction for Google Shopping product panels.
+
+Instead of issuing dozens of find_element/.text WebDriver calls per product, one
+injected script walks the panel with the same XPath/CSS selectors the scrapers use
+and returns a raw JSON payload. Everything after that (regexes, price parsing, stock
+and coupon detection) runs in Python on the payload, so the same post-processing can
+be replayed against saved HTML offline.
+
+Fixtures: capture_fixture() saves the rendered panel (scripts stripped), the share
+URL, the raw payload and the parsed panel under <fixture_dir>/<product_id>/.
+fixture_url() gives the file:// URL of a saved page so a headless browser can load
+it and run the exact same extraction code without touching Google.
+"""
+import json
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Clicks "More details" in the About section when it is collapsed; returns true if clicked
+EXPAND_DETAILS_JS = r"""
+const about = document.evaluate("//div[@jsname='HhYL2b']", document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!about) return false;
+const btn = document.evaluate(".//div[@role='button' and contains(., 'More details')]", about, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!btn) return false;
+const expanded = btn.getAttribute('aria-expanded');
+if (expanded === 'false' || !expanded) {
+    btn.scrollIntoView({block: 'center'});
+    btn.click();
+    return true;
+}
+return false;
+"""
+
+ATTRIBUTE_ROW_COUNT_JS = r"""
+const about = document.evaluate("//div[@jsname='HhYL2b']", document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!about) return 0;
+return document.evaluate(".//div[@role='row' and contains(@class,'YU1Fsb')]", about, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength;
+"""
+
+PANEL_EXTRACT_JS = r"""
+const X = (p, ctx) => document.evaluate(p, ctx || document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const XA = (p, ctx) => {
+    const r = document.evaluate(p, ctx || document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const out = [];
+    for (let i = 0; i < r.snapshotLength; i++) out.push(r.snapshotItem(i));
+    return out;
+};
+const T = el => el ? (el.innerText || '').trim() : null;
+const TC = el => el ? (el.textContent || '').trim() : null;
+const firstSrc = img => {
+    let s = img.getAttribute('srcset');
+    if (s) s = s.split(',')[0].trim().split(' ')[0];
+    if (!s) s = img.getAttribute('src');
+    return s || '';
+};
+const LIMIT = 50;
+
+const payload = {
+    has_options: XA("//div[contains(@class,'iI1aN')]//div[@class='EDblX kjqWgb']").length > 0,
+    options: {swatches: [], dropdowns: []},
+    about: null,
+    offers_grid: false,
+    offers: [],
+};
+
+// Variant options
+const panel = X("//div[@jsname='Ql2bfc']") || X("//div[@jsname='jzfSje']");
+if (payload.has_options && panel) {
+    for (const group of XA(".//div[@jsname='iaBacd']", panel)) {
+        const title = T(X(".//span[@class='ZMOBjc']", group));
+        const labels = XA(".//a[@jsname='dbgGYd']", group).map(a => a.getAttribute('data-label')).filter(Boolean);
+        payload.options.swatches.push({title: title, options: labels});
+    }
+    for (const group of XA(".//div[@data-attrid='variant_picker_chip']", panel)) {
+        const title = TC(X(".//div[contains(@class, 'PQev6c')]", group));
+        let items = XA(".//g-menu/g-menu-item", group).map(i => TC(X(".//span", i)));
+        if (!items.length) {
+            items = XA(".//g-popup//div[@role='menuitemradio']", group).map(i => TC(X(".//div[@class='PQev6c']", i)));
+        }
+        payload.options.dropdowns.push({title: title, options: items.filter(Boolean)});
+    }
+}
+
+// About this product
+const about = X("//div[@jsname='HhYL2b']") || X("//h3[contains(text(),'About this product')]/ancestor::div[1]");
+if (about) {
+    const info = {description: T(X(".//div[@jsname='yKDmZd']", about)) || '', attributes: []};
+    for (const row of XA(".//div[@role='row' and contains(@class,'YU1Fsb')]", about)) {
+        info.attributes.push([T(X(".//div[contains(@class,'TCzUld')]", row)), T(X(".//div[contains(@class,'uAwmIf')]//div", row))]);
+    }
+
+    info.main_image = '';
+    for (const sel of arguments[0]) {
+        const img = X(sel);
+        if (!img) continue;
+        const src = firstSrc(img);
+        if (src && !src.startsWith('data:')) { info.main_image = src; break; }
+    }
+    info.panel_images = XA("//div[@jsname='HhYL2b']//img | //div[@jsname='SAt90e']//img | //div[contains(@class, 'm8U2Z')]//img | //div[@class='DqsAAd']//img")
+        .map(img => ({src: img.getAttribute('src') || '', width: img.getAttribute('width'), height: img.getAttribute('height')}));
+    info.gallery = XA("//div[@jsname='HhYL2b']//img | //div[@jsname='SAt90e']//img | //div[contains(@class, 'm8U2Z')]//img | //div[@class='DqsAAd']//img | //div[contains(@class, 'FLY67')]//img | //div[contains(@class, 'sh-div__image-container')]//img | //img[@class='KfAt4d'] | //img[contains(@class, 'r429ob')]")
+        .map(img => ({src: firstSrc(img), width: img.getAttribute('width'), height: img.getAttribute('height')}));
+    info.data_src = XA("//div[contains(@class, 'Asw3Oe')] | //*[@data-src]").map(el => el.getAttribute('data-src')).filter(Boolean);
+
+    const ratingEls = XA("//*[contains(@aria-label, 'out of 5')]").slice(0, LIMIT);
+    info.rating_labels = ratingEls.map(el => el.getAttribute('aria-label') || '');
+    info.rating_parent_texts = ratingEls.map(el => el.parentElement ? (el.parentElement.innerText || '') : '');
+    info.review_texts = XA("//a[contains(text(), 'reviews') or contains(text(), 'ratings')] | //span[contains(text(), 'reviews') or contains(text(), 'ratings')]")
+        .slice(0, LIMIT).map(el => el.innerText || '');
+    info.typical_texts = XA("//*[contains(text(), 'Typical price') or contains(text(), 'Typical range') or contains(text(), 'typical price') or contains(text(), 'typical range')]")
+        .slice(0, LIMIT).map(el => el.innerText || '');
+    info.typical_lines = (document.body.innerText || '').split('\n').filter(l => l.toLowerCase().includes('typical') && l.includes('$'));
+    const pop = X("//a[contains(@href, 'popular') or contains(text(), 'Popular') or contains(text(), 'popular')]");
+    info.popular_url = pop ? (pop.href || '') : '';
+    payload.about = info;
+}
+
+// Offers grid
+const grid = X("//div[@jsname='RSFNod' and @data-attrid='organic_offers_grid']");
+if (grid) {
+    payload.offers_grid = true;
+    for (const row of grid.querySelectorAll('.R5K7Cb')) {
+        const q = sel => row.querySelector(sel);
+        const link = q('a.P9159d');
+        const price = q("div.QcEgce span[aria-hidden='true']") || q('div.GBgquf span');
+        const oldPrice = q("div.AoPnCe span[aria-hidden='true']") || q('div.AoPnCe') || X(".//span[contains(@aria-label, 'Old price')]", row);
+        const ratedEl = X(".//span[contains(@aria-label, 'Rated')]", row);
+        payload.offers.push({
+            store_name: T(q('div.hP4iBf.gUf0b.uWvFpd')),
+            seller_product_name: T(q('div.Rp8BL')),
+            seller_url: link ? link.href : null,
+            price_text: T(price),
+            original_price_text: T(oldPrice),
+            rating_text: T(q('span.NFq8Ad')),
+            rating_aria: ratedEl ? ratedEl.getAttribute('aria-label') : null,
+            delivery_texts: XA(".//span[contains(@aria-label, 'delivery') or contains(@aria-label, 'Delivery') or contains(text(), 'delivery') or contains(text(), 'Delivery') or contains(text(), 'shipping') or contains(text(), 'Shipping')]", row)
+                .map(el => el.getAttribute('aria-label') || el.innerText || ''),
+            row_text: row.innerText || '',
+        });
+    }
+}
+return payload;
+"""
+
+CARD_META_JS = r"""
+const X = (p, ctx) => document.evaluate(p, ctx, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+return arguments[0].map(card => {
+    const name = X(".//div[contains(@class,'gkQHve')]", card);
+    const seller = X(".//span[contains(@class,'WJMUdc')]", card);
+    return {
+        product_name: name ? (name.innerText || '') : '',
+        seller: seller ? (seller.innerText || '') : '',
+        cid: card.getAttribute('id') || '',
+    };
+});
+"""
+
+MAIN_IMAGE_SELECTORS = [
+    "//img[@class='KfAt4d']",
+    "//div[@class='DqsAAd']//img",
+    "//div[@jsname='figiqf']//img",
+    "//div[@jsname='SAt90e']//img",
+    "//div[contains(@class,'m8U2Z')]//img",
+    "//div[@class='hB4fJb']//img",
+    "//img[contains(@class,'sh-div__image')]",
+    "//div[@class='L8S89c']//img",
+    "//div[@class='B08B9']//img",
+    "//div[contains(@class,'sh-div__image-container')]//img",
+    "//div[@id='sh-div__image-container']//img",
+    "//img[@id='sh-div__main-image']",
+    "//img[contains(@class, 'r429ob')]",
+    "//div[contains(@class, 'FLY67')]//img",
+    "//div[contains(@class, 'sh-ds__image-container')]//img",
+]
+
+GOOGLE_IMAGE_HOSTS = ['gstatic.com', 'googleusercontent.com', 'google.com']
+TYPICAL_RANGE_RE = re.compile(r"\$\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*[-–—]\s*\$\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)")
+
+
+def parse_price(price_str):
+    try:
+        val = re.sub(r'[^\d.]', '', str(price_str))
+        if val: return float(val)
+        return None
+    except: return None
+
+
+def _int_or_zero(val):
+    try:
+        return int(val or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def fetch_panel_payload(driver, expand_wait=2.0):
+    """Expand 'More details' if needed, then pull the whole panel in one execute_script call."""
+    if driver.execute_script(EXPAND_DETAILS_JS):
+        # Wait for the attribute rows to settle instead of a fixed sleep
+        deadline = time.monotonic() + expand_wait
+        last_count = -1
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            count = driver.execute_script(ATTRIBUTE_ROW_COUNT_JS)
+            if count and count == last_count:
+                break
+            last_count = count
+    return driver.execute_script(PANEL_EXTRACT_JS, MAIN_IMAGE_SELECTORS)
+
+
+def build_options(payload):
+    scraped_data = {}
+    options = (payload or {}).get('options') or {}
+    for group in options.get('swatches', []):
+        title = group.get('title')
+        values = group.get('options') or []
+        if title and values:
+            scraped_data[title] = list(dict.fromkeys(values))
+    for group in options.get('dropdowns', []):
+        title_text = (group.get('title') or '').strip()
+        title = title_text.split(":")[0].strip() if ":" in title_text else title_text
+        values = [v.strip() for v in group.get('options') or [] if v and v.strip()]
+        if title and values:
+            scraped_data[title] = list(dict.fromkeys(values))
+    return scraped_data
+
+
+def build_about_info(payload):
+    """Turn the raw About-section payload into the dict get_product_about_info returns."""
+    product_info = {
+        'description': '',
+        'attributes': {},
+        'main_image': '',
+        'gs_images': [],
+        'rating_star': None,
+        'rating_count': None,
+        'typical_price_low': None,
+        'typical_price_high': None,
+        'popular_url': ''
+    }
+    about = (payload or {}).get('about')
+    if not about:
+        return product_info
+
+    product_info['description'] = about.get('description') or ''
+    for name, value in about.get('attributes') or []:
+        if name and value:
+            product_info['attributes'][name] = value
+
+    main_image = about.get('main_image') or ''
+    if not main_image:
+        max_area = 0
+        for img in about.get('panel_images') or []:
+            src = img.get('src') or ''
+            if not src or src.startswith('data:'):
+                continue
+            w, h = _int_or_zero(img.get('width')), _int_or_zero(img.get('height'))
+            if w * h > max_area and w > 100:
+                max_area = w * h
+                main_image = src
+    product_info['main_image'] = main_image
+
+    gallery_images = []
+    for img in about.get('gallery') or []:
+        src = img.get('src') or ''
+        if not src or src.startswith('data:') or src in gallery_images:
+            continue
+        w, h = _int_or_zero(img.get('width')), _int_or_zero(img.get('height'))
+        if w > 0 and h > 0 and (w < 40 or h < 40):
+            continue
+        if any(pattern in src for pattern in GOOGLE_IMAGE_HOSTS):
+            gallery_images.append(src)
+    for src in about.get('data_src') or []:
+        if src and not src.startswith('data:') and src not in gallery_images:
+            if any(pattern in src for pattern in GOOGLE_IMAGE_HOSTS):
+                gallery_images.append(src)
+    product_info['gs_images'] = gallery_images
+
+    rating_star = None
+    rating_count = None
+    for label in about.get('rating_labels') or []:
+        match = re.search(r"([0-9.]+)\s*out of 5", label or '')
+        if match:
+            rating_star = float(match.group(1))
+            match_count = re.search(r"([\d,]+)\s*(?:user\s*)?reviews", label, re.IGNORECASE)
+            if match_count:
+                rating_count = int(match_count.group(1).replace(",", ""))
+            break
+    for text in about.get('review_texts') or []:
+        match = re.search(r"(\d{1,3}(?:,\d{3})*)\s*(?:product\s*)?(?:reviews|ratings)", text or '', re.IGNORECASE)
+        if match and rating_count is None:
+            rating_count = int(match.group(1).replace(",", ""))
+            break
+    if not rating_count:
+        for text in about.get('rating_parent_texts') or []:
+            match = re.search(r"\(\s*(\d{1,3}(?:,\d{3})*)\s*\)", text or '')
+            if match:
+                rating_count = int(match.group(1).replace(",", ""))
+                break
+    product_info['rating_star'] = rating_star
+    product_info['rating_count'] = rating_count
+
+    for text in (about.get('typical_texts') or []) + (about.get('typical_lines') or []):
+        match = TYPICAL_RANGE_RE.search(text or '')
+        if match:
+            product_info['typical_price_low'] = float(match.group(1).replace(",", ""))
+            product_info['typical_price_high'] = float(match.group(2).replace(",", ""))
+            break
+
+    product_info['popular_url'] = about.get('popular_url') or ''
+    return product_info
+
+
+def build_offer(raw, product_id, google_position):
+    """Post-process one raw offer row into the competitor dict written to CSV/Postgres."""
+    store_name = raw.get('store_name')
+    store_name = store_name.strip() if store_name is not None else "N/A"
+    seller_product_name = raw.get('seller_product_name')
+    seller_product_name = seller_product_name.strip() if seller_product_name is not None else "N/A"
+    seller_url = raw.get('seller_url') or "N/A"
+    seller_price = raw.get('price_text')
+    seller_price = seller_price.strip() if seller_price is not None else "N/A"
+
+    row_full_text = raw.get('row_text') or ''
+    row_text = row_full_text.lower()
+    if "out of stock" in row_text:
+        stock_status = "Out of Stock"
+    elif "in stock" in row_text:
+        stock_status = "In Stock"
+    else:
+        stock_status = "In Stock"  # Default stock status
+
+    original_price = parse_price(raw['original_price_text']) if raw.get('original_price_text') is not None else None
+
+    discount_amount = None
+    if original_price is not None:
+        parsed_price = parse_price(seller_price)
+        if parsed_price is not None:
+            discount_amount = original_price - parsed_price
+
+    seller_rating = None
+    rating_text = raw.get('rating_text')
+    if rating_text is not None:
+        rating_text = rating_text.strip()
+        seller_rating = parse_price(rating_text.split("/")[0] if "/" in rating_text else rating_text)
+    elif raw.get('rating_aria'):
+        match = re.search(r"Rated\s+([\d.]+)", raw['rating_aria'])
+        if match:
+            seller_rating = float(match.group(1))
+
+    delivery_tagline = ""
+    for text_val in raw.get('delivery_texts') or []:
+        text_val = (text_val or '').strip().replace("·", "").strip()
+        if text_val:
+            delivery_tagline = text_val
+            break
+
+    coupon_code = ""
+    coupon_remark = ""
+    code_match = re.search(r'(?:use\s+|with\s+)?code[:\s]+([A-Z0-9_-]{3,})', row_full_text, re.IGNORECASE)
+    if code_match:
+        coupon_code = code_match.group(1)
+    remark_match = re.search(r'([\d%]+\s+off\s+with\s+code\s+[A-Z0-9_-]+|save\s+[\$\d.]+\s+with\s+code\s+[A-Z0-9_-]+|[\d%]+\s+coupon)', row_full_text, re.IGNORECASE)
+    if remark_match:
+        coupon_remark = remark_match.group(1)
+
+    return {
+        'product_id': product_id,
+        'seller': store_name,
+        'seller_product_name': seller_product_name,
+        'seller_url': seller_url,
+        'seller_price': seller_price,
+        'original_price': original_price,
+        'discount_amount': discount_amount,
+        'coupon_code': coupon_code,
+        'coupon_remark': coupon_remark,
+        'stock_status': stock_status,
+        'seller_rating': seller_rating,
+        'delivery_tagline': delivery_tagline,
+        'google_position': google_position,
+        'last_fetched_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def build_panel(payload, product_id):
+    """Structured panel: options, about info and offers, all derived from one payload."""
+    return {
+        'has_options': bool(payload.get('has_options')),
+        'options': build_options(payload),
+        'about': build_about_info(payload),
+        'offers_grid': bool(payload.get('offers_grid')),
+        'offers': [build_offer(raw, product_id, idx + 1) for idx, raw in enumerate(payload.get('offers') or [])],
+    }
+
+
+def extract_panel(driver, product_id):
+    started = time.perf_counter()
+    payload = fetch_panel_payload(driver)
+    panel = build_panel(payload, product_id)
+    print(f"✓ Panel extracted in {(time.perf_counter() - started) * 1000:.0f} ms ({len(panel['offers'])} offers, {len(panel['about']['attributes'])} attributes)")
+    return panel
+
+
+def extract_card_metas(driver, cards):
+    """product_name/seller/cid for every search result card in one round trip."""
+    if not cards:
+        return []
+    return driver.execute_script(CARD_META_JS, cards) or []
+
+
+# ---------------- Offline fixtures ----------------
+
+# Static snapshot of the rendered page: inline/external scripts are dropped so the
+# replayed page cannot re-render or navigate away from the captured state.
+SNAPSHOT_HTML_JS = r"""
+const root = document.documentElement.cloneNode(true);
+root.querySelectorAll('script, noscript, iframe, link[rel="preload"], link[rel="prefetch"]').forEach(el => el.remove());
+return '<!DOCTYPE html>\n' + root.outerHTML;
+"""
+
+FIXTURE_HTML = 'panel.html'
+FIXTURE_META = 'meta.json'
+FIXTURE_PAYLOAD = 'payload.json'
+FIXTURE_EXPECTED = 'expected.json'
+
+
+def _safe_fixture_name(product_id):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(product_id)) or 'unknown'
+
+
+def capture_fixture(driver, fixture_dir, product_id, share_url, panel=None):
+    """Save the current product panel so it can be replayed offline; returns the fixture path."""
+    path = os.path.join(fixture_dir, _safe_fixture_name(product_id))
+    os.makedirs(path, exist_ok=True)
+
+    html = driver.execute_script(SNAPSHOT_HTML_JS)
+    payload = driver.execute_script(PANEL_EXTRACT_JS, MAIN_IMAGE_SELECTORS)
+    with open(os.path.join(path, FIXTURE_HTML), 'w', encoding='utf-8') as f:
+        f.write(html or '')
+    with open(os.path.join(path, FIXTURE_PAYLOAD), 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    if panel is None:
+        panel = build_panel(payload or {}, product_id)
+    with open(os.path.join(path, FIXTURE_EXPECTED), 'w', encoding='utf-8') as f:
+        json.dump(panel, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(path, FIXTURE_META), 'w', encoding='utf-8') as f:
+        json.dump({
+            'product_id': str(product_id),
+            'share_url': share_url or '',
+            'page_url': driver.current_url,
+            'captured_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, indent=2)
+    return path
+
+
+def iter_fixtures(fixture_dir):
+    """Yield (name, meta) for every captured fixture, sorted by directory name."""
+    if not os.path.isdir(fixture_dir):
+        return
+    for name in sorted(os.listdir(fixture_dir)):
+        meta_path = os.path.join(fixture_dir, name, FIXTURE_META)
+        if not os.path.isfile(meta_path):
+            continue
+        with open(meta_path, encoding='utf-8') as f:
+            yield name, json.load(f)
+
+
+def load_fixture_json(fixture_dir, name, filename):
+    path = os.path.join(fixture_dir, name, filename)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def comparable_panel(panel):
+    """Panel without per-run fields, for comparing a replay against the captured result."""
+    panel = json.loads(json.dumps(panel))
+    for offer in panel.get('offers', []):
+        offer.pop('last_fetched_date', None)
+    return panel
+
+
+def fixture_url(fixture_dir, name):
+    """file:// URL of a fixture's saved panel HTML."""
+    return Path(os.path.abspath(os.path.join(fixture_dir, name, FIXTURE_HTML))).as_uri()
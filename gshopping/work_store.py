@@ -0,0 +1,234 @@
+"""
+SQLite-backed work queue for the CSV-driven Google Shopping scrapers.
+
+Each input row is one item that moves through pending -> claimed -> done, or
+claimed -> retry -> pending (next round) until it runs out of attempts and becomes
+failed. Scraped product/seller rows are kept in the same database, so a round is a
+handful of UPDATEs instead of rewriting and re-splitting remaining CSVs, and a
+killed run picks up where it stopped: claimed items go back to pending on open.
+The store belongs to one input: loading a different input file resets it.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+RETRY = 'retry'
+FAILED = 'failed'
+
+INPUT_HASH_KEY = 'input_hash'
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS items (
+        product_id TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        row_json TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        round INTEGER NOT NULL DEFAULT 0,
+        claimed_by TEXT,
+        claimed_at TEXT,
+        last_response TEXT,
+        updated_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_items_state_seq ON items (state, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS results (
+        product_id TEXT PRIMARY KEY,
+        round INTEGER NOT NULL,
+        product_json TEXT NOT NULL,
+        sellers_json TEXT NOT NULL
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WorkStore:
+    """Claim/complete/retry queue of input rows persisted in one SQLite file."""
+
+    def __init__(self, path, max_attempts=10):
+        self.path = path
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for ddl in SCHEMA:
+            self._conn.execute(ddl)
+        recovered = self._conn.execute(
+            "UPDATE items SET state = ?, claimed_by = NULL, claimed_at = NULL WHERE state = ?",
+            (PENDING, CLAIMED),
+        ).rowcount
+        if recovered:
+            print(f"✓ Work store: {recovered} items claimed by an interrupted run returned to pending")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._write("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    def load(self, df):
+        """
+        Add every input row as a pending item; returns (added, reset).
+
+        The store is keyed by a hash of the input rows. Loading the same input again
+        resumes it (rows already in the store are left as they are); any other input
+        first clears items, results and meta, including the round counter. Rows repeating
+        an earlier product_id of the same input are skipped and counted.
+        """
+        rows = []
+        for seq, record in enumerate(df.to_dict(orient='records')):
+            product_id = str(record.get('product_id', '')).strip()
+            if not product_id:
+                continue
+            clean = {k: ('' if v is None or (isinstance(v, float) and v != v) else v) for k, v in record.items()}
+            rows.append((product_id, seq, json.dumps(clean, default=str), _now()))
+        digest = hashlib.sha256()
+        for product_id, _, row_json, _ in rows:
+            digest.update(product_id.encode('utf-8') + b'\0' + row_json.encode('utf-8') + b'\n')
+        input_hash = digest.hexdigest()
+        duplicates = len(rows) - len({product_id for product_id, _, _, _ in rows})
+        if duplicates:
+            print(f"Warning: Work store skipped {duplicates} input rows repeating an earlier product_id")
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            stored = self._conn.execute("SELECT value FROM meta WHERE key = ?", (INPUT_HASH_KEY,)).fetchone()
+            has_items = self._conn.execute("SELECT 1 FROM items LIMIT 1").fetchone() is not None
+            reset = (stored[0] if stored else None) != input_hash and (stored is not None or has_items)
+            if reset:
+                for table in ('items', 'results', 'meta'):
+                    self._conn.execute(f"DELETE FROM {table}")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (product_id, seq, row_json, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (INPUT_HASH_KEY, input_hash),
+            )
+            self._conn.execute("COMMIT")
+        return added, reset
+
+    def claim(self, worker_id, limit=1):
+        """Atomically move up to `limit` pending items to claimed; returns their input rows."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            picked = self._conn.execute(
+                "SELECT product_id, row_json FROM items WHERE state = ? ORDER BY seq LIMIT ?",
+                (PENDING, int(limit)),
+            ).fetchall()
+            if picked:
+                self._conn.executemany(
+                    "UPDATE items SET state = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1, updated_at = ? WHERE product_id = ?",
+                    [(CLAIMED, worker_id, _now(), _now(), pid) for pid, _ in picked],
+                )
+            self._conn.execute("COMMIT")
+        return [json.loads(row_json) for _, row_json in picked]
+
+    def complete(self, product_id, round_id, product_row, seller_rows):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO results (product_id, round, product_json, sellers_json) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(product_id) DO UPDATE SET round = excluded.round, product_json = excluded.product_json, sellers_json = excluded.sellers_json",
+                (str(product_id), int(round_id), json.dumps(product_row, default=str), json.dumps(seller_rows, default=str)),
+            )
+            self._conn.execute(
+                "UPDATE items SET state = ?, round = ?, claimed_by = NULL, claimed_at = NULL, last_response = ?, updated_at = ? WHERE product_id = ?",
+                (DONE, int(round_id), product_row.get('last_response', ''), _now(), str(product_id)),
+            )
+            self._conn.execute("COMMIT")
+
+    def retry(self, product_id, round_id, reason='', count_attempt=True):
+        """Park an item for the next round, or mark it failed once it is out of attempts."""
+        self._write(
+            """
+            UPDATE items
+            SET state = CASE WHEN ? AND attempts >= ? THEN ? ELSE ? END,
+                attempts = CASE WHEN ? THEN attempts ELSE MAX(attempts - 1, 0) END,
+                round = ?, claimed_by = NULL, claimed_at = NULL, last_response = ?, updated_at = ?
+            WHERE product_id = ?
+            """,
+            (1 if count_attempt else 0, self.max_attempts, FAILED, RETRY, 1 if count_attempt else 0, int(round_id), str(reason)[:500], _now(), str(product_id)),
+        )
+
+    def release(self, worker_id):
+        """Hand back items a worker claimed but never finished, without spending an attempt."""
+        return self._write(
+            "UPDATE items SET state = ?, attempts = MAX(attempts - 1, 0), claimed_by = NULL, claimed_at = NULL, updated_at = ? "
+            "WHERE state = ? AND claimed_by = ?",
+            (RETRY, _now(), CLAIMED, worker_id),
+        )
+
+    def start_round(self):
+        """Move every retry item back to pending; returns how many items the round has."""
+        self._write("UPDATE items SET state = ? WHERE state = ?", (PENDING, RETRY))
+        return self.counts().get(PENDING, 0)
+
+    def counts(self):
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def export_csv(self, products_path, sellers_path, product_columns, seller_columns):
+        """Write every stored result to the two output CSVs; returns (product_rows, seller_rows)."""
+        product_rows = 0
+        seller_rows = 0
+        cursor = self._conn.execute("SELECT product_json, sellers_json FROM results ORDER BY product_id")
+        with open(products_path, 'w', newline='', encoding='utf-8') as pf, \
+                open(sellers_path, 'w', newline='', encoding='utf-8') as sf:
+            product_writer = csv.DictWriter(pf, fieldnames=product_columns, extrasaction='ignore')
+            seller_writer = csv.DictWriter(sf, fieldnames=seller_columns, extrasaction='ignore')
+            product_writer.writeheader()
+            seller_writer.writeheader()
+            for product_json, sellers_json in cursor:
+                product_writer.writerow(json.loads(product_json))
+                product_rows += 1
+                for seller in json.loads(sellers_json):
+                    seller_writer.writerow(seller)
+                    seller_rows += 1
+        return product_rows, seller_rows
+
+    def export_remaining(self, path, states=(RETRY, FAILED, PENDING)):
+        """Write the input rows of unfinished items (same layout as the old remaining CSVs)."""
+        placeholders = ", ".join("?" * len(states))
+        rows = [
+            json.loads(r[0]) for r in self._conn.execute(
+                f"SELECT row_json FROM items WHERE state IN ({placeholders}) ORDER BY seq", tuple(states)
+            )
+        ]
+        if not rows:
+            return None, 0
+        fieldnames = list(rows[0].keys())
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        return path, len(rows)
@@ -0,0 +1,158 @@
+"""
+insert_to_postgres against a real PostgreSQL server.
+
+Runs only when GS_TEST_PG_DB names a database the PG_HOST / PG_PORT / PG_USER / PG_PASS
+credentials can create schemas in, e.g.
+
+    GS_TEST_PG_DB=gs_test PG_HOST=127.0.0.1 PG_USER=postgres PG_PASS=... python -m pytest tests
+
+Every test works in a throwaway schema (search_path via PGOPTIONS, like
+benchmarks/gshopping_db_write.py) that is dropped afterwards.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+pytest.importorskip("pandas")
+
+TEST_DB = os.environ.get("GS_TEST_PG_DB")
+pytestmark = pytest.mark.skipif(not TEST_DB, reason="GS_TEST_PG_DB is not set")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gshopping"))
+
+SCHEMA_DDL = """
+CREATE TABLE osb_products (
+    product_id bigint PRIMARY KEY, status integer DEFAULT 1, name text,
+    scraping_status text DEFAULT 'claimed', last_attempt timestamp, error_message text,
+    claimed_by text, claimed_at timestamp
+);
+CREATE TABLE competitors (competitor_id serial PRIMARY KEY, competitor_name text UNIQUE NOT NULL, base_url text);
+CREATE TABLE google_shopping_results (
+    product_id bigint PRIMARY KEY, google_title text, google_description text, gs_main_image text, gs_images jsonb,
+    brand text, color text, width double precision, height double precision, depth double precision, style text,
+    material text, shape text, assembly_required boolean, weight double precision, rating_star double precision,
+    rating_count integer, typical_price_low double precision, typical_price_high double precision,
+    best_price_url text, popular_url text, other_attributes jsonb, last_response text, osb_url_match text,
+    google_seller_page_url text, cid text, pid text, osb_position integer, osb_id text, seller_count integer,
+    status text, scraped_at timestamp, updated_at timestamp, content_hash text
+);
+CREATE TABLE google_shopping_sellers (
+    id serial PRIMARY KEY, product_id integer NOT NULL, competitor_id integer NOT NULL, seller_name text,
+    seller_product_name text, seller_url text, price numeric, original_price numeric, discount_amount numeric,
+    coupon_code text, coupon_remark text, stock_status text, seller_rating numeric, delivery_tagline text,
+    google_position integer, site_display text, is_me boolean, scraped_at timestamp DEFAULT now()
+);
+CREATE UNIQUE INDEX uq_gs_sellers ON google_shopping_sellers (product_id, competitor_id, (md5(seller_url)));
+INSERT INTO osb_products (product_id) VALUES (1001), (1002);
+"""
+
+
+def _connect():
+    return psycopg2.connect(
+        host=os.environ.get("PG_HOST", "127.0.0.1"),
+        port=os.environ.get("PG_PORT", "5432"),
+        user=os.environ.get("PG_USER"),
+        password=os.environ.get("PG_PASS"),
+        dbname=TEST_DB,
+    )
+
+
+@pytest.fixture
+def gscraper(monkeypatch):
+    schema = f"gs_test_{uuid.uuid4().hex[:8]}"
+    conn = _connect()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}")
+        cursor.execute(SCHEMA_DDL)
+
+    monkeypatch.setenv("PG_DB", TEST_DB)
+    monkeypatch.setenv("PGOPTIONS", f"-c search_path={schema}")
+    import gscraper_pg
+    # Module-level pool and schema probes must not leak between schemas
+    for name in ("_PG_POOL", "_CONTENT_HASH_SUPPORT", "_SUMMARY_TABLE_SUPPORT", "_CLAIM_COLUMN_SUPPORT"):
+        monkeypatch.setattr(gscraper_pg, name, None)
+
+    yield gscraper_pg, conn, schema
+
+    if gscraper_pg._PG_POOL is not None:
+        gscraper_pg._PG_POOL.closeall()
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.close()
+
+
+def _batch(price=101.0):
+    products = [
+        {
+            "product_id": str(pid),
+            "google_title": f"Test product {pid}",
+            "product_url": f"https://www.google.com/search?ibp=oshop&q=test{pid}",
+            "seller_count": 2,
+            "status": "completed",
+        }
+        for pid in (1001, 1002)
+    ]
+    sellers = [
+        {
+            "product_id": str(pid),
+            "seller": f"Seller {pos}",
+            "seller_url": f"https://seller{pos}.example.com/p/{pid}",
+            "seller_price": f"${price + pos:.2f}",
+            "google_position": pos,
+        }
+        for pid in (1001, 1002)
+        for pos in (1, 2)
+    ]
+    return products, sellers
+
+
+@pytest.mark.parametrize("write_mode", ["copy", "values"])
+def test_unchanged_batch_is_skipped_and_touched(gscraper, monkeypatch, capsys, write_mode):
+    gscraper_pg, conn, _ = gscraper
+    monkeypatch.setenv("DB_WRITE_MODE", write_mode)
+
+    gscraper_pg.insert_to_postgres(*_batch())
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE google_shopping_results SET updated_at = updated_at - interval '1 day'")
+        cursor.execute("SELECT product_id, updated_at FROM google_shopping_results ORDER BY product_id")
+        before = dict(cursor.fetchall())
+        cursor.execute("SELECT max(id) FROM google_shopping_sellers")
+        last_seller_id = cursor.fetchone()[0]
+        cursor.execute("UPDATE osb_products SET scraping_status = 'claimed'")
+
+    # Same content again: both products hit the stored-hash lookup and are only touched
+    gscraper_pg.insert_to_postgres(*_batch())
+    out = capsys.readouterr().out
+    assert "Error inserting into PostgreSQL" not in out
+    assert "2 skipped (content unchanged)" in out or "2 products skipped (content unchanged)" in out
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT product_id, updated_at, content_hash FROM google_shopping_results ORDER BY product_id")
+        rows = cursor.fetchall()
+        cursor.execute("SELECT count(*), max(id) FROM google_shopping_sellers")
+        seller_count, max_seller_id = cursor.fetchone()
+        cursor.execute("SELECT DISTINCT scraping_status FROM osb_products")
+        statuses = [r[0] for r in cursor.fetchall()]
+    assert [r[0] for r in rows] == [1001, 1002]
+    assert all(updated_at > before[pid] for pid, updated_at, _ in rows)
+    assert all(content_hash for _, _, content_hash in rows)
+    assert (seller_count, max_seller_id) == (4, last_seller_id)
+    assert statuses == ["completed"]
+
+
+def test_changed_offer_is_rewritten(gscraper, capsys):
+    gscraper_pg, conn, _ = gscraper
+
+    gscraper_pg.insert_to_postgres(*_batch())
+    gscraper_pg.insert_to_postgres(*_batch(price=90.0))
+    out = capsys.readouterr().out
+    assert "Error inserting into PostgreSQL" not in out
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT min(price)::float8 FROM google_shopping_sellers")
+        assert cursor.fetchone()[0] == 91.0